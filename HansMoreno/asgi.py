@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+
+El stream de posiciones en vivo (/api/posiciones/stream/) necesita este
+punto de entrada, p. ej.: uvicorn HansMoreno.asgi:application
+La ingesta GPS y la API v1 son vistas async: aquí cada conexión abierta de
+un rastreador no ocupa un hilo, y la BD se usa solo a través de pool_bd.
 """
 
 import os
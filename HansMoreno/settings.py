@@ -32,6 +32,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'PanelAdmin.metricas.MetricasMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -68,7 +69,8 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
-        'CONN_MAX_AGE': 300,
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 300)),
+        'CONN_HEALTH_CHECKS': True,  # conexión persistente revisada antes de reusarla
         'OPTIONS': {
             'charset': 'utf8mb4',
             'ssl': {
@@ -78,6 +80,13 @@ DATABASES = {
     }
 }
 
+# Base local para benchmarks / pruebas (ver comando generar_flota)
+if os.getenv('DB_LOCAL') == 'sqlite':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv('DB_LOCAL_NOMBRE', os.path.join(BASE_DIR, 'db.sqlite3')),
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',},
@@ -93,4 +102,161 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# --- GPS ---
+GPS_BUFFER_MAX_VEHICULOS = int(os.getenv('GPS_BUFFER_MAX_VEHICULOS', 500))
+GPS_BUFFER_INTERVALO = float(os.getenv('GPS_BUFFER_INTERVALO', 2.0))
+GPS_HISTORIAL_MAX_FIXES = int(os.getenv('GPS_HISTORIAL_MAX_FIXES', 5000))
+GPS_LOTE_MAX_FIXES = int(os.getenv('GPS_LOTE_MAX_FIXES', 5000))
+GPS_TOLERANCIA_FUTURO_S = int(os.getenv('GPS_TOLERANCIA_FUTURO_S', 300))
+GPS_ANTIGUEDAD_MAX_DIAS = int(os.getenv('GPS_ANTIGUEDAD_MAX_DIAS', 30))
+GPS_DUPLICADOS_MEMORIA = int(os.getenv('GPS_DUPLICADOS_MEMORIA', 200_000))  # pares (patente, ts) recordados
+
+# --- HISTORIAL GPS (PanelAdmin/posiciones.py) ---
+POSICIONES_IDS_SEGUNDOS = float(os.getenv('POSICIONES_IDS_SEGUNDOS', 300))              # patente -> id recordado
+POSICIONES_COMPACTAR_INTERVALO = float(os.getenv('POSICIONES_COMPACTAR_INTERVALO', 600))  # unión de tramos de hoy y ayer
+
+# --- DISPOSITIVOS GPS (PanelAdmin/dispositivos.py) ---
+# Cada rastreador necesita su token (`manage.py emitir_token_dispositivo`); sin él /api/gps
+# responde 401. Para migrar una flota que aún no tiene tokens configurados se puede
+# desactivar temporalmente con DISPOSITIVOS_REQUIERE_TOKEN=False: se aceptan pings sin
+# token (límite de tasa por IP) y los que envían token se validan igual.
+DISPOSITIVOS_REQUIERE_TOKEN = os.getenv('DISPOSITIVOS_REQUIERE_TOKEN', 'True') == 'True'
+DISPOSITIVOS_FIXES_POR_SEGUNDO = float(os.getenv('DISPOSITIVOS_FIXES_POR_SEGUNDO', 2))
+DISPOSITIVOS_RAFAGA = int(os.getenv('DISPOSITIVOS_RAFAGA', 600))  # p. ej. 10 minutos a 1 Hz subidos de una vez
+# Con PANEL_CACHE compartido una revocación llega a todos los workers en ~1 s; con 'local'
+# los demás procesos la ven recién al resincronizar (hasta este número de segundos)
+DISPOSITIVOS_RESINCRONIZAR = float(os.getenv('DISPOSITIVOS_RESINCRONIZAR', 60))
+DISPOSITIVOS_MAX_CUBETAS = int(os.getenv('DISPOSITIVOS_MAX_CUBETAS', 50_000))
+
+# --- POOL DE BD DE LAS VISTAS ASYNC (PanelAdmin/pool_bd.py) ---
+# Máximo de conexiones por proceso para la ingesta GPS y la API v1 bajo ASGI
+BD_POOL_CONEXIONES = int(os.getenv('BD_POOL_CONEXIONES', 10))
+BD_POOL_COLA_MAX = int(os.getenv('BD_POOL_COLA_MAX', 2000))  # trabajos esperando; más allá se responde 503
+
+# --- CICLO DE VIAJES DESDE LA APP (PanelAdmin/ciclo_recorridos.py) ---
+# Un envío offline trae todos los eventos pendientes del teléfono; se aplican en una transacción
+RECORRIDOS_LOTE_MAX_EVENTOS = int(os.getenv('RECORRIDOS_LOTE_MAX_EVENTOS', 2000))
+# Eventos que llegaron antes que el INICIO de su viaje: tope por dispositivo y cuánto esperan
+# antes de descartarse (un INICIO que nunca llega no los deja para siempre en EventosRecorrido)
+RECORRIDOS_PENDIENTES_MAX = int(os.getenv('RECORRIDOS_PENDIENTES_MAX', 1000))
+RECORRIDOS_PENDIENTES_HORAS = int(os.getenv('RECORRIDOS_PENDIENTES_HORAS', 7 * 24))
+
+# --- DESPACHO (PanelAdmin/despacho.py) ---
+# Costos en km equivalentes: la asignación minimiza la suma de todos
+DESPACHO_KM_SIN_POSICION = float(os.getenv('DESPACHO_KM_SIN_POSICION', 50))  # conductor o vehículo sin GPS
+DESPACHO_AUTONOMIA_KM = float(os.getenv('DESPACHO_AUTONOMIA_KM', 500))        # km entre cargas de un estanque típico
+DESPACHO_PENALIZACION_COMBUSTIBLE_KM = float(os.getenv('DESPACHO_PENALIZACION_COMBUSTIBLE_KM', 20))
+DESPACHO_BONO_ASIGNACION_ACTUAL_KM = float(os.getenv('DESPACHO_BONO_ASIGNACION_ACTUAL_KM', 2))
+DESPACHO_VENTANA_COMBUSTIBLE_DIAS = int(os.getenv('DESPACHO_VENTANA_COMBUSTIBLE_DIAS', 60))
+DESPACHO_MAX_ENTREGAS = int(os.getenv('DESPACHO_MAX_ENTREGAS', 5000))
+
+# --- ARCHIVO HISTORICO (PanelAdmin/archivo.py) ---
+ARCHIVO_RETENCION_DIAS = int(os.getenv('ARCHIVO_RETENCION_DIAS', 400))  # lo más nuevo queda en las tablas de la app
+ARCHIVO_LOTE = int(os.getenv('ARCHIVO_LOTE', 5000))                      # filas movidas por transacción
+
+# --- DISTANCIA DESDE GPS (PanelAdmin/trayectos.py) ---
+TRAYECTOS_VEL_MAX_KMH = float(os.getenv('TRAYECTOS_VEL_MAX_KMH', 200))       # más rápido que esto es un salto del GPS
+TRAYECTOS_VEL_PARADA_KMH = float(os.getenv('TRAYECTOS_VEL_PARADA_KMH', 3))   # más lento que esto cuenta como detenido
+TRAYECTOS_PARADA_MIN_S = int(os.getenv('TRAYECTOS_PARADA_MIN_S', 120))
+TRAYECTOS_VENTANA_SUAVIZADO = int(os.getenv('TRAYECTOS_VENTANA_SUAVIZADO', 2))  # puntos a cada lado
+TRAYECTOS_CONTEXTO_S = int(os.getenv('TRAYECTOS_CONTEXTO_S', 300))
+TRAYECTOS_INTERVALO = float(os.getenv('TRAYECTOS_INTERVALO', 30))
+
+# --- RENDIMIENTO DE COMBUSTIBLE (PanelAdmin/rendimiento.py) ---
+RENDIMIENTO_VENTANA = int(os.getenv('RENDIMIENTO_VENTANA', 10))            # cargas anteriores en la línea base
+RENDIMIENTO_MIN_MUESTRAS = int(os.getenv('RENDIMIENTO_MIN_MUESTRAS', 3))
+RENDIMIENTO_Z = float(os.getenv('RENDIMIENTO_Z', 2.5))
+RENDIMIENTO_DESV_MIN = float(os.getenv('RENDIMIENTO_DESV_MIN', 0.05))      # piso de la desviación, fracción de la media
+RENDIMIENTO_CONTEXTO_DIAS = int(os.getenv('RENDIMIENTO_CONTEXTO_DIAS', 120))
+RENDIMIENTO_TENDENCIA = int(os.getenv('RENDIMIENTO_TENDENCIA', 12))
+RENDIMIENTO_DIAS_ALERTAS = int(os.getenv('RENDIMIENTO_DIAS_ALERTAS', 90))
+RENDIMIENTO_LOTE_VEHICULOS = int(os.getenv('RENDIMIENTO_LOTE_VEHICULOS', 500))
+
+# --- INDICE ESPACIAL (PanelAdmin/espacial.py) ---
+ESPACIAL_CELDA_GRADOS = float(os.getenv('ESPACIAL_CELDA_GRADOS', 0.01))   # ~1,1 km de lado
+ESPACIAL_RESINCRONIZAR = float(os.getenv('ESPACIAL_RESINCRONIZAR', 60))   # relectura desde la BD (otros procesos)
+ESPACIAL_MAX_RESULTADOS = int(os.getenv('ESPACIAL_MAX_RESULTADOS', 500))
+ESPACIAL_MAX_VERTICES = int(os.getenv('ESPACIAL_MAX_VERTICES', 200))
+
+# --- GEOCERCAS (PanelAdmin/geocercas.py) ---
+GEOCERCAS_CELDA_GRADOS = float(os.getenv('GEOCERCAS_CELDA_GRADOS', 0.05))
+GEOCERCAS_MAX_CELDAS_ZONA = int(os.getenv('GEOCERCAS_MAX_CELDAS_ZONA', 400))  # más grandes se prueban en cada ping
+GEOCERCAS_RESINCRONIZAR = float(os.getenv('GEOCERCAS_RESINCRONIZAR', 60))
+GEOCERCAS_MAX_PENDIENTES = int(os.getenv('GEOCERCAS_MAX_PENDIENTES', 10000))
+GEOCERCAS_AUTOMATIZAR_RECORRIDOS = os.getenv('GEOCERCAS_AUTOMATIZAR_RECORRIDOS', '1') == '1'
+
+# --- TIEMPO REAL (SSE, solo bajo ASGI) ---
+# BrokerLocal solo reparte los fixes del propio proceso; con varios workers de ingesta
+# usar 'PanelAdmin.tiempo_real.BrokerRedis'
+TIEMPO_REAL_BROKER = os.getenv('TIEMPO_REAL_BROKER', 'PanelAdmin.tiempo_real.BrokerLocal')
+TIEMPO_REAL_REDIS_URL = os.getenv('TIEMPO_REAL_REDIS_URL', os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/1'))
+TIEMPO_REAL_MAX_COLA = int(os.getenv('TIEMPO_REAL_MAX_COLA', 100))
+TIEMPO_REAL_KEEPALIVE = float(os.getenv('TIEMPO_REAL_KEEPALIVE', 15))
+
+# --- REPORTES PDF ---
+REPORTES_FILAS_POR_PAGINA = int(os.getenv('REPORTES_FILAS_POR_PAGINA', 50))
+REPORTES_DIR = os.getenv('REPORTES_DIR', os.path.join(BASE_DIR, 'reportes_generados'))
+REPORTES_WORKERS = int(os.getenv('REPORTES_WORKERS', 2))
+REPORTES_FILAS_POR_BLOQUE = int(os.getenv('REPORTES_FILAS_POR_BLOQUE', 500))
+REPORTES_CACHE_SEGUNDOS = int(os.getenv('REPORTES_CACHE_SEGUNDOS', 600))
+# Un PDF pendiente o en proceso por más tiempo se marca como ERROR y se vuelve a encolar
+REPORTES_TRABAJO_MAX_SEGUNDOS = int(os.getenv('REPORTES_TRABAJO_MAX_SEGUNDOS', 900))
+REPORTES_RETENCION_DIAS = int(os.getenv('REPORTES_RETENCION_DIAS', 7))  # después se borran el trabajo y su PDF
+EXPORTAR_CHUNK = int(os.getenv('EXPORTAR_CHUNK', 2000))
+
+# --- IMPORTACION CSV ---
+IMPORTAR_LOTE = int(os.getenv('IMPORTAR_LOTE', 1000))
+
+# --- CREDENCIALES (PIN de conductores) ---
+# Costo de PBKDF2 solo para los PIN (PanelAdmin.hashers.PBKDF2Configurable); las claves de los
+# usuarios del panel usan el hasher por defecto de Django. Se elige con `manage.py benchmark --solo pin`;
+# vacío = valor por defecto de Django
+CREDENCIALES_ITERACIONES = int(os.getenv('CREDENCIALES_ITERACIONES', 0)) or None
+CREDENCIALES_HILOS = int(os.getenv('CREDENCIALES_HILOS', 2))
+CREDENCIALES_COLA_MAX = int(os.getenv('CREDENCIALES_COLA_MAX', 200))
+CREDENCIALES_POR_MINUTO = int(os.getenv('CREDENCIALES_POR_MINUTO', 30))
+
+# --- BUSQUEDA (PanelAdmin/busqueda.py) ---
+# Cada cuánto se buscan usuarios y vehículos de la app externa que quedaron sin indexar
+BUSQUEDA_CONCILIAR_SEGUNDOS = int(os.getenv('BUSQUEDA_CONCILIAR_SEGUNDOS', 300))
+
+# --- ADMIN ---
+ADMIN_CONTEO_MAX = int(os.getenv('ADMIN_CONTEO_MAX', 100_000))  # los listados cuentan hasta aquí, no la tabla entera
+
+# --- METRICAS ---
+METRICAS_MUESTRAS = int(os.getenv('METRICAS_MUESTRAS', 500))
+METRICAS_PRESUPUESTO_ESTRICTO = os.getenv('METRICAS_PRESUPUESTO_ESTRICTO') == 'True'
+
+# --- RESUMENES DIARIOS ---
+# Los últimos días se recalculan solos (escrituras de la app externa sin señales); 0 = desactivado
+RESUMENES_DIAS_CONCILIAR = int(os.getenv('RESUMENES_DIAS_CONCILIAR', 3))
+RESUMENES_CONCILIAR_SEGUNDOS = int(os.getenv('RESUMENES_CONCILIAR_SEGUNDOS', 300))
+
+# --- CACHE DEL PANEL ---
+# Tiene que ser compartido entre workers para que la invalidación por señales
+# llegue a todos: 'archivo' (un solo servidor) o 'redis'. 'local' es por proceso
+# y solo sirve con un único proceso (runserver).
+PANEL_CACHE = os.getenv('PANEL_CACHE', 'archivo')
+PANEL_CACHE_ALIAS = 'panel'
+PANEL_CACHE_TIMEOUT = int(os.getenv('PANEL_CACHE_TIMEOUT', 300))
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'panel': {
+        'local': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'panel'},
+        'archivo': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('PANEL_CACHE_DIR', os.path.join(BASE_DIR, '.cache_panel')),
+        },
+        'redis': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+        },
+    }[PANEL_CACHE],
+}
+
+# --- API DE LECTURA (v1) ---
+API_FILAS_POR_PAGINA = int(os.getenv('API_FILAS_POR_PAGINA', 200))
+API_MAX_FILAS = int(os.getenv('API_MAX_FILAS', 1000))
@@ -12,6 +12,20 @@ urlpatterns = [
 
     # --- RUTA API GPS (Ahora sí funcionará porque views.py ya la tiene) ---
     path('api/gps/update/', update_gps_location, name='api_gps_update'),
+    path('api/gps/batch/', update_gps_batch, name='api_gps_batch'),
+    path('api/vehiculos/<int:id>/trayecto/', api_trayecto_vehiculo, name='api_trayecto_vehiculo'),
+    path('api/recorridos/eventos/', api_eventos_recorrido, name='api_recorridos_eventos'),
+    path('api/recorridos/<int:id>/trayecto/', api_trayecto_recorrido, name='api_trayecto_recorrido'),
+    path('api/posiciones/stream/', stream_posiciones, name='api_posiciones_stream'),
+    path('api/metricas/', api_metricas, name='api_metricas'),
+    path('api/buscar/', api_buscar, name='api_buscar'),
+    path('api/vehiculos/cercanos/', api_vehiculos_cercanos, name='api_vehiculos_cercanos'),
+    path('api/vehiculos/en-zona/', api_vehiculos_en_zona, name='api_vehiculos_en_zona'),
+    path('api/zonas/eventos/', api_eventos_zona, name='api_eventos_zona'),
+    path('api/despacho/', api_despacho, name='api_despacho'),
+    path('api/despacho/aplicar/', api_despacho_aplicar, name='api_despacho_aplicar'),
+    path('api/despacho/entregas/', api_despacho_entregas, name='api_despacho_entregas'),
+    path('api/v1/<str:recurso>/', api_v1_listado, name='api_v1_listado'),
 
     # Rutas del Panel
     path('', panel_dashboard, name='home'),
@@ -21,9 +35,14 @@ urlpatterns = [
     path('combustible/', panel_combustible, name='panel_combustible'),
     path('reportes/', panel_reportes, name='panel_reportes'),
     path('conductores/', panel_conductores, name='panel_conductores'),
+    path('zonas/', panel_zonas, name='panel_zonas'),
     
     # Acciones
     path('reportes/pdf/', generar_pdf_reporte, name='generar_pdf'),
+    path('reportes/exportar/<str:tipo>.<str:formato>', exportar_reporte, name='exportar_reporte'),
+    path('reportes/pdf/<uuid:id>/', descargar_pdf_reporte, name='descargar_pdf'),
+    path('api/reportes/pdf/<uuid:id>/', estado_pdf_reporte, name='estado_pdf'),
+    path('importar/<str:tipo>/', importar_csv, name='importar_csv'),
     path('eliminar/ruta/<int:id>/', eliminar_ruta, name='eliminar_ruta'),
     path('eliminar/combustible/<int:id>/', eliminar_combustible, name='eliminar_combustible'),
 ]
\ No newline at end of file
@@ -1,23 +1,182 @@
-from django.contrib import admin
-from .models import Usuario, Vehiculo, Recorrido, CargaCombustible
+import datetime
 
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connection, models
+from django.db.models import Case, F, Max, Min, Q, Value, When
+from django.utils.functional import cached_property
+
+from .models import (
+    Usuario, Vehiculo, Recorrido, CargaCombustible, Zona, EventoZona, Dispositivo, RecorridoArchivado, CargaArchivada,
+)
+from .dispositivos import emitir_token
+
+# --- LISTADOS SOBRE TABLAS GRANDES ---
+def filas_estimadas(modelo):
+    """Filas según las estadísticas de la tabla (MySQL), o None si el motor no las da."""
+    if connection.vendor != 'mysql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            [modelo._meta.db_table],
+        )
+        fila = cursor.fetchone()
+    return fila[0] if fila else None
+
+
+class PaginadorEstimado(Paginator):
+    # Sin COUNT(*) completo: sin filtros se usa la estimación de la tabla, con
+    # filtros se cuenta hasta ADMIN_CONTEO_MAX (más allá se muestra ese tope)
+    @cached_property
+    def count(self):
+        limite = settings.ADMIN_CONTEO_MAX
+        if not self.object_list.query.where:
+            estimadas = filas_estimadas(self.object_list.model)
+            if estimadas is not None and estimadas > limite:
+                return estimadas
+        return self.object_list.order_by().values('pk')[:limite].count()
+
+
+class FechasPorRango(models.QuerySet):
+    """
+    dates() de la jerarquía de fechas sin un DISTINCT sobre toda la tabla: ofrece
+    los períodos entre el mínimo y el máximo del rango ya filtrado (dos lecturas
+    del índice por fecha). Puede mostrar un mes sin filas; filtrar por él sigue
+    siendo un rango indexado.
+    """
+
+    def dates(self, field_name, kind, order='ASC'):
+        rango = self.aggregate(primero=Min(field_name), ultimo=Max(field_name))
+        primero, ultimo = rango['primero'], rango['ultimo']
+        if primero is None:
+            return []
+        if kind == 'year':
+            periodos = [datetime.date(anio, 1, 1) for anio in range(primero.year, ultimo.year + 1)]
+        elif kind == 'month':
+            periodos, mes = [], primero.replace(day=1)
+            while mes <= ultimo:
+                periodos.append(mes)
+                mes = (mes + datetime.timedelta(days=32)).replace(day=1)
+        else:
+            periodos = [primero + datetime.timedelta(days=n) for n in range((ultimo - primero).days + 1)]
+        return periodos if order == 'ASC' else periodos[::-1]
+
+
+class TablaGrandeAdmin(admin.ModelAdmin):
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+    date_hierarchy = 'fecha'
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return FechasPorRango(model=queryset.model, query=queryset.query, using=queryset.db)
+
+
+# Igual que Recorrido.distancia, pero calculada por la BD y ordenable
+DISTANCIA = Case(
+    When(
+        ~Q(kilometraje_inicio=0) & ~Q(kilometraje_fin=0),
+        kilometraje_inicio__isnull=False, kilometraje_fin__isnull=False,
+        then=F('kilometraje_fin') - F('kilometraje_inicio'),
+    ),
+    default=Value(0),
+)
+
+
+# --- MODELOS ---
 class UsuarioAdmin(admin.ModelAdmin):
     list_display = ('id_usuario', 'nombre', 'rol', 'correo')
     search_fields = ('nombre', 'rut')
+    ordering = ('nombre',)
 
 class VehiculoAdmin(admin.ModelAdmin):
     list_display = ('patente', 'modelo', 'conductor', 'kilometraje')
+    list_select_related = ('conductor',)
+    autocomplete_fields = ('conductor',)
     search_fields = ('patente',)
+    ordering = ('patente',)
 
-class RecorridoAdmin(admin.ModelAdmin):
+class RecorridoAdmin(TablaGrandeAdmin):
     list_display = ('fecha', 'vehiculo', 'conductor', 'distancia')
-    list_filter = ('fecha',)
+    list_select_related = ('vehiculo', 'conductor')
+    autocomplete_fields = ('vehiculo', 'conductor')
+    search_fields = ('^vehiculo__patente',)
 
-class CargaCombustibleAdmin(admin.ModelAdmin):
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(distancia_km=DISTANCIA)
+
+    @admin.display(description='Distancia', ordering='distancia_km')
+    def distancia(self, recorrido):
+        return recorrido.distancia_km
+
+class CargaCombustibleAdmin(TablaGrandeAdmin):
     list_display = ('fecha', 'vehiculo', 'litros', 'costo_total')
-    list_filter = ('fecha', 'vehiculo')
+    list_select_related = ('vehiculo',)
+    autocomplete_fields = ('vehiculo',)
+    # Prefijo de patente en vez de un filtro lateral con todos los vehículos
+    search_fields = ('^vehiculo__patente',)
+
+class ArchivoAdmin(TablaGrandeAdmin):
+    # Solo lectura: las filas llegan con archivar_historial
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+class RecorridoArchivadoAdmin(ArchivoAdmin, RecorridoAdmin):
+    pass
+
+class CargaArchivadaAdmin(ArchivoAdmin, CargaCombustibleAdmin):
+    pass
+
+class ZonaAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'tipo', 'es_base', 'activa')
+    list_filter = ('tipo', 'es_base', 'activa')
+
+class EventoZonaAdmin(admin.ModelAdmin):
+    list_display = ('ts', 'tipo', 'zona', 'vehiculo', 'recorrido')
+    list_filter = ('tipo', 'zona')
+    list_select_related = ('zona', 'vehiculo', 'recorrido')
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+
+class DispositivoAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'prefijo', 'vehiculo', 'fixes_por_segundo', 'rafaga', 'activo', 'creado')
+    list_filter = ('activo',)
+    list_select_related = ('vehiculo',)
+    autocomplete_fields = ('vehiculo',)
+    search_fields = ('nombre', 'prefijo')
+    exclude = ('token_hash', 'prefijo')
+    actions = ['rotar_token']
+
+    def _mostrar_token(self, request, dispositivo, token):
+        messages.warning(request, f"Token de {dispositivo.nombre}: {token} (no se volverá a mostrar)")
+
+    def save_model(self, request, obj, form, change):
+        token = None if change else emitir_token(obj)
+        super().save_model(request, obj, form, change)
+        if token:
+            self._mostrar_token(request, obj, token)
+
+    @admin.action(description="Rotar token (el anterior deja de servir)")
+    def rotar_token(self, request, queryset):
+        for dispositivo in queryset:
+            token = emitir_token(dispositivo)
+            dispositivo.save(update_fields=['token_hash', 'prefijo'])
+            self._mostrar_token(request, dispositivo, token)
 
 admin.site.register(Usuario, UsuarioAdmin)
 admin.site.register(Vehiculo, VehiculoAdmin)
 admin.site.register(Recorrido, RecorridoAdmin)
-admin.site.register(CargaCombustible, CargaCombustibleAdmin)
\ No newline at end of file
+admin.site.register(CargaCombustible, CargaCombustibleAdmin)
+admin.site.register(RecorridoArchivado, RecorridoArchivadoAdmin)
+admin.site.register(CargaArchivada, CargaArchivadaAdmin)
+admin.site.register(Zona, ZonaAdmin)
+admin.site.register(EventoZona, EventoZonaAdmin)
+admin.site.register(Dispositivo, DispositivoAdmin)
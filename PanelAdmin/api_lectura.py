@@ -0,0 +1,180 @@
+import datetime
+import hashlib
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from .models import Vehiculo, Recorrido, CargaCombustible
+from .reportes import filtrar_recorridos, filtrar_cargas
+
+try:
+    import orjson
+except ImportError:  # sin orjson se serializa con el json de la biblioteca estándar
+    orjson = None
+
+
+# --- SERIALIZACION ---
+def _por_defecto(valor):
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (datetime.date, datetime.time)):
+        return valor.isoformat()
+    raise TypeError(f"No serializable: {type(valor).__name__}")
+
+
+def a_json(datos):
+    if orjson is not None:
+        return orjson.dumps(datos, default=_por_defecto)
+    return json.dumps(datos, default=_por_defecto, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+# --- PARAMETROS ---
+def _fecha(params, nombre):
+    texto = params.get(nombre)
+    if not texto:
+        return None
+    try:
+        return datetime.date.fromisoformat(texto)
+    except ValueError:
+        raise ValueError(f"Parámetro {nombre} inválido")
+
+
+def _entero(params, nombre):
+    texto = params.get(nombre)
+    if not texto:
+        return None
+    try:
+        return int(texto)
+    except ValueError:
+        raise ValueError(f"Parámetro {nombre} inválido")
+
+
+def _limite(params):
+    limite = _entero(params, 'limite') or settings.API_FILAS_POR_PAGINA
+    return max(1, min(limite, settings.API_MAX_FILAS))
+
+
+# --- RECURSOS ---
+class Recurso:
+    """
+    Un listado de la API: consulta filtrada, campos proyectados con values()
+    y orden estable para el cursor.
+    """
+
+    def __init__(self, modelo, consulta, campos, orden, alias=None):
+        self.modelo, self.consulta, self.campos, self.orden = modelo, consulta, campos, orden
+        self.alias = {nombre: F(ruta) for nombre, ruta in (alias or {}).items()}
+
+    def _cursor(self, texto):
+        partes = texto.split('_', len(self.orden) - 1)
+        if len(partes) != len(self.orden):
+            raise ValueError("Cursor inválido")
+        try:
+            return [
+                self.modelo._meta.get_field(campo.lstrip('-')).to_python(parte)
+                for campo, parte in zip(self.orden, partes)
+            ]
+        except ValidationError:
+            raise ValueError("Cursor inválido")
+
+    def _despues_de(self, filas, valores):
+        # (a, b) < (x, y)  ->  a < x OR (a = x AND b < y), según la dirección de cada campo
+        condicion = None
+        for campo, valor in reversed(list(zip(self.orden, valores))):
+            nombre = campo.lstrip('-')
+            paso = Q(**{f"{nombre}__{'lt' if campo.startswith('-') else 'gt'}": valor})
+            condicion = paso if condicion is None else paso | (Q(**{nombre: valor}) & condicion)
+        return filas.filter(condicion)
+
+    def pagina(self, params):
+        filas = self.consulta(params).order_by(*self.orden)
+        if params.get('cursor'):
+            filas = self._despues_de(filas, self._cursor(params['cursor']))
+        limite = _limite(params)
+        filas = list(filas.values(*self.campos, **self.alias)[:limite + 1])
+        siguiente = None
+        if len(filas) > limite:
+            filas = filas[:limite]
+            siguiente = '_'.join(str(filas[-1][c.lstrip('-')]) for c in self.orden)
+        return {'resultados': filas, 'siguiente': siguiente}
+
+
+def _vehiculos(params):
+    return Vehiculo.objects.all()
+
+
+def _rutas_activas(params):
+    return Recorrido.objects.filter(hora_fin__isnull=True)
+
+
+def _recorridos(params):
+    filas = filtrar_recorridos({
+        'fecha_inicio': _fecha(params, 'fecha_inicio'), 'fecha_fin': _fecha(params, 'fecha_fin'),
+        'usuario': _entero(params, 'conductor'),
+    })
+    vehiculo = _entero(params, 'vehiculo')
+    return filas.filter(vehiculo_id=vehiculo) if vehiculo else filas
+
+
+def _cargas(params):
+    filas = filtrar_cargas({'fecha_inicio': _fecha(params, 'fecha_inicio'), 'fecha_fin': _fecha(params, 'fecha_fin')})
+    vehiculo = _entero(params, 'vehiculo')
+    return filas.filter(vehiculo_id=vehiculo) if vehiculo else filas
+
+
+RECURSOS = {
+    'vehiculos': Recurso(
+        Vehiculo, _vehiculos,
+        ('id_vehiculo', 'patente', 'modelo', 'kilometraje', 'conductor_id', 'fecha_creacion'), ('id_vehiculo',),
+        alias={'nombre_conductor': 'conductor__nombre'},
+    ),
+    'rutas-activas': Recurso(
+        Recorrido, _rutas_activas,
+        ('id_recorrido', 'fecha', 'hora_inicio', 'kilometraje_inicio', 'ubicacion_inicio_txt', 'conductor_id', 'vehiculo_id'),
+        ('id_recorrido',),
+        alias={
+            'nombre_conductor': 'conductor__nombre', 'patente': 'vehiculo__patente',
+            'latitud': 'vehiculo__latitud', 'longitud': 'vehiculo__longitud', 'km_gps': 'distancia_gps__km',
+        },
+    ),
+    'recorridos': Recurso(
+        Recorrido, _recorridos,
+        ('id_recorrido', 'fecha', 'hora_inicio', 'hora_fin', 'kilometraje_inicio', 'kilometraje_fin',
+         'ubicacion_inicio_txt', 'ubicacion_fin_txt', 'conductor_id', 'vehiculo_id'),
+        ('-fecha', '-id_recorrido'),
+        alias={'nombre_conductor': 'conductor__nombre', 'patente': 'vehiculo__patente', 'km_gps': 'distancia_gps__km'},
+    ),
+    'cargas': Recurso(
+        CargaCombustible, _cargas,
+        ('id_carga', 'fecha', 'hora', 'litros', 'costo_total', 'vehiculo_id'), ('-fecha', '-id_carga'),
+        alias={'patente': 'vehiculo__patente'},
+    ),
+}
+
+
+# --- RESPUESTA CONDICIONAL ---
+# El ETag es un hash de la página misma: las cuatro tablas también las escribe la
+# app externa (y los pings GPS), que no pasan por las señales ni invalidan el cache
+# del panel, así que ninguna versión del cache sirve para decir que no cambiaron.
+# La página se consulta y se serializa igual para calcularlo: un 304 solo ahorra
+# la transferencia.
+def _etag(cuerpo):
+    return quote_etag(hashlib.blake2b(cuerpo, digest_size=16).hexdigest())
+
+
+def responder(request, recurso):
+    cuerpo = a_json(recurso.pagina(request.GET))
+    etag = _etag(cuerpo)
+    no_modificado = get_conditional_response(request, etag=etag)
+    if no_modificado is not None:
+        return no_modificado
+    response = HttpResponse(cuerpo, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
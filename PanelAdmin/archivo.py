@@ -0,0 +1,126 @@
+import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Min, Q
+
+from .models import Recorrido, CargaCombustible, RecorridoArchivado, CargaArchivada
+from .cache_panel import cacheado, invalidar
+
+# Recorridos y CargaCombustible quedan con los datos recientes; lo antiguo vive en
+# tablas de archivo con las mismas columnas e ids. Las consultas por rango de
+# fechas solo tocan el archivo si el rango llega a fechas ya archivadas.
+ARCHIVO = {Recorrido: RecorridoArchivado, CargaCombustible: CargaArchivada}
+# Un viaje abierto se queda en la tabla de la app aunque sea antiguo: la app aún lo cierra
+ARCHIVABLE = {Recorrido: Q(hora_fin__isnull=False), CargaCombustible: Q()}
+GRUPO = {Recorrido: 'recorridos', CargaCombustible: 'cargas'}
+
+
+# --- RUTEO DE CONSULTAS ---
+def _ultima_fecha():
+    fechas = [f for f in (m.objects.aggregate(f=Max('fecha'))['f'] for m in ARCHIVO.values()) if f]
+    # date.min = nada archivado (un None no quedaría en el cache)
+    return max(fechas) if fechas else datetime.date.min
+
+
+def ultima_fecha_archivada():
+    return cacheado('archivo_ultima_fecha', ['archivo'], _ultima_fecha)
+
+
+def _fecha(valor):
+    if isinstance(valor, datetime.date):
+        return valor
+    try:
+        return datetime.date.fromisoformat(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def modelos(modelo, fecha_inicio=None):
+    """Tablas a consultar para un rango que empieza en `fecha_inicio` (None = desde
+    siempre): la de la app siempre, el archivo solo si el rango lo alcanza."""
+    ultima = ultima_fecha_archivada()
+    inicio = _fecha(fecha_inicio)
+    if ultima == datetime.date.min or (inicio and inicio > ultima):
+        return [modelo]
+    return [modelo, ARCHIVO[modelo]]
+
+
+# --- PARTICIONES MENSUALES (solo MySQL) ---
+def _mes(fecha):
+    return fecha.replace(day=1)
+
+
+def _mes_siguiente(mes):
+    return (mes + datetime.timedelta(days=32)).replace(day=1)
+
+
+def asegurar_particiones(archivo, desde, hasta):
+    """Crea las particiones pAAAAMM que faltan para guardar fechas entre `desde` y `hasta`.
+    Fuera de MySQL (SQLite en desarrollo) la tabla no se particiona: el índice por fecha hace ese papel."""
+    if connection.vendor != 'mysql':
+        return 0
+    q = connection.ops.quote_name
+    tabla = archivo._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME <> 'pmax'",
+            [tabla],
+        )
+        existentes = sorted(nombre for (nombre,) in cursor.fetchall() if nombre)
+        # La primera partición recibe también todo lo anterior a su mes
+        if existentes:
+            mes = _mes_siguiente(datetime.datetime.strptime(existentes[-1], 'p%Y%m').date())
+        else:
+            mes = _mes(desde)
+        creadas = 0
+        while mes <= _mes(hasta):
+            # pmax está vacía (nunca se archiva una fecha sin su partición): separarla no copia filas
+            cursor.execute(
+                f"ALTER TABLE {q(tabla)} REORGANIZE PARTITION pmax INTO ("
+                f"PARTITION p{mes:%Y%m} VALUES LESS THAN ('{_mes_siguiente(mes).isoformat()}'), "
+                "PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+            )
+            mes = _mes_siguiente(mes)
+            creadas += 1
+    return creadas
+
+
+# --- ARCHIVADO ---
+def pendientes(modelo, corte):
+    return modelo.objects.filter(ARCHIVABLE[modelo], fecha__lt=corte)
+
+
+def archivar(modelo, corte, lote=None):
+    """Mueve al archivo las filas archivables con fecha anterior a `corte`, en lotes
+    de una transacción cada uno. Devuelve cuántas movió."""
+    archivo = ARCHIVO[modelo]
+    lote = lote or settings.ARCHIVO_LOTE
+    candidatas = pendientes(modelo, corte)
+    desde = candidatas.aggregate(desde=Min('fecha'))['desde']
+    if desde is None:
+        return 0
+    asegurar_particiones(archivo, desde, corte - datetime.timedelta(days=1))
+
+    q = connection.ops.quote_name
+    columnas = ', '.join(q(campo.column) for campo in archivo._meta.concrete_fields)
+    origen, destino, pk = q(modelo._meta.db_table), q(archivo._meta.db_table), q(modelo._meta.pk.column)
+    ids_lote = candidatas.order_by('pk').values_list('pk', flat=True)
+    total = 0
+    while True:
+        with transaction.atomic():
+            ids = list(ids_lote[:lote])
+            if not ids:
+                break
+            marcas = ', '.join(['%s'] * len(ids))
+            # SQL directo, sin señales: el resumen diario y el rendimiento ya calculados no cambian
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {destino} ({columnas}) SELECT {columnas} FROM {origen} WHERE {pk} IN ({marcas})", ids,
+                )
+                cursor.execute(f"DELETE FROM {origen} WHERE {pk} IN ({marcas})", ids)
+        total += len(ids)
+    if total:
+        invalidar('archivo', GRUPO[modelo])
+    return total
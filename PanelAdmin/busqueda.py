@@ -0,0 +1,178 @@
+import re
+import unicodedata
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Max, Q
+
+from .models import Usuario, Vehiculo, RolUsuario, TerminoBusqueda
+
+LARGO_TERMINO = 64
+MAX_TOKENS_CONSULTA = 5
+MAX_INDEXAR_EN_CONSULTA = 2000
+
+
+# --- NORMALIZACION ---
+def normalizar(texto):
+    # 'Núñez' -> 'nunez'; se hace igual al indexar y al consultar
+    texto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def _compacto(texto):
+    return re.sub(r'[^a-z0-9]', '', normalizar(texto))[:LARGO_TERMINO]
+
+
+def _terminos(*campos):
+    # Cada palabra por separado y además el campo completo sin separadores,
+    # para que '12.345.678-9' se encuentre escribiendo '12345' y 'juan.pe' encuentre el correo
+    terminos = set()
+    for campo in campos:
+        if not campo:
+            continue
+        terminos.update(p[:LARGO_TERMINO] for p in re.split(r'[^a-z0-9]+', normalizar(campo)) if p)
+        terminos.add(_compacto(campo))
+    terminos.discard('')
+    return terminos
+
+
+# En orden de prioridad: 'admin conductor' es ADMIN
+PALABRAS_ROL = (
+    (RolUsuario.ADMIN, 'admin'),
+    (RolUsuario.DESHABILITADO, 'deshabilitado'),
+    (RolUsuario.CONDUCTOR, 'conductor'),
+)
+
+
+def normalizar_rol(rol):
+    rol = normalizar(rol)
+    for normalizado, palabra in PALABRAS_ROL:
+        if palabra in rol:
+            return normalizado
+    return RolUsuario.OTRO
+
+
+# --- INDEXACION ---
+FUENTES = {
+    TerminoBusqueda.USUARIO: (Usuario, lambda u: _terminos(u.nombre, u.rut, u.correo)),
+    TerminoBusqueda.VEHICULO: (Vehiculo, lambda v: _terminos(v.patente, v.modelo)),
+}
+
+
+def indexar(tipo, objetos):
+    objetos = list(objetos)
+    with transaction.atomic():
+        TerminoBusqueda.objects.filter(tipo=tipo, objeto_id__in=[o.pk for o in objetos]).delete()
+        _agregar(tipo, objetos)
+
+
+def _agregar(tipo, objetos):
+    modelo, terminos = FUENTES[tipo]
+    TerminoBusqueda.objects.bulk_create(
+        [TerminoBusqueda(tipo=tipo, objeto_id=o.pk, termino=t) for o in objetos for t in terminos(o)],
+        batch_size=1000,
+    )
+    if modelo is Usuario:
+        RolUsuario.objects.bulk_create(
+            [RolUsuario(usuario_id=o.pk, rol=normalizar_rol(o.rol)) for o in objetos], batch_size=1000,
+            update_conflicts=True, unique_fields=['usuario'], update_fields=['rol'],
+        )
+
+
+def desindexar(tipo, ids):
+    TerminoBusqueda.objects.filter(tipo=tipo, objeto_id__in=ids).delete()
+    if tipo == TerminoBusqueda.USUARIO:
+        RolUsuario.objects.filter(usuario_id__in=ids).delete()
+
+
+def reindexar(lote=2000):
+    cantidades = {}
+    for tipo, (modelo, _) in FUENTES.items():
+        with transaction.atomic():
+            TerminoBusqueda.objects.filter(tipo=tipo).delete()
+            if modelo is Usuario:
+                RolUsuario.objects.all().delete()
+            buffer, total = [], 0
+            for obj in modelo.objects.order_by('pk').iterator(chunk_size=lote):
+                buffer.append(obj)
+                if len(buffer) >= lote:
+                    indexar(tipo, buffer)
+                    total += len(buffer)
+                    buffer = []
+            indexar(tipo, buffer)
+            cantidades[modelo.__name__] = total + len(buffer)
+    return cantidades
+
+
+# --- FILAS DE LA APP EXTERNA ---
+# La app crea usuarios y vehículos sin pasar por las señales. Antes de cada
+# búsqueda se indexa lo creado después del último id indexado (dos consultas
+# por rango de PK); los huecos (ids menores sin índice) se buscan como mucho una
+# vez cada BUSQUEDA_CONCILIAR_SEGUNDOS.
+def indexar_faltantes(tipo):
+    modelo, _ = FUENTES[tipo]
+    indexados = TerminoBusqueda.objects.filter(tipo=tipo)
+    clave = f'busqueda:conciliacion:{tipo}'
+    if caches[settings.PANEL_CACHE_ALIAS].add(clave, 1, timeout=settings.BUSQUEDA_CONCILIAR_SEGUNDOS):
+        faltantes = modelo.objects.exclude(pk__in=indexados.values('objeto_id'))
+    else:
+        faltantes = modelo.objects.filter(pk__gt=indexados.aggregate(ultimo=Max('objeto_id'))['ultimo'] or 0)
+    faltantes = list(faltantes.order_by('pk')[:MAX_INDEXAR_EN_CONSULTA])
+    if faltantes:
+        with transaction.atomic():  # sin términos que borrar: no pasa por indexar()
+            _agregar(tipo, faltantes)
+    return len(faltantes)
+
+
+# --- CONSULTAS ---
+def ids_coincidentes(tipo, texto):
+    """Subconsulta con los ids cuyo índice contiene un término que empieza por
+    cada palabra de `texto`. None si no hay nada que buscar."""
+    tokens = [t for t in (_compacto(p) for p in (texto or '').split()) if t][:MAX_TOKENS_CONSULTA]
+    if not tokens:
+        return None
+    indexar_faltantes(tipo)
+    # istartswith es LIKE 'abc%' en MySQL: usa busqueda_termino_idx como rango
+    base = TerminoBusqueda.objects.filter(tipo=tipo)
+    ids = base.filter(termino__istartswith=tokens[0]).values('objeto_id')
+    for token in tokens[1:]:
+        ids = ids.filter(objeto_id__in=base.filter(termino__istartswith=token).values('objeto_id'))
+    return ids.distinct()
+
+
+def buscar_usuarios(texto, queryset=None):
+    queryset = Usuario.objects.all() if queryset is None else queryset
+    ids = ids_coincidentes(TerminoBusqueda.USUARIO, texto)
+    return queryset if ids is None else queryset.filter(id_usuario__in=ids)
+
+
+def buscar_vehiculos(texto, queryset=None):
+    queryset = Vehiculo.objects.all() if queryset is None else queryset
+    ids = ids_coincidentes(TerminoBusqueda.VEHICULO, texto)
+    return queryset if ids is None else queryset.filter(id_vehiculo__in=ids)
+
+
+def _rol_en_columna(rol):
+    # Lo mismo que normalizar_rol, sobre Usuarios.rol, para los usuarios aún sin
+    # rol normalizado (creados por la app externa y todavía no indexados)
+    condicion = Q()
+    for normalizado, palabra in PALABRAS_ROL:
+        if normalizado == rol:
+            return condicion & Q(rol__icontains=palabra)
+        condicion &= ~Q(rol__icontains=palabra)
+    return condicion
+
+
+def con_rol(*roles, queryset=None):
+    queryset = Usuario.objects.all() if queryset is None else queryset
+    sin_normalizar = Q()
+    for rol in roles:
+        sin_normalizar |= _rol_en_columna(rol)
+    return queryset.filter(
+        Q(rol_normalizado__rol__in=roles) | Q(rol_normalizado__isnull=True) & sin_normalizar
+    )
+
+
+def no_admin(queryset=None):
+    return con_rol(*(r for r, _ in RolUsuario.ROLES if r != RolUsuario.ADMIN), queryset=queryset)
@@ -0,0 +1,55 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Cada grupo tiene un número de versión en el cache. Las claves incluyen las
+# versiones de los grupos de los que dependen: al invalidar un grupo se
+# incrementa su versión y todas las entradas viejas quedan inalcanzables.
+# Una versión perdida (cache reiniciado o purgado) se vuelve a sembrar con
+# time.time_ns(): nunca repite un valor ya usado, así que ninguna entrada vieja
+# que haya sobrevivido a la purga vuelve a ser alcanzable.
+GRUPOS = ('vehiculos', 'usuarios', 'recorridos', 'cargas', 'resumenes', 'zonas', 'rendimiento', 'dispositivos', 'archivo')
+
+
+def _cache():
+    return caches[settings.PANEL_CACHE_ALIAS]
+
+
+def _clave_version(grupo):
+    return f'panel:v:{grupo}'
+
+
+def versiones(grupos):
+    cache = _cache()
+    claves = [_clave_version(g) for g in grupos]
+    actuales = cache.get_many(claves)
+    faltantes = [c for c in claves if c not in actuales]
+    if faltantes:
+        semilla = time.time_ns()
+        for c in faltantes:
+            cache.add(c, semilla, timeout=None)  # add: si otro proceso ya la sembró, gana la suya
+        actuales.update(cache.get_many(faltantes))
+    return [actuales.get(c, 0) for c in claves]
+
+
+def invalidar(*grupos):
+    cache = _cache()
+    for grupo in grupos:
+        try:
+            cache.incr(_clave_version(grupo))
+        except ValueError:  # la versión no estaba: un valor que no se usó antes
+            cache.set(_clave_version(grupo), time.time_ns(), timeout=None)
+
+
+def cacheado(nombre, grupos, funcion, *args, clave='', **kwargs):
+    vers = versiones(grupos)
+    llave = f"panel:{nombre}:{clave}:" + '.'.join(f'{g}{v}' for g, v in zip(grupos, vers))
+    cache = _cache()
+    valor = cache.get(llave)
+    if valor is None:
+        valor = funcion(*args, **kwargs)
+        if hasattr(valor, '_fetch_all'):  # QuerySet: se guarda el resultado, no la consulta
+            valor = list(valor)
+        cache.set(llave, valor, timeout=settings.PANEL_CACHE_TIMEOUT)
+    return valor
@@ -0,0 +1,308 @@
+import datetime
+import logging
+import uuid
+from collections import defaultdict
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Usuario, Vehiculo, Recorrido, EventoRecorrido
+from .gps import FixGPS, parsear_ts, parsear_posicion
+from . import trayectos
+
+logger = logging.getLogger(__name__)
+
+# La app guarda los eventos de cada viaje con una clave propia y los sube cuando
+# tiene señal, reintentando hasta recibir respuesta. Un evento ya guardado no se
+# vuelve a aplicar, y los que llegan antes que el INICIO de su viaje esperan en
+# EventosRecorrido hasta que llegue.
+INICIO, PUNTO, FIN = EventoRecorrido.INICIO, EventoRecorrido.PUNTO, EventoRecorrido.FIN
+# En un mismo instante: un viaje no termina antes de empezar
+ORDEN = {INICIO: 0, PUNTO: 1, FIN: 2}
+
+
+class Conflicto(Exception):
+    """Otro envío con las mismas claves se guardó mientras se aplicaba este: basta con reintentar."""
+
+
+class ResultadoLote(NamedTuple):
+    aplicados: int
+    pendientes: int
+    duplicados: int
+    rechazados: list
+    recorridos: dict  # viaje -> id_recorrido
+    fixes: list       # puntos de control con posición, para el historial GPS
+
+
+# --- PARSEO / VALIDACION ---
+def _uuid(valor, nombre):
+    try:
+        return uuid.UUID(str(valor))
+    except ValueError:
+        raise ValueError(f"{nombre} inválida")
+
+
+def _entero(valor, nombre):
+    if valor in (None, ''):
+        return None
+    try:
+        numero = int(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"{nombre} inválido")
+    if numero < 0:
+        raise ValueError(f"{nombre} fuera de rango")
+    return numero
+
+
+def parsear_evento(dato, patente=None):
+    """EventoRecorrido sin guardar. Un INICIO lleva además `patente` (o la del
+    dispositivo) y `conductor` como atributos, solo para crear el recorrido."""
+    tipo = str(dato.get('tipo') or '').upper()
+    if tipo not in ORDEN:
+        raise ValueError("tipo inválido")
+    evento = EventoRecorrido(
+        clave=_uuid(dato.get('clave'), 'clave'), viaje=_uuid(dato.get('viaje'), 'viaje'), tipo=tipo,
+        ts=parsear_ts(dato.get('ts')), kilometraje=_entero(dato.get('kilometraje'), 'kilometraje'),
+        ubicacion=str(dato.get('ubicacion') or '').strip()[:255] or None,
+    )
+    if dato.get('latitud') is not None or dato.get('longitud') is not None:
+        evento.latitud, evento.longitud = parsear_posicion(dato)
+    if tipo == INICIO:
+        evento.patente = (dato.get('patente') or patente or '').upper().strip()
+        if not evento.patente:
+            raise ValueError("Falta patente")
+        evento.conductor = _entero(dato.get('conductor'), 'conductor')
+        if evento.conductor is None:
+            raise ValueError("Falta conductor")
+    return evento
+
+
+# --- APLICACION ---
+class _Lote:
+    def __init__(self, dispositivo):
+        self.dispositivo = dispositivo
+        self.recorridos = {}               # viaje -> Recorrido
+        self.en_espera = defaultdict(list)  # viaje -> eventos sin INICIO
+        self.liberados = []                # eventos guardados antes que ya tienen su INICIO
+        self.rechazados = []
+        self.fixes = []
+        self.en_curso = {}     # ('vehiculo' | 'conductor', id) -> Recorrido abierto
+        self.vinculados = {}     # id_recorrido abierto -> viaje de la app que lo inició
+        self.pendientes = None   # eventos del dispositivo esperando su INICIO (se cuentan al primero)
+
+    def cargar(self, nuevos):
+        inicios = [e for e in nuevos if e.tipo == INICIO]
+        self.vehiculos, self.conductores = {}, set()
+        if not inicios:
+            self.cargar_anteriores({e.viaje for e in nuevos})
+            return
+        # Filas bloqueadas antes de leer lo anterior: dos INICIO del mismo vehículo o conductor
+        # en envíos paralelos se aplican uno después del otro y no abren dos viajes
+        self.vehiculos = {
+            patente: (id_vehiculo, kilometraje)
+            for patente, id_vehiculo, kilometraje in Vehiculo.objects.select_for_update().filter(
+                patente__in={e.patente for e in inicios},
+            ).values_list('patente', 'id_vehiculo', 'kilometraje')
+        }
+        self.conductores = set(Usuario.objects.select_for_update().filter(
+            id_usuario__in={e.conductor for e in inicios},
+        ).values_list('id_usuario', flat=True))
+        self.cargar_anteriores({e.viaje for e in nuevos})
+        abiertos = list(Recorrido.objects.select_related('vehiculo').filter(
+            Q(vehiculo_id__in=[v[0] for v in self.vehiculos.values()]) | Q(conductor_id__in=self.conductores),
+            hora_fin__isnull=True,
+        ))
+        for recorrido in abiertos:
+            self._marcar_en_curso(recorrido)
+        if abiertos:
+            self.vinculados = dict(EventoRecorrido.objects.filter(
+                tipo=INICIO, recorrido_id__in=[r.id_recorrido for r in abiertos],
+            ).values_list('recorrido_id', 'viaje'))
+
+    def _marcar_en_curso(self, recorrido):
+        self.en_curso[('vehiculo', recorrido.vehiculo_id)] = recorrido
+        self.en_curso[('conductor', recorrido.conductor_id)] = recorrido
+
+    def cargar_anteriores(self, viajes):
+        # Viajes ya iniciados en envíos anteriores y eventos que esperaban su INICIO,
+        # bloqueados: otro envío no puede liberar los mismos pendientes a la vez
+        anteriores = EventoRecorrido.objects.select_for_update().filter(
+            Q(tipo=INICIO) | Q(aplicado=False), viaje__in=viajes,
+        )
+        ids = {}
+        for evento in anteriores:
+            if evento.tipo == INICIO:
+                ids[evento.viaje] = evento.recorrido_id
+            else:
+                self.en_espera[evento.viaje].append(evento)
+        por_id = Recorrido.objects.select_related('vehiculo').in_bulk(ids.values())
+        self.recorridos = {viaje: por_id[id_] for viaje, id_ in ids.items() if id_ in por_id}
+
+    def _ajeno(self, patente):
+        # Un teléfono asociado a un vehículo solo maneja los viajes de ese vehículo
+        return self.dispositivo is not None and self.dispositivo.patente is not None and patente != self.dispositivo.patente
+
+    def aplicar(self, evento):
+        if evento.tipo == INICIO:
+            return self._iniciar(evento)
+        recorrido = self.recorridos.get(evento.viaje)
+        if recorrido is None:
+            if self.dispositivo is not None:
+                if self.pendientes is None:
+                    self.pendientes = EventoRecorrido.objects.filter(
+                        dispositivo_id=self.dispositivo.id, aplicado=False,
+                    ).count()
+                if self.pendientes >= settings.RECORRIDOS_PENDIENTES_MAX:
+                    raise ValueError("Demasiados eventos esperando el inicio de su viaje")
+                self.pendientes += 1
+            evento.aplicado = False
+            self.en_espera[evento.viaje].append(evento)
+            return
+        if self._ajeno(recorrido.vehiculo.patente):
+            raise ValueError("Patente no asociada al dispositivo")
+        self._en_viaje(evento, recorrido)
+
+    def _iniciar(self, evento):
+        if evento.viaje in self.recorridos:
+            raise ValueError("El viaje ya fue iniciado con otra clave")
+        if self._ajeno(evento.patente):
+            raise ValueError("Patente no asociada al dispositivo")
+        if evento.patente not in self.vehiculos:
+            raise ValueError("Patente no encontrada")
+        if evento.conductor not in self.conductores:
+            raise ValueError("Conductor no encontrado")
+        id_vehiculo, kilometraje = self.vehiculos[evento.patente]
+        del_vehiculo = self.en_curso.get(('vehiculo', id_vehiculo))
+        del_conductor = self.en_curso.get(('conductor', evento.conductor))
+        if del_vehiculo is not None and self.vinculados.get(del_vehiculo.id_recorrido) == evento.viaje:
+            raise ValueError("El viaje ya fue iniciado con otra clave")
+        if del_vehiculo is None and del_conductor is None:
+            local = timezone.localtime(evento.ts)
+            recorrido = Recorrido.objects.create(
+                conductor_id=evento.conductor, vehiculo_id=id_vehiculo,
+                fecha=local.date(), hora_inicio=local.time(),
+                kilometraje_inicio=evento.kilometraje if evento.kilometraje is not None else kilometraje,
+                ubicacion_inicio_txt=evento.ubicacion,
+            )
+            recorrido.vehiculo = Vehiculo(id_vehiculo=id_vehiculo, patente=evento.patente)
+            self._marcar_en_curso(recorrido)
+        elif (
+            del_vehiculo is del_conductor and del_vehiculo.conductor_id == evento.conductor
+            and del_vehiculo.id_recorrido not in self.vinculados
+        ):
+            # Mismo vehículo y conductor, abierto sin la app (p. ej. por la geocerca de la base al
+            # salir): ese es el viaje que la app está iniciando, no se abre otro
+            recorrido = del_vehiculo
+        else:
+            raise ValueError("El vehículo o el conductor ya tiene un viaje en curso")
+        self.vinculados[recorrido.id_recorrido] = evento.viaje
+        evento.recorrido = recorrido
+        evento.viaje_iniciado = evento.viaje
+        self.recorridos[evento.viaje] = recorrido
+        self.liberar(evento.viaje)
+
+    def liberar(self, viaje):
+        recorrido = self.recorridos[viaje]
+        for pendiente in sorted(self.en_espera.pop(viaje, []), key=_orden):
+            pendiente.aplicado = True
+            self._en_viaje(pendiente, recorrido)
+            if pendiente.pk:
+                self.liberados.append(pendiente)
+
+    def guardar_liberados(self):
+        liberados = defaultdict(list)
+        for evento in self.liberados:
+            liberados[evento.recorrido_id].append(evento.pk)
+        for id_recorrido, pks in liberados.items():
+            EventoRecorrido.objects.filter(pk__in=pks).update(aplicado=True, recorrido_id=id_recorrido)
+
+    def _en_viaje(self, evento, recorrido):
+        evento.recorrido = recorrido
+        if evento.latitud is not None:
+            self.fixes.append(FixGPS(recorrido.vehiculo.patente, evento.latitud, evento.longitud, evento.ts))
+        if evento.tipo == FIN:
+            # Un FIN repetido con otra clave, o un viaje ya cerrado desde el panel, no cambia nada
+            trayectos.cerrar(recorrido, evento.ts, evento.ubicacion, evento.kilometraje)
+            # Cerrado: un INICIO posterior del mismo envío (viajes hechos sin señal) puede abrir otro
+            for clave in [c for c, r in self.en_curso.items() if r.id_recorrido == recorrido.id_recorrido]:
+                del self.en_curso[clave]
+
+
+def _orden(evento):
+    return evento.ts, ORDEN[evento.tipo]
+
+
+def aplicar(eventos, dispositivo=None):
+    """
+    Aplica un lote de eventos validados (con su `indice` en el envío) en una sola
+    transacción, en orden de ts sin importar el orden en que llegaron. Lanza
+    Conflicto si otro envío guardó las mismas claves en paralelo.
+    """
+    # Una limpieza por hora entre todos los workers (add es atómico en el cache compartido)
+    if caches[settings.PANEL_CACHE_ALIAS].add('recorridos:limpieza', 1, timeout=3600):
+        borrar_pendientes_vencidos(timezone.now())
+    lote = _Lote(dispositivo)
+    nuevos, vistas, guardados = [], set(), []
+    try:
+        with transaction.atomic():
+            existentes = set(EventoRecorrido.objects.filter(
+                clave__in=[e.clave for e in eventos],
+            ).values_list('clave', flat=True))
+            for evento in eventos:
+                if evento.clave not in existentes and evento.clave not in vistas:
+                    vistas.add(evento.clave)
+                    nuevos.append(evento)
+            if nuevos:
+                lote.cargar(nuevos)
+            for evento in sorted(nuevos, key=_orden):
+                evento.dispositivo_id = dispositivo and dispositivo.id
+                try:
+                    # Todo lo que rechaza un evento se revisa antes de escribir
+                    lote.aplicar(evento)
+                except ValueError as e:
+                    lote.rechazados.append({'indice': evento.indice, 'message': str(e)})
+                    continue
+                guardados.append(evento)
+
+            EventoRecorrido.objects.bulk_create(guardados)
+            lote.guardar_liberados()
+    except IntegrityError:
+        raise Conflicto()
+
+    # Un INICIO y sus pendientes enviados en paralelo no se ven hasta el commit del otro:
+    # ya confirmado este envío, se revisa de nuevo. El último en confirmar ve a ambos.
+    viajes = {e.viaje for e in guardados if not e.aplicado or e.tipo == INICIO}
+    tardios = _liberar_pendientes(viajes) if viajes else _Lote(None)
+    liberados = {e.clave for e in tardios.liberados}
+
+    lote.rechazados.sort(key=lambda r: r['indice'])
+    pendientes = sum(1 for e in guardados if not e.aplicado and e.clave not in liberados)
+    return ResultadoLote(
+        aplicados=len(guardados) - pendientes, pendientes=pendientes, duplicados=len(eventos) - len(nuevos),
+        rechazados=lote.rechazados, recorridos={str(v): r.id_recorrido for v, r in lote.recorridos.items()},
+        fixes=lote.fixes + tardios.fixes,
+    )
+
+
+def _liberar_pendientes(viajes):
+    """Aplica los eventos en espera de `viajes` cuyo INICIO ya está guardado."""
+    lote = _Lote(None)
+    with transaction.atomic():
+        lote.cargar_anteriores(viajes)
+        for viaje in set(lote.en_espera) & set(lote.recorridos):
+            lote.liberar(viaje)
+        lote.guardar_liberados()
+    return lote
+
+
+def borrar_pendientes_vencidos(ahora):
+    """Descarta los eventos que esperan su INICIO hace más de RECORRIDOS_PENDIENTES_HORAS. Devuelve cuántos."""
+    limite = ahora - datetime.timedelta(hours=settings.RECORRIDOS_PENDIENTES_HORAS)
+    borrados = EventoRecorrido.objects.filter(aplicado=False, recibido__lt=limite).delete()[0]
+    if borrados:
+        logger.warning("Se descartaron %s eventos de recorrido cuyo INICIO nunca llegó", borrados)
+    return borrados
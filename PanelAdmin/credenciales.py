@@ -0,0 +1,116 @@
+import atexit
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.db import connection, transaction
+
+from .cache_panel import invalidar
+from .hashers import PBKDF2Configurable
+from .models import PIN_PENDIENTE, Usuario
+
+logger = logging.getLogger(__name__)
+
+
+# --- POOL DE HASHING ---
+# PBKDF2 libera el GIL, así que bastan hilos. El hash se calcula fuera del
+# request: mientras tanto el usuario queda con PIN_PENDIENTE, una clave
+# inutilizable que deja a la vista un trabajo perdido (p. ej. si el proceso cae).
+_pool = None
+_lock = threading.Lock()
+_cupos = None
+_versiones = {}  # id_usuario -> último cambio pedido; un hash viejo no pisa uno nuevo
+
+
+def pool():
+    global _pool, _cupos
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=settings.CREDENCIALES_HILOS, thread_name_prefix='credenciales')
+            _cupos = threading.BoundedSemaphore(settings.CREDENCIALES_COLA_MAX)
+    return _pool
+
+
+def _hashear(id_usuario, clave, version):
+    # Solo los PIN usan el costo configurable; las claves del admin siguen con el hasher por defecto
+    pin_hash = make_password(clave, hasher=PBKDF2Configurable())
+    with _lock:
+        if _versiones.get(id_usuario) != version:
+            return
+    Usuario.objects.filter(id_usuario=id_usuario).update(pin_hash=pin_hash)
+    invalidar('usuarios')
+
+
+def _guardar(id_usuario, clave, version):
+    try:
+        _hashear(id_usuario, clave, version)
+    except Exception:
+        logger.exception("No se pudo guardar el PIN del usuario %s", id_usuario)
+    finally:
+        _cupos.release()
+        connection.close()
+
+
+def _encolar(id_usuario, clave, version):
+    ejecutor = pool()
+    if _cupos.acquire(blocking=False):
+        ejecutor.submit(_guardar, id_usuario, clave, version)
+    else:
+        _hashear(id_usuario, clave, version)  # cola llena: se calcula aquí para no perder el cambio
+
+
+def programar_pin(id_usuario, clave):
+    """Deja el PIN como pendiente en la transacción del request y encola el hash
+    para después del commit; si el request falla no se encola nada."""
+    Usuario.objects.filter(id_usuario=id_usuario).update(pin_hash=PIN_PENDIENTE)
+    invalidar('usuarios')
+    programar_pines([(id_usuario, clave)])
+
+
+def programar_pines(pines):
+    """Como programar_pin, para usuarios creados ya con PIN_PENDIENTE."""
+    def encolar():
+        for id_usuario, clave in pines:
+            with _lock:
+                version = _versiones[id_usuario] = _versiones.get(id_usuario, 0) + 1
+            _encolar(id_usuario, clave, version)
+    transaction.on_commit(encolar)
+
+
+def esperar():
+    global _pool
+    with _lock:
+        ejecutor, _pool = _pool, None
+    if ejecutor is not None:
+        ejecutor.shutdown(wait=True)
+
+
+atexit.register(esperar)
+
+
+# --- LIMITE POR ADMINISTRADOR ---
+def permitir_cambio(usuario_admin, cantidad=1):
+    """Ventana fija por minuto en el cache del panel (compartido entre procesos
+    si PANEL_CACHE es archivo o redis). Devuelve los segundos a esperar, o 0.
+    Un pedido rechazado no consume cupo."""
+    ahora = time.time()
+    ventana = int(ahora // 60)
+    cache = caches[settings.PANEL_CACHE_ALIAS]
+    clave = f'credenciales:{usuario_admin.pk}:{ventana}'
+    cache.add(clave, 0, timeout=120)
+    try:
+        cambios = cache.incr(clave, cantidad)
+    except ValueError:
+        cache.set(clave, cantidad, timeout=120)
+        cambios = cantidad
+    if cambios > settings.CREDENCIALES_POR_MINUTO:
+        try:
+            cache.decr(clave, cantidad)
+        except ValueError:
+            pass
+        return int(60 - ahora % 60) + 1
+    return 0
@@ -0,0 +1,256 @@
+import datetime
+from typing import NamedTuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+
+from .models import Usuario, Vehiculo, Recorrido, ResumenDiario, RolUsuario
+from .busqueda import con_rol
+from .cache_panel import invalidar
+from .trayectos import haversine
+
+
+# --- ASIGNACION DE COSTO MINIMO ---
+def asignar_min_costo(costo):
+    """
+    Asignación de costo mínimo de una matriz n×m (algoritmo húngaro con caminos
+    aumentantes más cortos, como linear_sum_assignment de SciPy). Devuelve
+    (filas, columnas) con min(n, m) pares, ordenados por fila. Cada paso de la
+    búsqueda trabaja sobre una fila completa de NumPy, no celda por celda.
+    """
+    costo = np.asarray(costo, dtype=float)
+    transpuesta = costo.shape[0] > costo.shape[1]
+    if transpuesta:
+        costo = costo.T
+    n, m = costo.shape
+    if n == 0:
+        return np.empty(0, int), np.empty(0, int)
+
+    # Potenciales iniciales y asignación codiciosa sobre los costos reducidos en cero:
+    # solo las filas que quedan libres necesitan un camino aumentante
+    u = costo.min(axis=1)
+    v = np.zeros(m)
+    if n == m:
+        # Con columnas de sobra v debe quedar <= 0; en la matriz cuadrada se reduce también por columna
+        v = (costo - u[:, None]).min(axis=0)
+    fila_de_col = np.full(m, -1)
+    col_de_fila = np.full(n, -1)
+    ceros = costo - u[:, None] - v == 0
+    for i in range(n):
+        libres = np.flatnonzero(ceros[i] & (fila_de_col < 0))
+        if len(libres):
+            fila_de_col[libres[0]], col_de_fila[i] = i, libres[0]
+
+    for actual in np.flatnonzero(col_de_fila < 0):
+        dist = np.empty(m)
+        pendiente = np.full(m, np.inf)
+        previa = np.full(m, -1)
+        v_abierta = v.copy()  # -inf en las columnas ya visitadas: su costo reducido queda en inf
+        filas = [actual]
+        i, minimo = actual, 0.0
+        while True:
+            reducido = costo[i] - v_abierta
+            reducido += minimo - u[i]
+            previa[reducido < pendiente] = i
+            np.minimum(pendiente, reducido, out=pendiente)
+            j = int(pendiente.argmin())
+            minimo = dist[j] = pendiente[j]
+            if minimo == np.inf:
+                raise ValueError("Matriz de costos sin asignación posible")
+            pendiente[j] = np.inf
+            v_abierta[j] = -np.inf
+            if fila_de_col[j] < 0:
+                break
+            i = fila_de_col[j]
+            filas.append(i)
+
+        u[actual] += minimo
+        otras = np.array(filas[1:], dtype=int)
+        if len(otras):
+            u[otras] += minimo - dist[col_de_fila[otras]]
+        visitadas = v_abierta == -np.inf
+        v[visitadas] -= minimo - dist[visitadas]
+        while True:
+            i = previa[j]
+            fila_de_col[j] = i
+            col_de_fila[i], j = j, col_de_fila[i]
+            if i == actual:
+                break
+
+    filas = np.arange(n)
+    if transpuesta:
+        orden = np.argsort(col_de_fila)
+        return col_de_fila[orden], filas[orden]
+    return filas, col_de_fila
+
+
+# --- ESTADO DE LA FLOTA ---
+class Flota(NamedTuple):
+    # Vehículos y conductores libres (sin viaje abierto), como arreglos paralelos
+    vehiculos: np.ndarray          # id_vehiculo
+    patentes: list
+    vehiculo_lat: np.ndarray       # nan = sin posición
+    vehiculo_lon: np.ndarray
+    asignado: np.ndarray           # conductor_id actual, -1 = ninguno
+    km_desde_carga: np.ndarray
+    conductores: np.ndarray        # id_usuario
+    nombres: list
+    conductor_lat: np.ndarray      # posición del último vehículo que manejó
+    conductor_lon: np.ndarray
+
+
+def _km_desde_carga():
+    """{id_vehiculo: km recorridos desde el día de su última carga}, desde los resúmenes
+    diarios de los últimos DESPACHO_VENTANA_COMBUSTIBLE_DIAS (sin carga en la ventana: todo)."""
+    desde = timezone.localdate() - datetime.timedelta(days=settings.DESPACHO_VENTANA_COMBUSTIBLE_DIAS)
+    ultima_carga = ResumenDiario.objects.filter(
+        vehiculo_id=OuterRef('vehiculo_id'), cargas__gt=0, dia__gte=desde,
+    ).order_by('-dia').values('dia')[:1]
+    filas = ResumenDiario.objects.filter(dia__gte=desde).alias(ultima=Subquery(ultima_carga)).filter(
+        Q(ultima__isnull=True) | Q(dia__gte=F('ultima')),
+    ).values('vehiculo_id').annotate(km=Sum('km')).values_list('vehiculo_id', 'km')
+    return dict(filas)
+
+
+def cargar_flota():
+    en_viaje = set(Recorrido.objects.filter(hora_fin__isnull=True).values_list('vehiculo_id', 'conductor_id'))
+    vehiculos_en_viaje = {v for v, _ in en_viaje}
+    conductores_en_viaje = {c for _, c in en_viaje}
+
+    posicion = {}
+    libres = []
+    for id_vehiculo, patente, lat, lon, conductor_id in Vehiculo.objects.values_list(
+        'id_vehiculo', 'patente', 'latitud', 'longitud', 'conductor_id',
+    ):
+        if lat is not None and lon is not None:
+            posicion[id_vehiculo] = (float(lat), float(lon))
+        if id_vehiculo not in vehiculos_en_viaje:
+            libres.append((id_vehiculo, patente, conductor_id))
+
+    conductores = [
+        c for c in con_rol(RolUsuario.CONDUCTOR).annotate(
+            ultimo_vehiculo=Subquery(
+                Recorrido.objects.filter(conductor_id=OuterRef('pk')).order_by('-id_recorrido').values('vehiculo_id')[:1]
+            ),
+        ).values_list('id_usuario', 'nombre', 'ultimo_vehiculo')
+        if c[0] not in conductores_en_viaje
+    ]
+    # Un conductor está donde dejó el vehículo asignado o, si no tiene, el de su último viaje
+    vehiculo_de = {conductor_id: v for v, _, conductor_id in libres if conductor_id is not None}
+    sin_posicion = (np.nan, np.nan)
+    km = _km_desde_carga()
+    return Flota(
+        vehiculos=np.array([v for v, _, _ in libres], dtype=int),
+        patentes=[p for _, p, _ in libres],
+        vehiculo_lat=np.array([posicion.get(v, sin_posicion)[0] for v, _, _ in libres]),
+        vehiculo_lon=np.array([posicion.get(v, sin_posicion)[1] for v, _, _ in libres]),
+        asignado=np.array([-1 if c is None else c for _, _, c in libres], dtype=int),
+        km_desde_carga=np.array([km.get(v, 0) for v, _, _ in libres], dtype=float),
+        conductores=np.array([c for c, _, _ in conductores], dtype=int),
+        nombres=[nombre for _, nombre, _ in conductores],
+        conductor_lat=np.array([posicion.get(vehiculo_de.get(c, u), sin_posicion)[0] for c, _, u in conductores]),
+        conductor_lon=np.array([posicion.get(vehiculo_de.get(c, u), sin_posicion)[1] for c, _, u in conductores]),
+    )
+
+
+# --- MATRICES DE COSTO (en km equivalentes) ---
+def distancias_km(lat1, lon1, lat2, lon2):
+    """Matriz len(lat1)×len(lat2) de distancias; sin posición en alguno de los dos: DESPACHO_KM_SIN_POSICION."""
+    d = haversine(lat1[:, None], lon1[:, None], lat2[None, :], lon2[None, :]) / 1000
+    return np.where(np.isnan(d), settings.DESPACHO_KM_SIN_POSICION, d)
+
+
+def penalizacion_combustible(km_desde_carga):
+    # Un vehículo que ya gastó su autonomía cuesta como si estuviera DESPACHO_PENALIZACION_COMBUSTIBLE_KM más lejos
+    uso = np.minimum(km_desde_carga / settings.DESPACHO_AUTONOMIA_KM, 1.0)
+    return uso * settings.DESPACHO_PENALIZACION_COMBUSTIBLE_KM
+
+
+def costos_conductores(flota, distancias):
+    costo = distancias + penalizacion_combustible(flota.km_desde_carga)[None, :]
+    # Mantener la asignación actual salvo que otra sea claramente mejor
+    costo -= (flota.conductores[:, None] == flota.asignado[None, :]) * settings.DESPACHO_BONO_ASIGNACION_ACTUAL_KM
+    return costo
+
+
+# --- PROPUESTAS ---
+def proponer_conductores(flota=None):
+    """Asignación conductor -> vehículo de costo mínimo entre los libres. No escribe nada."""
+    flota = cargar_flota() if flota is None else flota
+    distancias = distancias_km(flota.conductor_lat, flota.conductor_lon, flota.vehiculo_lat, flota.vehiculo_lon)
+    filas, columnas = asignar_min_costo(costos_conductores(flota, distancias))
+    asignaciones = [
+        {
+            'conductor': int(flota.conductores[i]), 'nombre': flota.nombres[i],
+            'vehiculo': int(flota.vehiculos[j]), 'patente': flota.patentes[j],
+            'km_al_vehiculo': None if np.isnan(flota.conductor_lat[i]) or np.isnan(flota.vehiculo_lat[j])
+            else round(float(distancias[i, j]), 2),
+            'km_desde_carga': int(flota.km_desde_carga[j]),
+            'actual': bool(flota.asignado[j] == flota.conductores[i]),
+        }
+        for i, j in zip(filas, columnas)
+    ]
+    con_vehiculo, con_conductor = set(filas.tolist()), set(columnas.tolist())
+    return {
+        'asignaciones': asignaciones,
+        'conductores_sin_vehiculo': [int(c) for i, c in enumerate(flota.conductores) if i not in con_vehiculo],
+        'vehiculos_sin_conductor': [int(v) for j, v in enumerate(flota.vehiculos) if j not in con_conductor],
+    }
+
+
+def proponer_entregas(entregas, flota=None):
+    """
+    Vehículo libre y con conductor asignado para cada entrega {'id', 'latitud',
+    'longitud'}, minimizando la distancia total más la penalización por combustible.
+    Las entregas no se guardan: la respuesta es para el despachador.
+    """
+    flota = cargar_flota() if flota is None else flota
+    disponibles = np.flatnonzero((flota.asignado >= 0) & ~np.isnan(flota.vehiculo_lat))
+    lat = np.array([float(e['latitud']) for e in entregas])
+    lon = np.array([float(e['longitud']) for e in entregas])
+    distancias = distancias_km(lat, lon, flota.vehiculo_lat[disponibles], flota.vehiculo_lon[disponibles])
+    costo = distancias + penalizacion_combustible(flota.km_desde_carga[disponibles])[None, :]
+    filas, columnas = asignar_min_costo(costo)
+    asignadas = {}
+    for i, k in zip(filas, columnas):
+        j = disponibles[k]
+        asignadas[i] = {
+            'vehiculo': int(flota.vehiculos[j]), 'patente': flota.patentes[j], 'conductor': int(flota.asignado[j]),
+            'km': round(float(distancias[i, k]), 2),
+        }
+    return [{'entrega': e['id'], **asignadas.get(i, {'vehiculo': None})} for i, e in enumerate(entregas)]
+
+
+# --- APLICACION EN BLOQUE ---
+def aplicar(asignaciones):
+    """
+    Escribe los pares (id_vehiculo, id_conductor o None) en una transacción. Como
+    en la asignación manual, un conductor queda con un solo vehículo: se lo
+    desvincula de los demás. Devuelve cuántos vehículos quedaron desvinculados.
+    """
+    por_vehiculo = dict(asignaciones)
+    if len(por_vehiculo) != len(asignaciones):
+        raise ValueError("Vehículo repetido en las asignaciones")
+    conductores = [c for c in por_vehiculo.values() if c is not None]
+    if len(conductores) != len(set(conductores)):
+        raise ValueError("Conductor asignado a más de un vehículo")
+
+    with transaction.atomic():
+        faltan = set(por_vehiculo) - set(Vehiculo.objects.filter(pk__in=por_vehiculo).values_list('pk', flat=True))
+        if faltan:
+            raise ValueError(f"Vehículos no encontrados: {sorted(faltan)}")
+        faltan = set(conductores) - set(Usuario.objects.filter(pk__in=conductores).values_list('pk', flat=True))
+        if faltan:
+            raise ValueError(f"Conductores no encontrados: {sorted(faltan)}")
+        desvinculados = Vehiculo.objects.filter(conductor_id__in=conductores).exclude(
+            id_vehiculo__in=por_vehiculo,
+        ).update(conductor=None)
+        # Solo la columna del conductor y sin señales: la búsqueda y el índice espacial no dependen de ella
+        Vehiculo.objects.bulk_update(
+            [Vehiculo(id_vehiculo=v, conductor_id=c) for v, c in por_vehiculo.items()], ['conductor'], batch_size=1000,
+        )
+        transaction.on_commit(lambda: invalidar('vehiculos'))
+    return desvinculados
@@ -0,0 +1,175 @@
+import hashlib
+import math
+import secrets
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+
+from .models import Dispositivo
+from .cache_panel import versiones
+from .pool_bd import pool_bd
+
+REVISION_VERSION_S = 1.0  # cada cuánto se mira la versión en el cache (no en cada ping)
+
+
+# --- TOKENS ---
+def hash_token(token):
+    # Tokens aleatorios de 256 bits: un SHA-256 basta, no hace falta un hash lento como el de los PIN
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def emitir_token(dispositivo):
+    """Asigna un token nuevo al dispositivo (sin guardarlo) y lo devuelve en claro: solo se muestra esta vez."""
+    token = secrets.token_urlsafe(32)
+    dispositivo.token_hash, dispositivo.prefijo = hash_token(token), token[:8]
+    return token
+
+
+class DispositivoActivo(NamedTuple):
+    id: int
+    patente: Optional[str]  # None = pasarela, puede reportar cualquier patente
+    fixes_por_segundo: float
+    rafaga: int
+
+
+# --- REGISTRO EN MEMORIA (uno por proceso) ---
+class RegistroDispositivos:
+    """
+    Tokens activos indexados por su hash. Validar un token no consulta la BD:
+    el registro se recarga cuando cambia la versión 'dispositivos' del cache
+    (alta, baja o rotación desde cualquier proceso; se revisa cada
+    REVISION_VERSION_S) o cada DISPOSITIVOS_RESINCRONIZAR segundos.
+
+    Una revocación tarda en aplicarse hasta REVISION_VERSION_S solo si el cache
+    del panel es compartido (PANEL_CACHE archivo o redis). Con 'local' la versión
+    no sale del proceso que revocó y el resto acepta el token hasta su próxima
+    resincronización, hasta DISPOSITIVOS_RESINCRONIZAR segundos.
+    """
+
+    def __init__(self):
+        self._por_hash = {}
+        self._lock = threading.Lock()
+        self.version = None
+        self.cargado = 0.0
+        self._revisado = 0.0
+
+    def cargar(self, version=None):
+        filas = Dispositivo.objects.filter(activo=True).values_list(
+            'id', 'token_hash', 'vehiculo__patente', 'fixes_por_segundo', 'rafaga',
+        )
+        por_hash = {
+            token_hash: DispositivoActivo(
+                id, patente, fixes or settings.DISPOSITIVOS_FIXES_POR_SEGUNDO, rafaga or settings.DISPOSITIVOS_RAFAGA,
+            )
+            for id, token_hash, patente, fixes, rafaga in filas
+        }
+        self._por_hash, self.version, self.cargado = por_hash, version, time.monotonic()
+
+    def recargar(self):
+        with self._lock:
+            version = versiones(['dispositivos'])[0]
+            # Otro hilo pudo recargar mientras este esperaba el lock
+            if version != self.version or time.monotonic() - self.cargado >= settings.DISPOSITIVOS_RESINCRONIZAR:
+                self.cargar(version)
+
+    def vigente(self):
+        """True si los tokens en memoria sirven sin ir a la BD."""
+        ahora = time.monotonic()
+        if not self.cargado or ahora - self.cargado >= settings.DISPOSITIVOS_RESINCRONIZAR:
+            return False
+        if ahora - self._revisado < REVISION_VERSION_S:
+            return True
+        self._revisado = ahora
+        return versiones(['dispositivos'])[0] == self.version
+
+    def buscar(self, token):
+        return self._por_hash.get(hash_token(token))
+
+
+_registro = RegistroDispositivos()
+
+
+def _token(request):
+    tipo, _, token = request.headers.get('Authorization', '').partition(' ')
+    token = token.strip()
+    return token if tipo.lower() == 'bearer' and token else None
+
+
+def autenticar(request):
+    """Dispositivo del encabezado 'Authorization: Bearer <token>', o None si falta o no es válido."""
+    token = _token(request)
+    if token is None:
+        return None
+    if not _registro.vigente():
+        _registro.recargar()
+    dispositivo = _registro.buscar(token)
+    if dispositivo is None:
+        # Un token recién emitido aún no está en memoria: se mira la versión antes de rechazarlo
+        _registro.recargar()
+        dispositivo = _registro.buscar(token)
+    return dispositivo
+
+
+async def autenticar_async(request):
+    # Igual, pero la recarga (única consulta posible) va al pool de BD
+    token = _token(request)
+    if token is None:
+        return None
+    if not _registro.vigente():
+        await pool_bd.ejecutar(_registro.recargar)
+    dispositivo = _registro.buscar(token)
+    if dispositivo is None:
+        await pool_bd.ejecutar(_registro.recargar)
+        dispositivo = _registro.buscar(token)
+    return dispositivo
+
+
+# --- LIMITE DE TASA (token bucket por dispositivo) ---
+class Limitador:
+    """
+    Una cubeta por clave que se rellena a `tasa` fixes por segundo hasta
+    `capacidad`. Vive en la memoria del proceso: con N workers el límite
+    efectivo de un dispositivo es hasta N veces el configurado.
+    """
+
+    def __init__(self, max_cubetas=None):
+        self.max_cubetas = max_cubetas or settings.DISPOSITIVOS_MAX_CUBETAS
+        self._cubetas = {}  # clave -> (fichas, momento, cuándo vuelve a estar llena)
+        self._lock = threading.Lock()
+
+    def consumir(self, clave, cantidad, tasa, capacidad):
+        """0 si hay fichas para `cantidad` fixes; si no, segundos a esperar (inf si nunca alcanzarán)."""
+        if cantidad > capacidad:
+            return math.inf
+        ahora = time.monotonic()
+        with self._lock:
+            fichas, momento, _ = self._cubetas.get(clave, (capacidad, ahora, ahora))
+            fichas = min(capacidad, fichas + (ahora - momento) * tasa)
+            espera = 0.0 if fichas >= cantidad else (cantidad - fichas) / tasa
+            if not espera:
+                fichas -= cantidad
+            self._cubetas[clave] = (fichas, ahora, ahora + (capacidad - fichas) / tasa)
+            if len(self._cubetas) > self.max_cubetas:
+                self._podar(ahora)
+        return espera
+
+    def _podar(self, ahora):
+        # Una cubeta que ya se rellenó entera equivale a no tenerla
+        for clave in [c for c, (_, _, llena) in self._cubetas.items() if llena <= ahora]:
+            del self._cubetas[clave]
+
+
+_limitador = Limitador()
+
+
+def esperar_para(request, dispositivo, cantidad):
+    """Consume `cantidad` fichas; devuelve 0 o los segundos que debe esperar el cliente.
+    Sin dispositivo (DISPOSITIVOS_REQUIERE_TOKEN desactivado) la cubeta es por IP."""
+    if dispositivo is not None:
+        return _limitador.consumir(dispositivo.id, cantidad, dispositivo.fixes_por_segundo, dispositivo.rafaga)
+    return _limitador.consumir(
+        f"ip:{request.META.get('REMOTE_ADDR')}", cantidad,
+        settings.DISPOSITIVOS_FIXES_POR_SEGUNDO, settings.DISPOSITIVOS_RAFAGA,
+    )
@@ -0,0 +1,246 @@
+import heapq
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from .models import Vehiculo
+
+RADIO_TIERRA_M = 6_371_008.8
+METROS_POR_GRADO = math.pi * RADIO_TIERRA_M / 180
+
+
+def distancia_m(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * RADIO_TIERRA_M * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def dentro_de_poligono(lat, lon, vertices):
+    # Ray casting sobre (lat, lon); suficiente para zonas de unos pocos km
+    dentro = False
+    j = len(vertices) - 1
+    for i in range(len(vertices)):
+        lat_i, lon_i = vertices[i]
+        lat_j, lon_j = vertices[j]
+        if (lat_i > lat) != (lat_j > lat) and lon < (lon_j - lon_i) * (lat - lat_i) / (lat_j - lat_i) + lon_i:
+            dentro = not dentro
+        j = i
+    return dentro
+
+
+def parsear_vertices(texto):
+    """'lat,lon;lat,lon;...' (o uno por línea) -> [(lat, lon), ...]; ValueError si no sirve."""
+    try:
+        vertices = [
+            tuple(float(c) for c in v.split(','))
+            for v in texto.replace('\n', ';').split(';') if v.strip()
+        ]
+    except ValueError:
+        raise ValueError("Polígono inválido")
+    if len(vertices) < 3 or any(len(v) != 2 for v in vertices):
+        raise ValueError("El polígono necesita al menos 3 vértices lat,lon")
+    if len(vertices) > settings.ESPACIAL_MAX_VERTICES:
+        raise ValueError(f"Máximo {settings.ESPACIAL_MAX_VERTICES} vértices")
+    if any(abs(lat) > 90 or abs(lon) > 180 for lat, lon in vertices):
+        raise ValueError("Vértice fuera de rango")
+    return vertices
+
+
+# --- INDICE EN MEMORIA (grilla de celdas fijas) ---
+class IndiceEspacial:
+    """
+    Última posición de cada vehículo repartida en celdas de `celda` grados.
+    Una consulta solo mira las celdas que tocan el área buscada, así que su
+    costo depende de cuántos vehículos hay cerca, no del tamaño de la flota.
+    """
+
+    def __init__(self, celda=None):
+        self.celda = celda or settings.ESPACIAL_CELDA_GRADOS
+        self._posiciones = {}  # patente -> (lat, lon, celda)
+        self._celdas = defaultdict(set)
+        self._ids = {}
+        self._lock = threading.Lock()
+        self.cargado = 0.0
+
+    def __len__(self):
+        return len(self._posiciones)
+
+    def conoce(self, patente):
+        return patente in self._ids
+
+    def _clave(self, lat, lon):
+        return math.floor(lat / self.celda), math.floor(lon / self.celda)
+
+    def _mover(self, patente, lat, lon):
+        anterior = self._posiciones.get(patente)
+        clave = self._clave(lat, lon)
+        if anterior and anterior[2] != clave:
+            self._quitar_de_celda(patente, anterior[2])
+        self._celdas[clave].add(patente)
+        self._posiciones[patente] = (lat, lon, clave)
+
+    def _quitar_de_celda(self, patente, clave):
+        miembros = self._celdas[clave]
+        miembros.discard(patente)
+        if not miembros:
+            del self._celdas[clave]
+
+    def actualizar(self, fixes):
+        with self._lock:
+            for f in fixes:
+                # Patentes que no existen en la BD no entran (escribir_posiciones no las actualizó)
+                if f.patente in self._ids:
+                    self._mover(f.patente, float(f.latitud), float(f.longitud))
+
+    def registrar(self, vehiculo):
+        with self._lock:
+            self._ids[vehiculo.patente] = vehiculo.id_vehiculo
+            if vehiculo.latitud is not None and vehiculo.longitud is not None:
+                self._mover(vehiculo.patente, float(vehiculo.latitud), float(vehiculo.longitud))
+
+    def quitar(self, patente):
+        with self._lock:
+            anterior = self._posiciones.pop(patente, None)
+            self._ids.pop(patente, None)
+            if anterior:
+                self._quitar_de_celda(patente, anterior[2])
+
+    def cargar(self):
+        # Foto completa desde la BD: recoge lo que escribieron otros procesos
+        filas = Vehiculo.objects.values_list('id_vehiculo', 'patente', 'latitud', 'longitud')
+        posiciones, celdas, ids = {}, defaultdict(set), {}
+        for id_vehiculo, patente, lat, lon in filas.iterator(chunk_size=5000):
+            ids[patente] = id_vehiculo
+            if lat is None or lon is None:
+                continue
+            lat, lon = float(lat), float(lon)
+            clave = self._clave(lat, lon)
+            posiciones[patente] = (lat, lon, clave)
+            celdas[clave].add(patente)
+        with self._lock:
+            self._posiciones, self._celdas, self._ids = posiciones, celdas, ids
+            self.cargado = time.monotonic()
+
+    # --- CONSULTAS ---
+    def _resultado(self, patente, lat, lon, distancia=None):
+        resultado = {'id_vehiculo': self._ids.get(patente), 'patente': patente, 'latitud': lat, 'longitud': lon}
+        if distancia is not None:
+            resultado['distancia_m'] = round(distancia, 1)
+        return resultado
+
+    def _celdas_en(self, lat_min, lat_max, lon_min, lon_max):
+        (x0, y0), (x1, y1) = self._clave(lat_min, lon_min), self._clave(lat_max, lon_max)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self._celdas):
+            # Área enorme: es más barato filtrar las celdas ocupadas que recorrer la grilla
+            return [c for c in self._celdas if x0 <= c[0] <= x1 and y0 <= c[1] <= y1]
+        return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1) if (x, y) in self._celdas]
+
+    def en_radio(self, lat, lon, metros, limite=None):
+        dlat = metros / METROS_POR_GRADO
+        dlon = dlat / max(math.cos(math.radians(min(abs(lat) + dlat, 89.9))), 1e-6)
+        encontrados = []
+        with self._lock:
+            for clave in self._celdas_en(lat - dlat, lat + dlat, lon - dlon, lon + dlon):
+                for patente in self._celdas[clave]:
+                    p_lat, p_lon, _ = self._posiciones[patente]
+                    d = distancia_m(lat, lon, p_lat, p_lon)
+                    if d <= metros:
+                        encontrados.append(self._resultado(patente, p_lat, p_lon, d))
+        encontrados.sort(key=lambda r: r['distancia_m'])
+        return encontrados[:limite] if limite else encontrados
+
+    def _anillo(self, cx, cy, n):
+        if n == 0:
+            return [(cx, cy)]
+        lados = [(x, cy - n) for x in range(cx - n, cx + n + 1)] + [(x, cy + n) for x in range(cx - n, cx + n + 1)]
+        return lados + [(cx - n, y) for y in range(cy - n + 1, cy + n)] + [(cx + n, y) for y in range(cy - n + 1, cy + n)]
+
+    def cercanos(self, lat, lon, k, excluir=()):
+        """Los k más cercanos, abriendo anillos de celdas alrededor del punto
+        hasta que ningún vehículo fuera de lo visto pueda estar más cerca."""
+        cx, cy = self._clave(lat, lon)
+        candidatos = []
+        with self._lock:
+            anillo = 0
+            while True:
+                if (2 * anillo + 1) ** 2 > len(self._celdas):
+                    # Punto lejos de la flota: recorrer las celdas ocupadas sale más barato que seguir abriendo anillos
+                    candidatos = [
+                        (distancia_m(lat, lon, p_lat, p_lon), patente)
+                        for patente, (p_lat, p_lon, _) in self._posiciones.items() if patente not in excluir
+                    ]
+                    break
+                for clave in self._anillo(cx, cy, anillo):
+                    for patente in self._celdas.get(clave, ()):
+                        if patente not in excluir:
+                            p_lat, p_lon, _ = self._posiciones[patente]
+                            candidatos.append((distancia_m(lat, lon, p_lat, p_lon), patente))
+                # Todo lo que queda fuera está a más de `anillo` celdas completas del punto
+                lat_borde = min(abs(lat) + (anillo + 1) * self.celda, 89.9)
+                seguro = anillo * self.celda * METROS_POR_GRADO * math.cos(math.radians(lat_borde))
+                if len(candidatos) >= k and heapq.nsmallest(k, candidatos)[-1][0] <= seguro:
+                    break
+                anillo += 1
+            return [
+                self._resultado(patente, *self._posiciones[patente][:2], d)
+                for d, patente in heapq.nsmallest(k, candidatos)
+            ]
+
+    def en_poligono(self, vertices):
+        lats = [v[0] for v in vertices]
+        lons = [v[1] for v in vertices]
+        encontrados = []
+        with self._lock:
+            for clave in self._celdas_en(min(lats), max(lats), min(lons), max(lons)):
+                for patente in self._celdas[clave]:
+                    p_lat, p_lon, _ = self._posiciones[patente]
+                    if dentro_de_poligono(p_lat, p_lon, vertices):
+                        encontrados.append(self._resultado(patente, p_lat, p_lon))
+        return sorted(encontrados, key=lambda r: r['patente'])
+
+
+_indice = None
+_lock_carga = threading.Lock()
+
+
+def indice():
+    """Índice del proceso, recargado desde la BD cada ESPACIAL_RESINCRONIZAR segundos."""
+    global _indice
+    with _lock_carga:
+        if _indice is None:
+            _indice = IndiceEspacial()
+        if not _indice.cargado or time.monotonic() - _indice.cargado >= settings.ESPACIAL_RESINCRONIZAR:
+            _indice.cargar()
+    return _indice
+
+
+def vigente():
+    """True si indice() no va a consultar la BD (ya cargado y sin resincronización pendiente)."""
+    return (
+        _indice is not None and bool(_indice.cargado)
+        and time.monotonic() - _indice.cargado < settings.ESPACIAL_RESINCRONIZAR
+    )
+
+
+def indice_cargado():
+    # Para vistas async después de vigente(): nunca consulta la BD
+    return _indice
+
+
+def actualizar(fixes):
+    # Lo llama escribir_posiciones; si el índice aún no se cargó, la primera consulta lo leerá de la BD
+    if _indice is not None:
+        _indice.actualizar(fixes)
+
+
+def registrar(vehiculo):
+    if _indice is not None:
+        _indice.registrar(vehiculo)
+
+
+def quitar(patente):
+    if _indice is not None:
+        _indice.quitar(patente)
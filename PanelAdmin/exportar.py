@@ -0,0 +1,154 @@
+import csv
+import heapq
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+
+from .reportes import recorridos_por_tabla, cargas_por_tabla
+
+# --- DEFINICION DE EXPORTACIONES ---
+COLUMNAS_RECORRIDOS = (
+    'Fecha', 'Hora inicio', 'Hora fin', 'Conductor', 'Patente', 'Origen', 'Destino',
+    'Km inicio', 'Km fin', 'Distancia',
+)
+COLUMNAS_CARGAS = ('Fecha', 'Hora', 'Patente', 'Litros', 'Costo total')
+
+
+def filas_recorridos(filtros):
+    tablas = (
+        recorridos.order_by('-fecha', '-id_recorrido').values_list(
+            'fecha', 'hora_inicio', 'hora_fin', 'conductor__nombre', 'vehiculo__patente',
+            'ubicacion_inicio_txt', 'ubicacion_fin_txt', 'kilometraje_inicio', 'kilometraje_fin', 'id_recorrido',
+        ).iterator(chunk_size=settings.EXPORTAR_CHUNK)
+        for recorridos in recorridos_por_tabla(filtros)
+    )
+    # Tabla de la app y archivo ya vienen ordenados: se intercalan sin juntarlos en memoria
+    for fila in heapq.merge(*tablas, key=lambda f: (f[0], f[9]), reverse=True):
+        ki, kf = fila[7], fila[8]
+        yield fila[:9] + (kf - ki if ki and kf else 0,)
+
+
+def filas_cargas(filtros):
+    tablas = (
+        cargas.order_by('-fecha', '-hora').values_list(
+            'fecha', 'hora', 'vehiculo__patente', 'litros', 'costo_total',
+        ).iterator(chunk_size=settings.EXPORTAR_CHUNK)
+        for cargas in cargas_por_tabla(filtros)
+    )
+    yield from heapq.merge(*tablas, key=lambda f: (f[0], f[1]), reverse=True)
+
+
+EXPORTACIONES = {
+    'recorridos': (COLUMNAS_RECORRIDOS, filas_recorridos),
+    'cargas': (COLUMNAS_CARGAS, filas_cargas),
+}
+
+
+# --- CSV ---
+class _Eco:
+    # Pseudo-archivo: csv.writer "escribe" y recibimos la línea para hacer yield
+    def write(self, valor):
+        return valor
+
+
+def csv_en_stream(columnas, filas):
+    writer = csv.writer(_Eco())
+    yield '\ufeff'  # BOM para que Excel detecte UTF-8
+    yield writer.writerow(columnas)
+    for fila in filas:
+        yield writer.writerow(['' if v is None else v for v in fila])
+
+
+# --- XLSX (SpreadsheetML mínimo, escrito directo a un zip sin seek) ---
+class _Sumidero:
+    def __init__(self):
+        self._partes = []
+        self._posicion = 0
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos, self._partes = b''.join(self._partes), []
+        return datos
+
+
+XLSX_ESTATICOS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Datos" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _celda(valor):
+    if valor is None:
+        return '<c/>'
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return f'<c t="n"><v>{valor}</v></c>'
+    texto = valor.isoformat() if hasattr(valor, 'isoformat') else str(valor)
+    return f'<c t="inlineStr"><is><t>{escape(texto)}</t></is></c>'
+
+
+def _fila_xml(fila):
+    return '<row>' + ''.join(_celda(v) for v in fila) + '</row>'
+
+
+def xlsx_en_stream(columnas, filas):
+    sumidero = _Sumidero()
+    with zipfile.ZipFile(sumidero, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for nombre, contenido in XLSX_ESTATICOS.items():
+            zf.writestr(nombre, contenido)
+        yield sumidero.vaciar()
+
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as hoja:
+            hoja.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            hoja.write(_fila_xml(columnas).encode())
+            for numero, fila in enumerate(filas, 1):
+                hoja.write(_fila_xml(fila).encode())
+                if numero % settings.EXPORTAR_CHUNK == 0:
+                    yield sumidero.vaciar()
+            hoja.write(b'</sheetData></worksheet>')
+    yield sumidero.vaciar()
@@ -0,0 +1,245 @@
+import logging
+import math
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Vehiculo, Recorrido, Zona, VehiculoEnZona, EventoZona
+from .espacial import METROS_POR_GRADO, distancia_m, dentro_de_poligono, parsear_vertices
+from .cache_panel import versiones
+from . import trayectos
+
+logger = logging.getLogger(__name__)
+
+
+# --- GEOMETRIA COMPILADA ---
+class Geocerca:
+    """Zona lista para evaluar: caja envolvente precalculada y la prueba exacta
+    (círculo o polígono) solo para los puntos que caen dentro de la caja."""
+    __slots__ = ('id', 'nombre', 'es_base', 'lat_min', 'lat_max', 'lon_min', 'lon_max', 'vertices', 'centro', 'radio')
+
+    def __init__(self, zona):
+        self.id, self.nombre, self.es_base = zona.id, zona.nombre, zona.es_base
+        self.vertices, self.centro, self.radio = None, None, None
+        if zona.tipo == Zona.CIRCULO:
+            self.centro, self.radio = (zona.latitud, zona.longitud), zona.radio_m
+            dlat = zona.radio_m / METROS_POR_GRADO
+            dlon = dlat / max(math.cos(math.radians(min(abs(zona.latitud) + dlat, 89.9))), 1e-6)
+            self.lat_min, self.lat_max = zona.latitud - dlat, zona.latitud + dlat
+            self.lon_min, self.lon_max = zona.longitud - dlon, zona.longitud + dlon
+        else:
+            self.vertices = [tuple(v) for v in zona.vertices]
+            lats, lons = [v[0] for v in self.vertices], [v[1] for v in self.vertices]
+            self.lat_min, self.lat_max, self.lon_min, self.lon_max = min(lats), max(lats), min(lons), max(lons)
+
+    def contiene(self, lat, lon):
+        if not (self.lat_min <= lat <= self.lat_max and self.lon_min <= lon <= self.lon_max):
+            return False
+        if self.radio is not None:
+            return distancia_m(self.centro[0], self.centro[1], lat, lon) <= self.radio
+        return dentro_de_poligono(lat, lon, self.vertices)
+
+
+def validar_zona(zona):
+    """Normaliza y valida una Zona antes de guardarla; ValueError con el motivo.
+    Los vértices pueden venir como lista o como texto 'lat,lon;lat,lon;...'."""
+    if not (zona.nombre or '').strip():
+        raise ValueError("Falta el nombre de la zona")
+    if zona.tipo == Zona.CIRCULO:
+        if zona.latitud is None or zona.longitud is None or not zona.radio_m:
+            raise ValueError("Un círculo necesita centro y radio")
+        if abs(zona.latitud) > 90 or abs(zona.longitud) > 180 or zona.radio_m <= 0:
+            raise ValueError("Centro o radio fuera de rango")
+        zona.vertices = []
+    elif zona.tipo == Zona.POLIGONO:
+        if isinstance(zona.vertices, str):
+            zona.vertices = parsear_vertices(zona.vertices)
+        zona.vertices = [[float(lat), float(lon)] for lat, lon in zona.vertices]
+        zona.latitud, zona.longitud, zona.radio_m = None, None, None
+    else:
+        raise ValueError("Tipo de zona inválido")
+    return zona
+
+
+# --- MOTOR (uno por proceso) ---
+class MotorGeocercas:
+    """
+    Evalúa cada ping contra las zonas activas, sin consultas: las zonas se
+    reparten en una grilla por su caja envolvente, así que un ping solo prueba
+    las pocas zonas de su celda. Los cambios dentro/fuera quedan pendientes y
+    el hilo del buffer GPS los guarda (procesar_pendientes).
+    """
+
+    def __init__(self, celda=None):
+        self.celda = celda or settings.GEOCERCAS_CELDA_GRADOS
+        self._celdas = {}
+        self._grandes = []  # zonas que cubren demasiadas celdas: se prueban siempre (solo caja primero)
+        self._zonas = {}
+        self._estado = {}   # patente -> frozenset(ids de zona donde está)
+        self._ultimo_ts = {}
+        self._pendientes = deque(maxlen=settings.GEOCERCAS_MAX_PENDIENTES)
+        self._lock = threading.Lock()
+        self.version = None
+        self.cargado = 0.0
+
+    def _clave(self, lat, lon):
+        return math.floor(lat / self.celda), math.floor(lon / self.celda)
+
+    def cargar(self, version=None):
+        geocercas = []
+        for zona in Zona.objects.filter(activa=True):
+            try:
+                geocercas.append(Geocerca(zona))
+            except (TypeError, ValueError):  # p. ej. editada a mano desde el admin
+                logger.warning("Zona %s con geometría inválida: se ignora", zona.id)
+        celdas, grandes = defaultdict(list), []
+        for g in geocercas:
+            (x0, y0), (x1, y1) = self._clave(g.lat_min, g.lon_min), self._clave(g.lat_max, g.lon_max)
+            if (x1 - x0 + 1) * (y1 - y0 + 1) > settings.GEOCERCAS_MAX_CELDAS_ZONA:
+                grandes.append(g)
+                continue
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    celdas[(x, y)].append(g)
+        estado = defaultdict(set)
+        for patente, zona_id in VehiculoEnZona.objects.values_list('vehiculo__patente', 'zona_id'):
+            estado[patente].add(zona_id)
+        with self._lock:
+            self._zonas = {g.id: g for g in geocercas}
+            self._celdas, self._grandes = dict(celdas), grandes
+            self._estado = {p: frozenset(ids) for p, ids in estado.items()}
+            self.version, self.cargado = version, time.monotonic()
+
+    def zonas_en(self, lat, lon):
+        candidatas = self._celdas.get(self._clave(lat, lon), ())
+        return frozenset(g.id for g in (*candidatas, *self._grandes) if g.contiene(lat, lon))
+
+    def evaluar(self, fixes):
+        if not self._zonas and not self._estado:
+            return 0
+        cambios = 0
+        with self._lock:
+            for f in sorted(fixes, key=lambda f: f.ts):
+                # Un ping atrasado no puede deshacer un estado más nuevo
+                if f.ts < self._ultimo_ts.get(f.patente, f.ts):
+                    continue
+                self._ultimo_ts[f.patente] = f.ts
+                lat, lon = float(f.latitud), float(f.longitud)
+                dentro = self.zonas_en(lat, lon)
+                antes = self._estado.get(f.patente, frozenset())
+                if dentro == antes:
+                    continue
+                # Zonas desactivadas o borradas no generan salida
+                for zona_id in antes - dentro:
+                    if zona_id in self._zonas:
+                        self._pendientes.append((f.patente, zona_id, EventoZona.SALIDA, f.ts, lat, lon))
+                for zona_id in dentro - antes:
+                    self._pendientes.append((f.patente, zona_id, EventoZona.ENTRADA, f.ts, lat, lon))
+                self._estado[f.patente] = dentro
+                cambios += 1
+        return cambios
+
+    def geocerca(self, zona_id):
+        return self._zonas.get(zona_id)
+
+    def tomar_pendientes(self):
+        with self._lock:
+            pendientes = list(self._pendientes)
+            self._pendientes.clear()
+        return pendientes
+
+    def devolver(self, transiciones):
+        # No se pudieron guardar: vuelven al frente de la cola, en orden, para el próximo ciclo
+        with self._lock:
+            self._pendientes = deque([*transiciones, *self._pendientes], maxlen=self._pendientes.maxlen)
+
+
+_motor = None
+_lock_motor = threading.Lock()
+
+
+def motor():
+    global _motor
+    if _motor is None:
+        with _lock_motor:
+            if _motor is None:
+                _motor = MotorGeocercas()
+    return _motor
+
+
+def evaluar(fixes):
+    # En el request de cada ping: solo memoria. Hasta la primera carga (hilo del buffer) no evalúa nada.
+    return motor().evaluar(fixes)
+
+
+# --- PERSISTENCIA Y AUTOMATIZACION (hilo del buffer GPS) ---
+def _actualizar_geometria(m):
+    version = versiones(['zonas'])[0]
+    vencido = time.monotonic() - m.cargado >= settings.GEOCERCAS_RESINCRONIZAR
+    if version != m.version or vencido:
+        m.cargar(version)
+
+
+def _registrar(transiciones):
+    """Aplica las transiciones en VehiculosEnZona y devuelve los eventos nuevos.
+    La tabla decide: si otro proceso ya registró el mismo cambio, no se repite."""
+    vehiculos = {
+        v.patente: v for v in Vehiculo.objects.filter(patente__in={t[0] for t in transiciones})
+    }
+    eventos = []
+    for patente, zona_id, tipo, ts, lat, lon in transiciones:
+        vehiculo = vehiculos.get(patente)
+        if vehiculo is None:
+            continue
+        if tipo == EventoZona.ENTRADA:
+            _, nuevo = VehiculoEnZona.objects.get_or_create(
+                vehiculo_id=vehiculo.id_vehiculo, zona_id=zona_id, defaults={'desde': ts},
+            )
+        else:
+            nuevo = VehiculoEnZona.objects.filter(vehiculo_id=vehiculo.id_vehiculo, zona_id=zona_id).delete()[0] > 0
+        if nuevo:
+            eventos.append((vehiculo, EventoZona(
+                vehiculo_id=vehiculo.id_vehiculo, zona_id=zona_id, tipo=tipo, ts=ts, latitud=lat, longitud=lon,
+            )))
+    return eventos
+
+
+def _automatizar(vehiculo, evento, zona):
+    # Salir de una base abre el viaje del conductor asignado; volver a entrar lo cierra
+    abierto = Recorrido.objects.filter(vehiculo_id=vehiculo.id_vehiculo, hora_fin__isnull=True).order_by('-id_recorrido').first()
+    if evento.tipo == EventoZona.SALIDA and abierto is None and vehiculo.conductor_id:
+        local = timezone.localtime(evento.ts)
+        evento.recorrido = Recorrido.objects.create(
+            conductor_id=vehiculo.conductor_id, vehiculo_id=vehiculo.id_vehiculo,
+            fecha=local.date(), hora_inicio=local.time(), kilometraje_inicio=vehiculo.kilometraje,
+            ubicacion_inicio_txt=f"Salida de {zona.nombre} (automático)",
+        )
+    elif evento.tipo == EventoZona.ENTRADA and abierto is not None:
+        trayectos.finalizar(abierto, evento.ts, f"Llegada a {zona.nombre} (automático)")
+        evento.recorrido = abierto
+
+
+def procesar_pendientes():
+    m = motor()
+    transiciones = m.tomar_pendientes()
+    eventos = []
+    if transiciones:
+        try:
+            with transaction.atomic():
+                eventos = _registrar(transiciones)
+                for vehiculo, evento in eventos:
+                    zona = m.geocerca(evento.zona_id)
+                    if zona is not None and zona.es_base and settings.GEOCERCAS_AUTOMATIZAR_RECORRIDOS:
+                        _automatizar(vehiculo, evento, zona)
+                EventoZona.objects.bulk_create([e for _, e in eventos])
+        except Exception:
+            # El estado en memoria ya cambió: si se pierden, esa entrada o salida no se registra nunca
+            m.devolver(transiciones)
+            raise
+    # Después de guardar: la recarga trae el estado dentro/fuera desde la tabla
+    _actualizar_geometria(m)
+    return len(eventos)
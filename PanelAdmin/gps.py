@@ -0,0 +1,295 @@
+import atexit
+import datetime
+import functools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Vehiculo
+from .posiciones import registrar_historial, compactar_pendientes
+from .tiempo_real import publicar_fixes
+from . import trayectos, espacial, geocercas
+
+logger = logging.getLogger(__name__)
+
+SEIS_DECIMALES = Decimal('0.000001')
+
+
+class FixGPS(NamedTuple):
+    patente: str
+    latitud: Decimal
+    longitud: Decimal
+    ts: datetime.datetime
+
+
+# --- PARSEO / VALIDACION ---
+def _coordenada(valor, limite, nombre):
+    try:
+        coord = Decimal(str(valor)).quantize(SEIS_DECIMALES)
+    except (InvalidOperation, TypeError, ValueError):
+        raise ValueError(f"{nombre} inválida")
+    if not coord.is_finite() or abs(coord) > limite:
+        raise ValueError(f"{nombre} fuera de rango")
+    return coord
+
+
+def _timestamp(valor):
+    if valor in (None, ''):
+        return timezone.now()
+    if isinstance(valor, (int, float)):
+        return datetime.datetime.fromtimestamp(valor, tz=datetime.timezone.utc)
+    ts = parse_datetime(str(valor))
+    if ts is None:
+        raise ValueError("ts inválido")
+    if timezone.is_naive(ts):
+        ts = timezone.make_aware(ts)
+    return ts
+
+
+def _en_rango(ts):
+    # Relojes desfasados o valores basura: se descartan antes de tocar la BD
+    ahora = timezone.now()
+    if ts > ahora + datetime.timedelta(seconds=settings.GPS_TOLERANCIA_FUTURO_S):
+        raise ValueError("ts en el futuro")
+    if ts < ahora - datetime.timedelta(days=settings.GPS_ANTIGUEDAD_MAX_DIAS):
+        raise ValueError("ts demasiado antiguo")
+    return ts
+
+
+def parsear_ts(valor):
+    return _en_rango(_timestamp(valor))
+
+
+def parsear_posicion(dato):
+    return _coordenada(dato.get('latitud'), 90, 'latitud'), _coordenada(dato.get('longitud'), 180, 'longitud')
+
+
+def parsear_fix(dato, patente=None):
+    # `patente`: la del dispositivo, para rastreadores que no la envían
+    patente = (dato.get('patente') or patente or '').upper().strip()
+    if not patente:
+        raise ValueError("Falta patente")
+    latitud, longitud = parsear_posicion(dato)
+    return FixGPS(patente=patente, latitud=latitud, longitud=longitud, ts=parsear_ts(dato.get('ts')))
+
+
+# --- DUPLICADOS ---
+class FiltroDuplicados:
+    """
+    Recuerda los últimos (patente, ts) aceptados por el proceso para descartar
+    reenvíos (rastreadores que repiten un lote tras un timeout). Es un LRU
+    acotado: no reemplaza al historial, solo evita trabajo repetido.
+    """
+
+    def __init__(self, maximo=None):
+        self.maximo = maximo or settings.GPS_DUPLICADOS_MEMORIA
+        self._vistos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def separar(self, fixes):
+        nuevos, repetidos = [], 0
+        with self._lock:
+            for fix in fixes:
+                clave = (fix.patente, fix.ts)
+                if clave in self._vistos:
+                    repetidos += 1
+                    continue
+                self._vistos[clave] = None
+                nuevos.append(fix)
+            while len(self._vistos) > self.maximo:
+                self._vistos.popitem(last=False)
+        return nuevos, repetidos
+
+    def olvidar(self, fixes):
+        # Si la escritura falla, el reintento del cliente no debe verse como duplicado
+        with self._lock:
+            for fix in fixes:
+                self._vistos.pop((fix.patente, fix.ts), None)
+
+
+# --- BUFFER DE ESCRITURA ---
+class BufferGPS:
+    """
+    Agrupa los fixes en memoria y deja solo el más reciente por vehículo.
+    Se vacía con un único UPDATE cuando se alcanza el tamaño máximo o
+    pasa el intervalo configurado (lo que ocurra primero). Todos los fixes,
+    no solo el último, se anexan además al historial de posiciones.
+
+    Recuerda el ts de la última posición escrita por patente: un fix más viejo
+    (reenvío tardío de un rastreador) va al historial pero no pisa la posición.
+    Si la escritura falla, los fixes vuelven al buffer para el próximo vaciado.
+    """
+
+    def __init__(self, max_vehiculos=None, intervalo=None, max_historial=None):
+        self.max_vehiculos = max_vehiculos or settings.GPS_BUFFER_MAX_VEHICULOS
+        self.intervalo = intervalo or settings.GPS_BUFFER_INTERVALO
+        self.max_historial = max_historial or settings.GPS_HISTORIAL_MAX_FIXES
+        self._pendientes = {}
+        self._historial = []
+        self._escritos = {}  # patente -> ts de la última posición escrita
+        self._lock = threading.Lock()
+        self._ultimo_vaciado = time.monotonic()
+        self._hilo = None
+
+    def __len__(self):
+        return len(self._pendientes)
+
+    def agregar(self, fix):
+        return self.agregar_lote([fix])
+
+    def agregar_lote(self, fixes):
+        if self.encolar(fixes):
+            return self.vaciar()
+        return 0
+
+    def encolar(self, fixes):
+        """Solo memoria; True si toca vaciar (las vistas async lo hacen en el pool de BD)."""
+        with self._lock:
+            for fix in fixes:
+                if self._es_reciente(fix):
+                    self._pendientes[fix.patente] = fix
+            self._historial.extend(fixes)
+            lleno = len(self._pendientes) >= self.max_vehiculos or len(self._historial) >= self.max_historial
+            vencido = time.monotonic() - self._ultimo_vaciado >= self.intervalo
+        self._iniciar_hilo()
+        return lleno or vencido
+
+    def agregar_historial(self, fixes):
+        # Para fixes cuya posición actual ya se escribió directamente
+        with self._lock:
+            self._historial.extend(fixes)
+        self._iniciar_hilo()
+
+    def marcar_escritos(self, fixes):
+        # También para las posiciones escritas sin pasar por el buffer
+        with self._lock:
+            for fix in fixes:
+                escrito = self._escritos.get(fix.patente)
+                if escrito is None or fix.ts > escrito:
+                    self._escritos[fix.patente] = fix.ts
+
+    def _es_reciente(self, fix):
+        # Con el lock tomado
+        escrito = self._escritos.get(fix.patente)
+        actual = self._pendientes.get(fix.patente)
+        return (escrito is None or fix.ts > escrito) and (actual is None or fix.ts >= actual.ts)
+
+    def _tomar_pendientes(self):
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, {}
+            historial, self._historial = self._historial, []
+            self._ultimo_vaciado = time.monotonic()
+        return pendientes, historial
+
+    def _devolver(self, pendientes, historial):
+        with self._lock:
+            for fix in pendientes:
+                if self._es_reciente(fix):
+                    self._pendientes[fix.patente] = fix
+            self._historial[:0] = historial
+            # Con la BD caída por mucho tiempo no se acumula memoria sin límite
+            sobrantes = len(self._historial) - self.max_historial * 10
+            if sobrantes > 0:
+                del self._historial[:sobrantes]
+                logger.warning("Buffer GPS lleno: se descartan %s fixes del historial", sobrantes)
+
+    def vaciar(self):
+        pendientes, historial = self._tomar_pendientes()
+        pendientes = list(pendientes.values())
+        try:
+            registrar_historial(historial)
+        except Exception:
+            self._devolver(pendientes, historial)
+            raise
+        trayectos.anotar(historial)
+        if not pendientes:
+            return 0
+        try:
+            actualizados = escribir_posiciones(pendientes)
+        except Exception:
+            self._devolver(pendientes, [])
+            raise
+        self.marcar_escritos(pendientes)
+        return actualizados
+
+    # Hilo de fondo para que un vehículo solitario no quede esperando un tamaño que nunca llega
+    def _iniciar_hilo(self):
+        if self._hilo is not None:
+            return
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._ciclo, name='buffer-gps', daemon=True)
+                self._hilo.start()
+
+    def _ciclo(self):
+        while True:
+            time.sleep(self.intervalo)
+            # Cada tarea por separado: una falla no deja sin correr a las demás
+            try:
+                vencido = time.monotonic() - self._ultimo_vaciado >= self.intervalo
+                if vencido and (self._pendientes or self._historial):
+                    self.vaciar()
+            except Exception:
+                logger.exception("Error al vaciar el buffer GPS")
+            try:
+                # Entradas/salidas de zonas detectadas en los requests (puede abrir o cerrar viajes)
+                geocercas.procesar_pendientes()
+            except Exception:
+                logger.exception("Error al registrar entradas y salidas de zonas")
+            try:
+                # Distancias de viajes en curso: fuera del request, cada TRAYECTOS_INTERVALO
+                trayectos.procesar_pendientes()
+            except Exception:
+                logger.exception("Error al calcular las distancias de los recorridos")
+            try:
+                compactar_pendientes()
+            except Exception:
+                logger.exception("Error al compactar el historial GPS")
+            finally:
+                close_old_connections()
+
+
+@functools.lru_cache(maxsize=32)
+def _sql_posiciones(vendor, n):
+    # Sentencia armada una vez por tamaño (potencias de 2): con el ORM, construir
+    # los CASE de un lote de 500 patentes costaba más que ejecutar el UPDATE
+    q = connection.ops.quote_name
+    tabla, patente = q(Vehiculo._meta.db_table), q('patente')
+    casos = ' '.join(['WHEN %s THEN %s'] * n)
+    return (
+        f"UPDATE {tabla} SET {q('latitud')} = CASE {patente} {casos} END, "
+        f"{q('longitud')} = CASE {patente} {casos} END "
+        f"WHERE {patente} IN ({', '.join(['%s'] * n)})"
+    )
+
+
+def escribir_posiciones(fixes):
+    fixes = list(fixes)
+    if not fixes:
+        return 0
+    # Se completa hasta el tamaño de la sentencia repitiendo el último fix (mismo valor, sin efecto)
+    n = 1 << (len(fixes) - 1).bit_length()
+    relleno = fixes + [fixes[-1]] * (n - len(fixes))
+    params = [v for f in relleno for v in (f.patente, f.latitud)]
+    params += [v for f in relleno for v in (f.patente, f.longitud)]
+    params += [f.patente for f in relleno]
+    with connection.cursor() as cursor:
+        cursor.execute(_sql_posiciones(connection.vendor, n), params)
+        actualizados = cursor.rowcount
+    if actualizados:
+        publicar_fixes(fixes)
+        espacial.actualizar(fixes)
+    return actualizados
+
+
+buffer_gps = BufferGPS()
+duplicados_gps = FiltroDuplicados()
+atexit.register(buffer_gps.vaciar)
@@ -0,0 +1,11 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class PBKDF2Configurable(PBKDF2PasswordHasher):
+    """Mismo formato pbkdf2_sha256 que usa la app móvil, con las iteraciones
+    tomadas de CREDENCIALES_ITERACIONES (ver el comando benchmark --solo pin)."""
+
+    @property
+    def iterations(self):
+        return settings.CREDENCIALES_ITERACIONES or PBKDF2PasswordHasher.iterations
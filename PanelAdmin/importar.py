@@ -0,0 +1,306 @@
+import csv
+import datetime
+import io
+import itertools
+import re
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import PIN_PENDIENTE, Usuario, Vehiculo, CargaCombustible, TerminoBusqueda
+from .busqueda import indexar
+from .credenciales import programar_pines, permitir_cambio
+from .cache_panel import invalidar
+from .resumenes import reconstruir
+from . import rendimiento
+
+
+# --- LECTURA DEL CSV ---
+def _lector(archivo):
+    # Se lee en streaming desde el archivo subido; Excel en español suele exportar con ';'
+    texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    encabezado = texto.readline()
+    delimitador = ';' if encabezado.count(';') > encabezado.count(',') else ','
+    lector = csv.reader(itertools.chain([encabezado], texto), delimiter=delimitador)
+    columnas = [c.strip().lower() for c in next(lector, [])]
+
+    def filas():
+        for fila in lector:
+            if any(v.strip() for v in fila):
+                yield lector.line_num, dict(zip(columnas, fila))
+    return columnas, filas()
+
+
+def _texto(fila, campo, obligatorio=True):
+    valor = (fila.get(campo) or '').strip()
+    if obligatorio and not valor:
+        raise ValueError(f"falta {campo}")
+    return valor
+
+
+MILES = re.compile(r'\d{1,3}(\.\d{3})+')
+
+
+def _entero(fila, campo):
+    valor = _texto(fila, campo).replace('$', '').replace(' ', '')
+    if MILES.fullmatch(valor):  # '15.000': punto de miles; '12.5' sigue siendo un error
+        valor = valor.replace('.', '')
+    try:
+        return int(valor)
+    except ValueError:
+        raise ValueError(f"{campo} no es un número entero")
+
+
+def _decimal(fila, campo):
+    try:
+        return float(_texto(fila, campo).replace(',', '.'))
+    except ValueError:
+        raise ValueError(f"{campo} no es un número")
+
+
+def _fecha(fila, campo):
+    valor = _texto(fila, campo)
+    for formato in ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y'):
+        try:
+            return datetime.datetime.strptime(valor, formato).date()
+        except ValueError:
+            pass
+    raise ValueError(f"{campo} inválida (use AAAA-MM-DD o DD/MM/AAAA)")
+
+
+def _hora(fila, campo):
+    valor = _texto(fila, campo)
+    for formato in ('%H:%M', '%H:%M:%S'):
+        try:
+            return datetime.datetime.strptime(valor, formato).time()
+        except ValueError:
+            pass
+    raise ValueError(f"{campo} inválida (use HH:MM)")
+
+
+# --- IMPORTACIONES ---
+class CupoExcedido(Exception):
+    """El archivo crea más PIN de los que el administrador puede cambiar en este minuto."""
+
+
+class Importacion:
+    """Valida y crea filas por lotes: cada lote hace una consulta por campo único
+    y un bulk_create. Las filas con error se informan y se omiten."""
+    modelo = None
+    columnas = ()
+    grupos_cache = ()
+
+    def __init__(self, usuario_admin=None):
+        self.usuario_admin = usuario_admin
+        self.creados = 0
+        self.errores = []  # (línea, mensaje)
+        self.vistos = set()
+        self.ahora = timezone.now()
+        self.lineas_lote = None  # (primera, última) del lote en curso, para informar un IntegrityError
+
+    def error(self, linea, mensaje):
+        self.errores.append((linea, mensaje))
+
+    def preparar(self, filas):
+        raise NotImplementedError
+
+    def despues_del_lote(self, objetos):
+        pass
+
+    def terminar(self):
+        pass
+
+    def ejecutar(self, archivo, simular=False):
+        columnas, filas = _lector(archivo)
+        faltantes = [c for c in self.columnas if c not in columnas]
+        if faltantes:
+            raise ValueError(f"Faltan columnas: {', '.join(faltantes)}")
+
+        with transaction.atomic():
+            lote = []
+            for linea, fila in filas:
+                lote.append((linea, fila))
+                if len(lote) >= settings.IMPORTAR_LOTE:
+                    self._procesar(lote)
+                    lote = []
+            if lote:
+                self._procesar(lote)
+            if simular:
+                transaction.set_rollback(True)
+            else:
+                self.terminar()
+        if not simular:
+            invalidar(*self.grupos_cache)
+        return self
+
+    def _procesar(self, lote):
+        self.lineas_lote = (lote[0][0], lote[-1][0])
+        objetos = self.preparar(lote)
+        self.modelo.objects.bulk_create(objetos, batch_size=settings.IMPORTAR_LOTE)
+        self.creados += len(objetos)
+        self.despues_del_lote(objetos)
+
+
+class ImportacionVehiculos(Importacion):
+    modelo = Vehiculo
+    columnas = ('patente', 'modelo', 'kilometraje')
+    grupos_cache = ('vehiculos',)
+
+    def preparar(self, filas):
+        candidatos = {}
+        for linea, fila in filas:
+            try:
+                patente = _texto(fila, 'patente').upper()
+                vehiculo = Vehiculo(
+                    patente=patente, modelo=_texto(fila, 'modelo'),
+                    kilometraje=_entero(fila, 'kilometraje'), fecha_creacion=self.ahora,
+                )
+            except ValueError as e:
+                self.error(linea, str(e))
+                continue
+            if patente in self.vistos or patente in candidatos:
+                self.error(linea, f"patente {patente} repetida en el archivo")
+                continue
+            candidatos[patente] = (linea, vehiculo)
+
+        existentes = set(Vehiculo.objects.filter(patente__in=candidatos).values_list('patente', flat=True))
+        self.vistos.update(candidatos)
+        nuevos = []
+        for patente, (linea, vehiculo) in candidatos.items():
+            if patente in existentes:
+                self.error(linea, f"la patente {patente} ya existe")
+            else:
+                nuevos.append(vehiculo)
+        return nuevos
+
+    def despues_del_lote(self, objetos):
+        # MySQL no devuelve los ids de un bulk_create: se leen para indexarlos
+        creados = Vehiculo.objects.filter(patente__in=[v.patente for v in objetos])
+        indexar(TerminoBusqueda.VEHICULO, creados)
+
+
+class ImportacionConductores(Importacion):
+    modelo = Usuario
+    columnas = ('nombre', 'rut', 'correo', 'pin')
+    grupos_cache = ('usuarios',)
+
+    def __init__(self, usuario_admin=None):
+        super().__init__(usuario_admin)
+        self.pines = {}  # correo -> PIN, hasta tener el id del usuario
+        self.por_hashear = []  # (id_usuario, PIN)
+
+    def preparar(self, filas):
+        candidatos = []
+        for linea, fila in filas:
+            try:
+                datos = {
+                    'nombre': _texto(fila, 'nombre'), 'rut': _texto(fila, 'rut').upper(),
+                    'correo': _texto(fila, 'correo').lower(), 'telefono': _texto(fila, 'telefono', False) or None,
+                    'pin': _texto(fila, 'pin'),
+                }
+            except ValueError as e:
+                self.error(linea, str(e))
+                continue
+            claves = {('rut', datos['rut']), ('correo', datos['correo'])}
+            repetida = claves & self.vistos
+            if repetida:
+                campo, valor = repetida.pop()
+                self.error(linea, f"{campo} {valor} repetido en el archivo")
+                continue
+            self.vistos |= claves
+            candidatos.append((linea, datos))
+
+        existentes = set()
+        for rut, correo in Usuario.objects.filter(
+            Q(rut__in=[d['rut'] for _, d in candidatos]) | Q(correo__in=[d['correo'] for _, d in candidatos])
+        ).values_list('rut', 'correo'):
+            existentes |= {('rut', rut), ('correo', correo)}
+        validos = []
+        for linea, datos in candidatos:
+            repetida = {('rut', datos['rut']), ('correo', datos['correo'])} & existentes
+            if repetida:
+                campo, valor = repetida.pop()
+                self.error(linea, f"ya existe un usuario con {campo} {valor}")
+            else:
+                validos.append(datos)
+
+        # Como al crear desde el panel: clave inutilizable hasta que el pool de credenciales escribe el hash
+        self.pines.update((d['correo'], d['pin']) for d in validos)
+        return [
+            Usuario(
+                nombre=datos['nombre'], rut=datos['rut'], correo=datos['correo'], telefono=datos['telefono'],
+                pin_hash=PIN_PENDIENTE, rol='CONDUCTOR', fecha_creacion=self.ahora,
+            ) for datos in validos
+        ]
+
+    def despues_del_lote(self, objetos):
+        # id_usuario lo asigna AUTO_INCREMENT; igual que con vehículos se leen para indexarlos
+        creados = list(Usuario.objects.filter(correo__in=[u.correo for u in objetos]))
+        indexar(TerminoBusqueda.USUARIO, creados)
+        self.por_hashear += [(u.id_usuario, self.pines.pop(u.correo)) for u in creados]
+
+    def terminar(self):
+        # Cada PIN importado cuenta como un cambio de clave del administrador; si no
+        # caben todos en el cupo del minuto se rechaza el archivo completo
+        if self.usuario_admin is not None and self.por_hashear:
+            espera = permitir_cambio(self.usuario_admin, len(self.por_hashear))
+            if espera:
+                raise CupoExcedido(
+                    f"El archivo crea {len(self.por_hashear)} conductores y el límite es de "
+                    f"{settings.CREDENCIALES_POR_MINUTO} cambios de clave por minuto. "
+                    f"Divida el archivo o intente en {espera} segundos."
+                )
+        # Los PIN se encolan recién con las filas confirmadas; un rollback no deja hashes pendientes
+        programar_pines(self.por_hashear)
+
+
+class ImportacionCargas(Importacion):
+    modelo = CargaCombustible
+    columnas = ('patente', 'litros', 'costo', 'fecha', 'hora')
+    grupos_cache = ('cargas', 'resumenes', 'rendimiento')
+
+    def __init__(self, usuario_admin=None):
+        super().__init__(usuario_admin)
+        self.desde = self.hasta = None
+        self.vehiculos = set()
+
+    def preparar(self, filas):
+        ids = dict(
+            Vehiculo.objects.filter(patente__in={_texto(f, 'patente', False).upper() for _, f in filas})
+            .values_list('patente', 'id_vehiculo')
+        )
+        nuevos = []
+        for linea, fila in filas:
+            try:
+                patente = _texto(fila, 'patente').upper()
+                if patente not in ids:
+                    raise ValueError(f"la patente {patente} no existe")
+                carga = CargaCombustible(
+                    vehiculo_id=ids[patente], litros=_decimal(fila, 'litros'), costo_total=_entero(fila, 'costo'),
+                    fecha=_fecha(fila, 'fecha'), hora=_hora(fila, 'hora'),
+                )
+                if carga.litros <= 0 or carga.costo_total <= 0:
+                    raise ValueError("litros y costo deben ser positivos")
+            except ValueError as e:
+                self.error(linea, str(e))
+                continue
+            self.vehiculos.add(carga.vehiculo_id)
+            self.desde = min(self.desde or carga.fecha, carga.fecha)
+            self.hasta = max(self.hasta or carga.fecha, carga.fecha)
+            nuevos.append(carga)
+        return nuevos
+
+    def terminar(self):
+        # bulk_create no dispara las señales del resumen diario ni del rendimiento
+        if self.desde:
+            reconstruir(self.desde, self.hasta)
+            rendimiento.recalcular({v: self.desde for v in self.vehiculos})
+
+
+IMPORTACIONES = {
+    'vehiculos': ImportacionVehiculos,
+    'conductores': ImportacionConductores,
+    'cargas': ImportacionCargas,
+}
@@ -0,0 +1,33 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from PanelAdmin.models import Recorrido, CargaCombustible
+from PanelAdmin import archivo
+
+
+class Command(BaseCommand):
+    help = (
+        "Mueve los viajes cerrados y las cargas más antiguos que ARCHIVO_RETENCION_DIAS a las tablas "
+        "de archivo (particionadas por mes en MySQL). Pensado para cron, p. ej. una vez por noche."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias', type=int, default=settings.ARCHIVO_RETENCION_DIAS,
+            help="Días que se quedan en Recorridos y CargaCombustible.",
+        )
+        parser.add_argument('--lote', type=int, default=settings.ARCHIVO_LOTE, help="Filas por transacción.")
+        parser.add_argument('--simular', action='store_true', help="Solo cuenta lo que se movería.")
+
+    def handle(self, *args, **options):
+        corte = timezone.localdate() - datetime.timedelta(days=options['dias'])
+        for modelo in (Recorrido, CargaCombustible):
+            tabla = modelo._meta.db_table
+            if options['simular']:
+                self.stdout.write(f"{tabla}: {archivo.pendientes(modelo, corte).count()} filas anteriores a {corte}.")
+                continue
+            movidas = archivo.archivar(modelo, corte, options['lote'])
+            self.stdout.write(self.style.SUCCESS(f"{tabla}: {movidas} filas archivadas (anteriores a {corte})."))
@@ -0,0 +1,263 @@
+import datetime
+import json
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from PanelAdmin.credenciales import esperar as esperar_credenciales
+from PanelAdmin.gps import buffer_gps
+from PanelAdmin.hashers import PBKDF2Configurable
+from PanelAdmin.models import Usuario, Vehiculo, Recorrido, CargaCombustible, TrabajoReporte, Dispositivo
+from PanelAdmin.dispositivos import emitir_token
+from PanelAdmin.reportes import renderizar_pdf
+from PanelAdmin.trayectos import procesar as procesar_trayectos
+from PanelAdmin.espacial import IndiceEspacial
+from PanelAdmin.despacho import asignar_min_costo, distancias_km
+from PanelAdmin.management.commands.generar_flota import es_flota_sintetica
+
+
+class Command(BaseCommand):
+    help = "Mide latencia y throughput de las vistas principales y la API GPS; escribe resultados en JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iteraciones', type=int, default=30)
+        parser.add_argument('--calentamiento', type=int, default=3)
+        parser.add_argument('--salida', help="Archivo JSON de resultados (por defecto solo se imprime).")
+        parser.add_argument('--comparar', help="JSON de una corrida anterior para mostrar diferencias.")
+        parser.add_argument(
+            '--solo', nargs='*',
+            help=(
+                "Escenarios a correr: gps, gps_lote, gps_sin_token, dashboard, reportes, reportes_filtrado, pdf, "
+                "pin, conductor_crear, trayectos, espacial_cercanos, espacial_radio, espacial_zona, despacho, "
+                "despacho_solver."
+            ),
+        )
+        parser.add_argument(
+            '--iteraciones-pin', type=int, nargs='*', default=[100_000, 300_000, 600_000],
+            help="Costos de PBKDF2 a comparar en el escenario pin (además del configurado).",
+        )
+
+    def handle(self, *args, **opts):
+        # Mueve posiciones de vehículos y crea conductores, un usuario y un dispositivo:
+        # igual que generar_flota, nunca sobre una base con datos reales
+        if not es_flota_sintetica():
+            raise CommandError("La base tiene datos que no vienen de generar_flota: use una base generada.")
+        patentes = list(Vehiculo.objects.values_list('patente', flat=True)[:5000])
+        if not patentes:
+            raise CommandError("No hay vehículos: ejecute primero generar_flota.")
+        self.rnd = random.Random(7)
+        self.patentes = patentes
+
+        self.client = Client()
+        usuario, usuario_creado = User.objects.get_or_create(username='benchmark', defaults={'is_staff': True})
+        self.client.force_login(usuario)
+        # Pasarela sin límite práctico: se mide la ingesta, no el limitador
+        dispositivo = Dispositivo(nombre='benchmark', fixes_por_segundo=10**9, rafaga=10**9)
+        self.token_gps = f"Bearer {emitir_token(dispositivo)}"
+        dispositivo.save()
+        try:
+            resultados = self.correr(opts)
+        finally:
+            buffer_gps.vaciar()
+            esperar_credenciales()
+            Usuario.objects.filter(correo__endswith='@benchmark.test').delete()
+            dispositivo.delete()
+            if usuario_creado:
+                usuario.delete()
+
+        informe = {
+            'commit': self.commit(), 'fecha': timezone.now().isoformat(),
+            'python': platform.python_version(), 'bd': connection.vendor,
+            'volumen': {
+                'vehiculos': Vehiculo.objects.count(),
+                'recorridos': Recorrido.objects.count(),
+                'cargas': CargaCombustible.objects.count(),
+            },
+            'iteraciones': opts['iteraciones'],
+            'resultados': resultados,
+        }
+        if opts['salida']:
+            with open(opts['salida'], 'w') as f:
+                json.dump(informe, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados en {opts['salida']}"))
+        if opts['comparar']:
+            self.comparar(opts['comparar'], resultados)
+
+    def correr(self, opts):
+        escenarios = {
+            'gps': self.gps,
+            'gps_lote': self.gps_lote,
+            'gps_sin_token': self.gps_sin_token,
+            'dashboard': lambda: self.client.get(reverse('panel_dashboard')),
+            'reportes': lambda: self.client.get(reverse('panel_reportes')),
+            'reportes_filtrado': self.reportes_filtrado,
+            'pdf': self.pdf,
+            'conductor_crear': self.conductor_crear,
+            'trayectos': self.trayectos,
+            'espacial_cercanos': lambda: self.indice_espacial().cercanos(*self._punto(), 10),
+            'espacial_radio': lambda: self.indice_espacial().en_radio(*self._punto(), 2000),
+            'espacial_zona': self.espacial_zona,
+            'despacho': lambda: self.client.get(reverse('api_despacho')),
+            'despacho_solver': self.despacho_solver,
+        }
+        # Un escenario por costo de hash: sirve para elegir CREDENCIALES_ITERACIONES
+        hasher = PBKDF2Configurable()
+        for n in sorted({hasher.iterations, *opts['iteraciones_pin']}):
+            escenarios[f'pin_{n}'] = lambda n=n: hasher.encode('1234', hasher.salt(), n)
+        if opts['solo']:
+            escenarios = {
+                k: v for k, v in escenarios.items()
+                if k in opts['solo'] or ('pin' in opts['solo'] and k.startswith('pin_'))
+            }
+
+        resultados = {}
+        # conductor_crear supera el límite de cambios de clave por administrador
+        with override_settings(CREDENCIALES_POR_MINUTO=10**9):
+            for nombre, funcion in escenarios.items():
+                resultados[nombre] = self.medir(funcion, opts['iteraciones'], opts['calentamiento'])
+                r = resultados[nombre]
+                self.stdout.write(
+                    f"{nombre:20} p50={r['p50_ms']:9.2f}ms p95={r['p95_ms']:9.2f}ms "
+                    f"{r['por_segundo']:9.1f}/s consultas={r['consultas_prom']:.1f}"
+                )
+        return resultados
+
+    # --- ESCENARIOS ---
+    def _fix(self):
+        return {
+            'patente': self.rnd.choice(self.patentes),
+            'latitud': round(-33.45 + self.rnd.uniform(-0.3, 0.3), 6),
+            'longitud': round(-70.66 + self.rnd.uniform(-0.3, 0.3), 6),
+        }
+
+    def gps(self):
+        return self.client.post(
+            reverse('api_gps_update'), json.dumps(self._fix()), content_type='application/json',
+            HTTP_AUTHORIZATION=self.token_gps,
+        )
+
+    def gps_lote(self):
+        lote = [self._fix() for _ in range(500)]
+        return self.client.post(
+            reverse('api_gps_batch'), json.dumps(lote), content_type='application/json',
+            HTTP_AUTHORIZATION=self.token_gps,
+        )
+
+    def gps_sin_token(self):
+        # Costo de rechazar a un cliente con token inválido (no debe tocar la BD)
+        return self.client.post(
+            reverse('api_gps_update'), json.dumps(self._fix()), content_type='application/json',
+            HTTP_AUTHORIZATION='Bearer invalido',
+        )
+
+    def reportes_filtrado(self):
+        desde = timezone.localdate() - datetime.timedelta(days=30)
+        return self.client.get(reverse('panel_reportes'), {'fecha_inicio': desde.isoformat()})
+
+    def pdf(self):
+        # Se mide la generación completa (la vista solo encola el trabajo)
+        desde = timezone.localdate() - datetime.timedelta(days=7)
+        trabajo = TrabajoReporte(filtros={'fecha_inicio': desde.isoformat()}, usuario_generador='benchmark')
+        with tempfile.NamedTemporaryFile(suffix='.pdf') as destino:
+            renderizar_pdf(trabajo, destino.name)
+
+    def conductor_crear(self):
+        # La latencia del request no debería depender del costo del hash (se calcula en segundo plano)
+        self.creados = getattr(self, 'creados', 0) + 1
+        return self.client.post(reverse('panel_conductores'), {
+            'accion': 'crear', 'nombre': f"Benchmark {self.creados}", 'rut': f"B{self.creados}-{time.time_ns() % 10**6}",
+            'correo': f"b{self.creados}-{time.time_ns()}@benchmark.test", 'telefono': '', 'password': '1234',
+        })
+
+    def trayectos(self):
+        # Solo el motor NumPy: 2000 viajes de 300 fixes sintéticos (con ruido y saltos) en una pasada
+        if not hasattr(self, '_trazas'):
+            rnd = np.random.default_rng(7)
+            viajes, puntos = 2000, 300
+            g = np.repeat(np.arange(viajes), puntos)
+            t = np.tile(np.arange(puntos) * 5.0, viajes) + g * 86400.0
+            lat = -33.45 + np.cumsum(rnd.normal(0, 1e-4, viajes * puntos))
+            lon = -70.66 + np.cumsum(rnd.normal(0, 1e-4, viajes * puntos))
+            saltos = rnd.random(viajes * puntos) < 0.002
+            lat[saltos] += 0.5
+            self._trazas = (t, lat, lon, g, viajes)
+        t, lat, lon, g, viajes = self._trazas
+        procesar_trayectos(t, lat, lon, g, viajes)
+
+    def indice_espacial(self):
+        # Flota sintética de 20.000 vehículos en el Gran Santiago, solo en memoria
+        if not hasattr(self, '_indice'):
+            self._indice = IndiceEspacial()
+            for i in range(20_000):
+                lat, lon = self._punto()
+                self._indice.registrar(Vehiculo(id_vehiculo=i, patente=f"SIM{i}", latitud=lat, longitud=lon))
+        return self._indice
+
+    def _punto(self):
+        return -33.45 + self.rnd.uniform(-0.3, 0.3), -70.66 + self.rnd.uniform(-0.3, 0.3)
+
+    def espacial_zona(self):
+        lat, lon = self._punto()
+        return self.indice_espacial().en_poligono([
+            (lat, lon), (lat + 0.02, lon + 0.005), (lat + 0.015, lon + 0.03), (lat - 0.005, lon + 0.02),
+        ])
+
+    def despacho_solver(self):
+        # Solo el algoritmo húngaro: 1000 conductores x 1000 vehículos repartidos en el Gran Santiago
+        if not hasattr(self, '_costos_despacho'):
+            rnd = np.random.default_rng(7)
+            lat = -33.45 + rnd.uniform(-0.3, 0.3, (2, 1000))
+            lon = -70.66 + rnd.uniform(-0.3, 0.3, (2, 1000))
+            self._costos_despacho = distancias_km(lat[0], lon[0], lat[1], lon[1]) + rnd.uniform(0, 20, 1000)[None, :]
+        asignar_min_costo(self._costos_despacho)
+
+    # --- MEDICION ---
+    def medir(self, funcion, iteraciones, calentamiento):
+        for _ in range(calentamiento):
+            funcion()
+        tiempos, consultas = [], []
+        for _ in range(iteraciones):
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                funcion()
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+            consultas.append(len(capturadas))
+        tiempos.sort()
+        return {
+            'p50_ms': round(statistics.median(tiempos), 3),
+            'p95_ms': round(tiempos[max(0, -(-len(tiempos) * 95 // 100) - 1)], 3),
+            'max_ms': round(tiempos[-1], 3),
+            'por_segundo': round(1000 * len(tiempos) / sum(tiempos), 2),
+            'consultas_prom': round(statistics.mean(consultas), 2),
+        }
+
+    def comparar(self, ruta, resultados):
+        with open(ruta) as f:
+            anterior = json.load(f)['resultados']
+        self.stdout.write(f"\nComparación con {ruta} (p50):")
+        for nombre, r in resultados.items():
+            if nombre in anterior:
+                antes = anterior[nombre]['p50_ms']
+                cambio = (r['p50_ms'] - antes) / antes * 100 if antes else 0
+                self.stdout.write(f"{nombre:20} {antes:9.2f}ms -> {r['p50_ms']:9.2f}ms ({cambio:+.1f}%)")
+
+    def commit(self):
+        try:
+            return subprocess.check_output(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, stderr=subprocess.DEVNULL,
+            ).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
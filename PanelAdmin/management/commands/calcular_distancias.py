@@ -0,0 +1,35 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from PanelAdmin.models import Recorrido
+from PanelAdmin.trayectos import recalcular
+
+
+class Command(BaseCommand):
+    help = "Calcula la distancia GPS y las paradas de los recorridos cerrados (DistanciasRecorrido)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=7, help="Recorridos de los últimos N días.")
+        parser.add_argument('--lote', type=int, default=1000)
+        parser.add_argument('--todos', action='store_true', help="Recalcula también los que ya están completos.")
+
+    def handle(self, *args, **options):
+        desde = timezone.localdate() - datetime.timedelta(days=options['dias'])
+        recorridos = Recorrido.objects.filter(fecha__gte=desde, hora_fin__isnull=False).order_by('id_recorrido')
+        if not options['todos']:
+            recorridos = recorridos.exclude(distancia_gps__completo=True)
+
+        total = con_gps = 0
+        lote = []
+        for recorrido in recorridos.iterator(chunk_size=options['lote']):
+            lote.append(recorrido)
+            if len(lote) >= options['lote']:
+                con_gps += sum(1 for r in recalcular(lote).values() if r.puntos)
+                total += len(lote)
+                lote = []
+        if lote:
+            con_gps += sum(1 for r in recalcular(lote).values() if r.puntos)
+            total += len(lote)
+        self.stdout.write(self.style.SUCCESS(f"{total} recorridos procesados, {con_gps} con puntos GPS."))
@@ -0,0 +1,33 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from PanelAdmin.models import CargaCombustible
+from PanelAdmin import rendimiento
+
+
+class Command(BaseCommand):
+    help = (
+        "Calcula km/L por carga, líneas base y alertas (RendimientoCargas). Por defecto solo las "
+        "cargas que aún no tienen cálculo, p. ej. las registradas por la app."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias', type=int,
+            help="Recalcula todas las cargas de los últimos N días (viajes editados o creados fuera del panel).",
+        )
+        parser.add_argument('--todo', action='store_true', help="Borra y recalcula el historial completo.")
+
+    def handle(self, *args, **options):
+        if options['todo']:
+            filas = rendimiento.reconstruir()
+        else:
+            desde_por_vehiculo = rendimiento.pendientes()
+            if options['dias'] is not None:
+                desde = timezone.localdate() - datetime.timedelta(days=options['dias'])
+                for id_vehiculo in CargaCombustible.objects.filter(fecha__gte=desde).values_list('vehiculo_id', flat=True).distinct():
+                    desde_por_vehiculo[id_vehiculo] = min(desde, desde_por_vehiculo.get(id_vehiculo, desde))
+            filas = rendimiento.recalcular(desde_por_vehiculo)
+        self.stdout.write(self.style.SUCCESS(f"{filas} cargas calculadas."))
@@ -0,0 +1,19 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from PanelAdmin.posiciones import compactar
+
+
+class Command(BaseCommand):
+    help = "Une los tramos de posiciones GPS de días cerrados en un único tramo por vehículo y día."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=7, help="Cuántos días hacia atrás revisar (sin contar hoy).")
+
+    def handle(self, *args, **options):
+        hoy = timezone.now().astimezone(datetime.timezone.utc).date()
+        desde = hoy - datetime.timedelta(days=options['dias'])
+        total = compactar(desde, hoy)
+        self.stdout.write(self.style.SUCCESS(f"{total} tramos compactados."))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from PanelAdmin.models import Vehiculo, Dispositivo
+from PanelAdmin.dispositivos import emitir_token
+
+
+class Command(BaseCommand):
+    help = (
+        "Registra un rastreador GPS (o rota el token de uno existente) e imprime su token. "
+        "El token no se guarda: solo se muestra esta vez."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('nombre', nargs='?', help="Nombre del dispositivo nuevo.")
+        parser.add_argument('--patente', help="Vehículo al que reporta; sin patente es una pasarela de varias.")
+        parser.add_argument('--fixes-por-segundo', type=float)
+        parser.add_argument('--rafaga', type=int)
+        parser.add_argument('--rotar', type=int, metavar='ID', help="Rota el token del dispositivo con este id.")
+
+    def handle(self, *args, **opts):
+        if opts['rotar']:
+            dispositivo = Dispositivo.objects.filter(id=opts['rotar']).first()
+            if dispositivo is None:
+                raise CommandError(f"No existe el dispositivo {opts['rotar']}.")
+        elif opts['nombre']:
+            vehiculo = None
+            if opts['patente']:
+                vehiculo = Vehiculo.objects.filter(patente=opts['patente'].upper().strip()).first()
+                if vehiculo is None:
+                    raise CommandError(f"No existe la patente {opts['patente']}.")
+            dispositivo = Dispositivo(
+                nombre=opts['nombre'], vehiculo=vehiculo,
+                fixes_por_segundo=opts['fixes_por_segundo'], rafaga=opts['rafaga'],
+            )
+        else:
+            raise CommandError("Indique el nombre de un dispositivo nuevo o --rotar ID.")
+
+        token = emitir_token(dispositivo)
+        dispositivo.save()
+        self.stdout.write(self.style.SUCCESS(f"Dispositivo {dispositivo.id} ({dispositivo.nombre})"))
+        self.stdout.write(token)
@@ -0,0 +1,88 @@
+import statistics
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from PanelAdmin.credenciales import esperar as esperar_credenciales
+from PanelAdmin.models import Usuario
+
+
+class Command(BaseCommand):
+    help = (
+        "Crea conductores en paralelo a través de panel_conductores y verifica que no haya "
+        "colisiones de id ni crecimiento del costo por inserción."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8)
+        parser.add_argument('--por-hilo', type=int, default=50)
+        parser.add_argument('--conservar', action='store_true', help="No borra los conductores creados.")
+
+    def handle(self, *args, **opts):
+        hilos, por_hilo = opts['hilos'], opts['por_hilo']
+        admin, _ = User.objects.get_or_create(username='estres', defaults={'is_staff': True})
+        dominio = f"estres{time.time_ns()}.test"
+        mediciones, fallas = [], []
+        lock = threading.Lock()
+        partida = threading.Barrier(hilos)
+
+        def trabajador(n):
+            client = Client()
+            client.force_login(admin)
+            partida.wait()
+            try:
+                for i in range(por_hilo):
+                    with CaptureQueriesContext(connection) as consultas:
+                        inicio = time.perf_counter()
+                        resp = client.post(reverse('panel_conductores'), {
+                            'accion': 'crear', 'nombre': f"Estrés {n}-{i}", 'rut': f"{n}{i:06d}-E",
+                            'correo': f"c{n}-{i}@{dominio}", 'telefono': '', 'password': '1234',
+                        })
+                        fin = time.perf_counter()
+                    with lock:
+                        mediciones.append((fin, (fin - inicio) * 1000, len(consultas)))
+                        if resp.status_code != 302:
+                            fallas.append(resp.status_code)
+            finally:
+                connection.close()
+
+        # Se mide la asignación de ids: sin costo de PBKDF2 ni límite de cambios de clave
+        with override_settings(CREDENCIALES_ITERACIONES=1, CREDENCIALES_POR_MINUTO=10**9):
+            hebras = [threading.Thread(target=trabajador, args=(n,)) for n in range(hilos)]
+            inicio = time.perf_counter()
+            for h in hebras:
+                h.start()
+            for h in hebras:
+                h.join()
+            total_s = time.perf_counter() - inicio
+            esperar_credenciales()
+
+        creados = Usuario.objects.filter(correo__endswith=f"@{dominio}")
+        ids = list(creados.values_list('id_usuario', flat=True))
+        esperados = hilos * por_hilo
+        colisiones = esperados - len(set(ids))
+
+        # Latencia por orden de término: el primer y el último décimo deberían ser parecidos
+        mediciones.sort()
+        decimo = max(1, len(mediciones) // 10)
+        primeros = statistics.median(m[1] for m in mediciones[:decimo])
+        ultimos = statistics.median(m[1] for m in mediciones[-decimo:])
+        self.stdout.write(
+            f"{esperados} creaciones en {total_s:.2f}s con {hilos} hilos ({esperados / total_s:.1f}/s)\n"
+            f"  creados: {len(ids)}  perdidos por colisión o error: {colisiones}  respuestas no 302: {len(fallas)}\n"
+            f"  consultas por inserción: {statistics.mean(m[2] for m in mediciones):.1f} "
+            f"(máx {max(m[2] for m in mediciones)})\n"
+            f"  mediana primer 10%: {primeros:.2f}ms  último 10%: {ultimos:.2f}ms"
+        )
+
+        if not opts['conservar']:
+            creados.delete()
+        if colisiones or fallas:
+            raise CommandError(f"{colisiones} colisiones, {len(fallas)} respuestas inesperadas.")
+        self.stdout.write(self.style.SUCCESS("Sin colisiones."))
@@ -0,0 +1,147 @@
+import datetime
+import random
+
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from PanelAdmin.hashers import PBKDF2Configurable
+from PanelAdmin.models import Usuario, Vehiculo, Recorrido, CargaCombustible
+from PanelAdmin.resumenes import reconstruir
+from PanelAdmin.busqueda import reindexar
+from PanelAdmin import rendimiento
+
+MODELOS = ('Toyota Hilux', 'Chevrolet N300', 'Hyundai H100', 'Mercedes Sprinter', 'Peugeot Partner', 'Kia Frontier')
+COMUNAS = ('Santiago', 'Maipú', 'Puente Alto', 'Ñuñoa', 'Providencia', 'Quilicura', 'San Bernardo', 'La Florida')
+
+
+def es_flota_sintetica():
+    """True si todos los vehículos y usuarios de la base son generados (este comando o el benchmark)."""
+    return not (
+        Vehiculo.objects.exclude(patente__regex=r'^BM[0-9]{6}$').exists()
+        or Usuario.objects.exclude(correo__endswith='@flota.test').exclude(correo__endswith='@benchmark.test').exists()
+    )
+
+
+class Command(BaseCommand):
+    help = "Genera una flota sintética (vehículos, conductores, recorridos y cargas) para benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vehiculos', type=int, default=5000)
+        parser.add_argument('--conductores', type=int, default=6000)
+        parser.add_argument('--recorridos', type=int, default=2_000_000)
+        parser.add_argument('--cargas', type=int, default=1_000_000)
+        parser.add_argument('--dias', type=int, default=730, help="Días de historia hacia atrás.")
+        parser.add_argument('--lote', type=int, default=5000)
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument(
+            '--crear-tablas', action='store_true',
+            help="Crea las tablas no administradas si faltan (solo para bases locales de prueba).",
+        )
+
+    def handle(self, *args, **opts):
+        if opts['crear_tablas']:
+            self.crear_tablas()
+        if Vehiculo.objects.exists():
+            raise CommandError("La base ya tiene vehículos: use una base vacía para no mezclar datos reales.")
+
+        self.rnd = random.Random(opts['semilla'])
+        self.lote = opts['lote']
+        self.hoy = timezone.localdate()
+        self.dias = opts['dias']
+
+        ids_conductores = self.generar_conductores(opts['conductores'])
+        ids_vehiculos = self.generar_vehiculos(opts['vehiculos'], ids_conductores)
+        self.generar_recorridos(opts['recorridos'], ids_vehiculos, ids_conductores)
+        self.generar_cargas(opts['cargas'], ids_vehiculos)
+
+        filas = reconstruir()
+        reindexar()  # bulk_create no dispara las señales que mantienen el índice
+        rendimiento.reconstruir()
+        self.stdout.write(self.style.SUCCESS(f"Flota generada. {filas} filas de resumen diario."))
+
+    def crear_tablas(self):
+        existentes = set(connection.introspection.table_names())
+        with connection.schema_editor() as editor:
+            for modelo in apps.get_app_config('PanelAdmin').get_models():
+                if not modelo._meta.managed and modelo._meta.db_table not in existentes:
+                    editor.create_model(modelo)
+
+    def _insertar(self, modelo, objetos, total, nombre):
+        creados, buffer = 0, []
+        for obj in objetos:
+            buffer.append(obj)
+            if len(buffer) >= self.lote:
+                with transaction.atomic():
+                    modelo.objects.bulk_create(buffer)
+                creados += len(buffer)
+                buffer = []
+                self.stdout.write(f"  {nombre}: {creados}/{total}", ending='\r')
+        if buffer:
+            with transaction.atomic():
+                modelo.objects.bulk_create(buffer)
+            creados += len(buffer)
+        self.stdout.write(f"  {nombre}: {creados}/{total}")
+
+    def _fecha(self):
+        return self.hoy - datetime.timedelta(days=self.rnd.randrange(self.dias))
+
+    def _hora(self, desde=6, hasta=22):
+        return datetime.time(self.rnd.randrange(desde, hasta), self.rnd.randrange(60))
+
+    def generar_conductores(self, total):
+        # Un solo hash para todos: el costo de PBKDF2 no es lo que se mide aquí
+        pin = make_password('1234', hasher=PBKDF2Configurable())
+        ahora = timezone.now()
+        self._insertar(Usuario, (
+            Usuario(
+                nombre=f"Conductor {i}", correo=f"conductor{i}@flota.test",
+                telefono=f"+569{self.rnd.randrange(10**7, 10**8)}", rut=f"{10_000_000 + i}-{i % 10}",
+                pin_hash=pin, rol='CONDUCTOR', fecha_creacion=ahora,
+            ) for i in range(1, total + 1)
+        ), total, 'conductores')
+        return list(
+            Usuario.objects.filter(correo__endswith='@flota.test').order_by('id_usuario')
+            .values_list('id_usuario', flat=True)
+        )
+
+    def generar_vehiculos(self, total, ids_conductores):
+        ahora = timezone.now()
+        self._insertar(Vehiculo, (
+            Vehiculo(
+                patente=f"BM{i:06d}", modelo=self.rnd.choice(MODELOS),
+                conductor_id=ids_conductores[i - 1] if i <= len(ids_conductores) else None,
+                kilometraje=self.rnd.randrange(1000, 300_000), fecha_creacion=ahora,
+                latitud=round(-33.45 + self.rnd.uniform(-0.3, 0.3), 6),
+                longitud=round(-70.66 + self.rnd.uniform(-0.3, 0.3), 6),
+            ) for i in range(1, total + 1)
+        ), total, 'vehículos')
+        return list(Vehiculo.objects.values_list('id_vehiculo', flat=True))
+
+    def generar_recorridos(self, total, ids_vehiculos, ids_conductores):
+        def recorridos():
+            for i in range(total):
+                km_inicio = self.rnd.randrange(1000, 300_000)
+                abierto = i < len(ids_vehiculos) // 20  # ~5% de la flota en ruta
+                yield Recorrido(
+                    conductor_id=self.rnd.choice(ids_conductores), vehiculo_id=self.rnd.choice(ids_vehiculos),
+                    fecha=self.hoy if abierto else self._fecha(), hora_inicio=self._hora(6, 14),
+                    hora_fin=None if abierto else self._hora(14, 22),
+                    kilometraje_inicio=km_inicio,
+                    kilometraje_fin=None if abierto else km_inicio + self.rnd.randrange(5, 400),
+                    ubicacion_inicio_txt=self.rnd.choice(COMUNAS), ubicacion_fin_txt=self.rnd.choice(COMUNAS),
+                )
+        self._insertar(Recorrido, recorridos(), total, 'recorridos')
+
+    def generar_cargas(self, total, ids_vehiculos):
+        def cargas():
+            for _ in range(total):
+                litros = round(self.rnd.uniform(15, 80), 2)
+                yield CargaCombustible(
+                    vehiculo_id=self.rnd.choice(ids_vehiculos), litros=litros,
+                    costo_total=int(litros * self.rnd.uniform(1100, 1400)),
+                    fecha=self._fecha(), hora=self._hora(),
+                )
+        self._insertar(CargaCombustible, cargas(), total, 'cargas')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from PanelAdmin.importar import IMPORTACIONES
+
+
+class Command(BaseCommand):
+    help = "Importa vehículos, conductores o cargas de combustible desde un CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=sorted(IMPORTACIONES))
+        parser.add_argument('archivo')
+        parser.add_argument('--simular', action='store_true', help="Valida todo y deshace la transacción al final.")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['archivo'], 'rb') as archivo:
+                resultado = IMPORTACIONES[options['tipo']]().ejecutar(archivo, simular=options['simular'])
+        except (OSError, ValueError, UnicodeDecodeError) as e:
+            raise CommandError(str(e))
+
+        for linea, mensaje in resultado.errores:
+            self.stderr.write(f"  línea {linea}: {mensaje}")
+        accion = "validadas (simulación)" if options['simular'] else "importadas"
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado.creados} filas {accion}, {len(resultado.errores)} con errores."
+        ))
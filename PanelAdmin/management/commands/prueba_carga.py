@@ -0,0 +1,211 @@
+import asyncio
+import datetime
+import io
+import json
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from PanelAdmin.dispositivos import emitir_token
+from PanelAdmin.gps import buffer_gps
+from PanelAdmin.models import Vehiculo, Dispositivo
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga de la ingesta GPS y la API v1 llamando directamente a los handlers WSGI "
+        "(un hilo por conexión, como gunicorn con threads) y ASGI (un event loop, como uvicorn). "
+        "No incluye la red: mide lo que cuesta cada request dentro del worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modo', choices=['wsgi', 'asgi', 'ambos'], default='ambos')
+        parser.add_argument('--escenarios', nargs='*', default=['gps', 'gps_lote', 'api'], help="gps, gps_lote, api.")
+        parser.add_argument('--peticiones', type=int, default=3000)
+        parser.add_argument('--hilos', type=int, default=16, help="Conexiones simultáneas en WSGI (hilos del worker).")
+        parser.add_argument('--concurrencia', type=int, default=1000, help="Conexiones simultáneas en ASGI.")
+        parser.add_argument(
+            '--latencia-bd-ms', type=float, default=0,
+            help="Espera agregada a cada consulta para simular una BD remota (p. ej. MySQL con TLS).",
+        )
+        parser.add_argument('--salida', help="Archivo JSON de resultados.")
+
+    def handle(self, *args, **opts):
+        self.patentes = list(Vehiculo.objects.values_list('patente', flat=True)[:5000])
+        if not self.patentes:
+            raise CommandError("No hay vehículos: ejecute primero generar_flota.")
+        self.rnd = random.Random(7)
+        self.host = next((h.lstrip('.') for h in settings.ALLOWED_HOSTS if h != '*'), 'localhost')
+
+        dispositivo = Dispositivo(nombre='prueba_carga', fixes_por_segundo=10**9, rafaga=10**9)
+        self.token = f"Bearer {emitir_token(dispositivo)}"
+        dispositivo.save()
+        usuario, _ = User.objects.get_or_create(username='prueba_carga', defaults={'is_staff': True})
+        client = Client()
+        client.force_login(usuario)
+        self.cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        self.ts = timezone.now() - datetime.timedelta(minutes=1)
+
+        if opts['latencia_bd_ms']:
+            self._simular_latencia(opts['latencia_bd_ms'] / 1000)
+
+        modos = ['wsgi', 'asgi'] if opts['modo'] == 'ambos' else [opts['modo']]
+        resultados = {}
+        try:
+            for escenario in opts['escenarios']:
+                for modo in modos:
+                    peticiones = [self.peticion(escenario) for _ in range(opts['peticiones'])]
+                    if modo == 'wsgi':
+                        r = self.medir_wsgi(peticiones, opts['hilos'])
+                    else:
+                        r = asyncio.run(self.medir_asgi(peticiones, opts['concurrencia']))
+                    resultados[f"{escenario}_{modo}"] = r
+                    self.stdout.write(
+                        f"{escenario:9} {modo:5} {r['por_segundo']:9.1f}/s p50={r['p50_ms']:8.2f}ms "
+                        f"p95={r['p95_ms']:8.2f}ms p99={r['p99_ms']:8.2f}ms errores={r['errores']}"
+                    )
+                    buffer_gps.vaciar()
+        finally:
+            dispositivo.delete()
+            if opts['latencia_bd_ms']:
+                connection_created.disconnect(self._instalar_latencia)
+
+        if opts['salida']:
+            with open(opts['salida'], 'w') as f:
+                json.dump({'opciones': {k: v for k, v in opts.items() if k in (
+                    'peticiones', 'hilos', 'concurrencia', 'latencia_bd_ms')}, 'resultados': resultados}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados en {opts['salida']}"))
+
+    # --- PETICIONES ---
+    def _fix(self):
+        # ts distintos y crecientes: ningún fix se descarta como duplicado
+        self.ts += datetime.timedelta(microseconds=1)
+        return {
+            'patente': self.rnd.choice(self.patentes), 'ts': self.ts.isoformat(),
+            'latitud': round(-33.45 + self.rnd.uniform(-0.3, 0.3), 6),
+            'longitud': round(-70.66 + self.rnd.uniform(-0.3, 0.3), 6),
+        }
+
+    def peticion(self, escenario):
+        if escenario == 'gps':
+            return 'POST', reverse('api_gps_update'), '', json.dumps(self._fix()).encode(), self.token
+        if escenario == 'gps_lote':
+            lote = [self._fix() for _ in range(50)]
+            return 'POST', reverse('api_gps_batch'), '', json.dumps(lote).encode(), self.token
+        if escenario == 'api':
+            return 'GET', reverse('api_v1_listado', args=['vehiculos']), 'limite=100', b'', None
+        raise CommandError(f"Escenario desconocido: {escenario}")
+
+    # --- WSGI: un hilo bloqueado por request ---
+    def medir_wsgi(self, peticiones, hilos):
+        handler = WSGIHandler()
+        latencias, errores = [], []
+
+        def una(peticion):
+            metodo, ruta, query, cuerpo, token = peticion
+            environ = {
+                'REQUEST_METHOD': metodo, 'PATH_INFO': ruta, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+                'SERVER_NAME': self.host, 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': self.host, 'REMOTE_ADDR': '127.0.0.1', 'HTTP_COOKIE': self.cookie,
+                'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(cuerpo)),
+                'wsgi.input': io.BytesIO(cuerpo), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+                'wsgi.version': (1, 0), 'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+            }
+            if token:
+                environ['HTTP_AUTHORIZATION'] = token
+            estado = []
+            inicio = time.perf_counter()
+            respuesta = handler(environ, lambda status, headers, exc_info=None: estado.append(status))
+            b''.join(respuesta)
+            respuesta.close()
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            if int(estado[0].split()[0]) >= 400:
+                errores.append(estado[0])
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+            list(ejecutor.map(una, peticiones))
+        return self._resumen(latencias, errores, time.perf_counter() - inicio)
+
+    # --- ASGI: todas las conexiones en un event loop ---
+    async def medir_asgi(self, peticiones, concurrencia):
+        application = get_asgi_application()
+        latencias, errores = [], []
+        cupos = asyncio.Semaphore(concurrencia)
+
+        async def una(peticion):
+            metodo, ruta, query, cuerpo, token = peticion
+            encabezados = [
+                (b'host', self.host.encode()), (b'content-type', b'application/json'),
+                (b'content-length', str(len(cuerpo)).encode()), (b'cookie', self.cookie.encode()),
+            ]
+            if token:
+                encabezados.append((b'authorization', token.encode()))
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': metodo,
+                'scheme': 'http', 'path': ruta, 'raw_path': ruta.encode(), 'query_string': query.encode(),
+                'root_path': '', 'headers': encabezados, 'client': ('127.0.0.1', 50000), 'server': (self.host, 80),
+            }
+            terminado = asyncio.Event()
+            enviado = False
+            estado = []
+
+            async def receive():
+                nonlocal enviado
+                if not enviado:
+                    enviado = True
+                    return {'type': 'http.request', 'body': cuerpo, 'more_body': False}
+                await terminado.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(mensaje):
+                if mensaje['type'] == 'http.response.start':
+                    estado.append(mensaje['status'])
+                elif not mensaje.get('more_body'):
+                    terminado.set()
+
+            async with cupos:
+                inicio = time.perf_counter()
+                await application(scope, receive, send)
+                latencias.append((time.perf_counter() - inicio) * 1000)
+            if estado[0] >= 400:
+                errores.append(estado[0])
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(una(p) for p in peticiones))
+        return self._resumen(latencias, errores, time.perf_counter() - inicio)
+
+    # --- AUXILIARES ---
+    def _resumen(self, latencias, errores, total_s):
+        cuantiles = statistics.quantiles(latencias, n=100)
+        return {
+            'peticiones': len(latencias), 'por_segundo': round(len(latencias) / total_s, 1),
+            'p50_ms': round(cuantiles[49], 2), 'p95_ms': round(cuantiles[94], 2), 'p99_ms': round(cuantiles[98], 2),
+            'errores': len(errores), 'primer_error': str(errores[0]) if errores else None,
+        }
+
+    def _simular_latencia(self, segundos):
+        def lento(execute, sql, params, many, context):
+            time.sleep(segundos)  # libera el GIL, como esperar la respuesta de la red
+            return execute(sql, params, many, context)
+        self._lento = lento
+        connection_created.connect(self._instalar_latencia)
+        # Conexiones ya abiertas en este hilo
+        self._instalar_latencia(connection=connection)
+
+    def _instalar_latencia(self, sender=None, connection=None, **kwargs):
+        if self._lento not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, self._lento)
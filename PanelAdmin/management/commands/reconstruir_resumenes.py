@@ -0,0 +1,26 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from PanelAdmin.resumenes import reconstruir
+
+
+class Command(BaseCommand):
+    help = "Recalcula la tabla ResumenDiario desde Recorridos y CargaCombustible."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=datetime.date.fromisoformat, help="Fecha inicial (AAAA-MM-DD).")
+        parser.add_argument('--hasta', type=datetime.date.fromisoformat, help="Fecha final (AAAA-MM-DD).")
+        parser.add_argument(
+            '--dias', type=int,
+            help="Atajo para recalcular solo los últimos N días (útil en cron para los viajes creados por la app).",
+        )
+
+    def handle(self, *args, **options):
+        desde, hasta = options['desde'], options['hasta']
+        if options['dias'] is not None:
+            desde = timezone.localdate() - datetime.timedelta(days=options['dias'])
+
+        filas = reconstruir(desde, hasta)
+        self.stdout.write(self.style.SUCCESS(f"{filas} filas de resumen generadas."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from PanelAdmin.busqueda import reindexar
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice de búsqueda y los roles normalizados de usuarios y vehículos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        cantidades = reindexar(options['lote'])
+        for modelo, total in cantidades.items():
+            self.stdout.write(f"  {modelo}: {total}")
+        self.stdout.write(self.style.SUCCESS("Índice de búsqueda reconstruido."))
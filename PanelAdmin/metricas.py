@@ -0,0 +1,181 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.template.backends.django import Template
+
+logger = logging.getLogger(__name__)
+
+
+class PresupuestoExcedido(AssertionError):
+    pass
+
+
+def presupuesto_consultas(maximo):
+    # Declara cuántas consultas SQL puede hacer una vista (ver MetricasMiddleware)
+    def decorador(vista):
+        vista.presupuesto_consultas = maximo
+        return vista
+    return decorador
+
+
+# --- REGISTRO EN MEMORIA ---
+class RegistroMetricas:
+    """Buffer circular por vista con las últimas N mediciones."""
+
+    def __init__(self, muestras=None):
+        self.muestras = muestras or settings.METRICAS_MUESTRAS
+        self._datos = defaultdict(lambda: deque(maxlen=self.muestras))
+        self._excedidos = defaultdict(int)
+        self._presupuestos = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, vista, medicion, presupuesto=None):
+        with self._lock:
+            self._datos[vista].append(medicion)
+            if presupuesto is not None:
+                self._presupuestos[vista] = presupuesto
+                if medicion['consultas'] > presupuesto:
+                    self._excedidos[vista] += 1
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self._excedidos.clear()
+
+    def resumen(self):
+        with self._lock:
+            copia = {vista: list(datos) for vista, datos in self._datos.items()}
+        return {
+            vista: {
+                'muestras': len(datos),
+                'consultas_p50': _percentil([d['consultas'] for d in datos], 50),
+                'consultas_max': max(d['consultas'] for d in datos),
+                'presupuesto': self._presupuestos.get(vista),
+                'excedidos': self._excedidos.get(vista, 0),
+                **{
+                    f'{campo}_p{p}': round(_percentil([d[campo] for d in datos], p), 2)
+                    for campo in ('total_ms', 'db_ms', 'template_ms') for p in (50, 95)
+                },
+            }
+            for vista, datos in copia.items()
+        }
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = max(0, -(-len(ordenados) * p // 100) - 1)  # rango más cercano
+    return ordenados[indice]
+
+
+registro = RegistroMetricas()
+
+
+# --- TIEMPO DE TEMPLATES ---
+_medicion_actual = contextvars.ContextVar('medicion_actual', default=None)
+_render_original = Template.render
+
+
+def _render_medido(self, *args, **kwargs):
+    medicion = _medicion_actual.get()
+    if medicion is None:
+        return _render_original(self, *args, **kwargs)
+    inicio = time.perf_counter()
+    try:
+        return _render_original(self, *args, **kwargs)
+    finally:
+        medicion['template_ms'] += (time.perf_counter() - inicio) * 1000
+
+
+Template.render = _render_medido
+
+
+# --- CONTEO DE CONSULTAS ---
+def _contar(execute, sql, params, many, context):
+    medicion = _medicion_actual.get()
+    if medicion is None:  # hilos de fondo, comandos
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicion['consultas'] += 1
+        medicion['db_ms'] += (time.perf_counter() - inicio) * 1000
+
+
+def _instalar_contador(sender=None, connection=connection, **kwargs):
+    # En cada conexión de cada hilo: bajo ASGI las consultas no ocurren en el hilo
+    # del middleware (vistas síncronas en el hilo de asgiref, vistas async en el
+    # pool), pero comparten el contexto del request y por eso su medición.
+    if _contar not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_contar)
+
+
+connection_created.connect(_instalar_contador)
+
+
+# --- MIDDLEWARE ---
+class MetricasMiddleware:
+    """
+    Mide por request: número de consultas, tiempo en BD, tiempo de templates y
+    latencia total. Si la vista declaró presupuesto_consultas y se pasa, lo
+    registra; con METRICAS_PRESUPUESTO_ESTRICTO (tests) además levanta error.
+    Bajo ASGI corre en el event loop; las consultas se cuentan en el hilo que
+    las hace (ver _instalar_contador).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        medicion = {'consultas': 0, 'db_ms': 0.0, 'template_ms': 0.0, 'total_ms': 0.0}
+        token = _medicion_actual.set(medicion)
+        inicio = time.perf_counter()
+        _instalar_contador()  # conexión abierta antes de cargar este módulo
+        try:
+            response = self.get_response(request)
+        finally:
+            _medicion_actual.reset(token)
+        medicion['total_ms'] = (time.perf_counter() - inicio) * 1000
+        return self._registrar(request, response, medicion)
+
+    async def __acall__(self, request):
+        medicion = {'consultas': 0, 'db_ms': 0.0, 'template_ms': 0.0, 'total_ms': 0.0}
+        token = _medicion_actual.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _medicion_actual.reset(token)
+        medicion['total_ms'] = (time.perf_counter() - inicio) * 1000
+        return self._registrar(request, response, medicion)
+
+    def _registrar(self, request, response, medicion):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return response
+        presupuesto = getattr(match.func, 'presupuesto_consultas', None)
+        registro.registrar(match.view_name, medicion, presupuesto)
+
+        response['Server-Timing'] = (
+            f"db;dur={medicion['db_ms']:.1f}, tpl;dur={medicion['template_ms']:.1f}, "
+            f"total;dur={medicion['total_ms']:.1f}"
+        )
+        if presupuesto is not None and medicion['consultas'] > presupuesto:
+            mensaje = f"{match.view_name}: {medicion['consultas']} consultas (presupuesto {presupuesto})"
+            if settings.METRICAS_PRESUPUESTO_ESTRICTO:
+                raise PresupuestoExcedido(mensaje)
+            logger.warning(mensaje)
+        return response
@@ -0,0 +1,95 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CargaCombustible',
+            fields=[
+                ('id_carga', models.AutoField(primary_key=True, serialize=False)),
+                ('litros', models.FloatField()),
+                ('costo_total', models.IntegerField()),
+                ('fecha', models.DateField()),
+                ('hora', models.TimeField()),
+            ],
+            options={
+                'db_table': 'CargaCombustible',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Recorrido',
+            fields=[
+                ('id_recorrido', models.AutoField(primary_key=True, serialize=False)),
+                ('fecha', models.DateField()),
+                ('hora_inicio', models.TimeField()),
+                ('hora_fin', models.TimeField(blank=True, null=True)),
+                ('kilometraje_inicio', models.IntegerField(blank=True, null=True)),
+                ('kilometraje_fin', models.IntegerField(blank=True, null=True)),
+                ('ubicacion_inicio_txt', models.CharField(blank=True, max_length=255, null=True)),
+                ('ubicacion_fin_txt', models.CharField(blank=True, max_length=255, null=True)),
+            ],
+            options={
+                'db_table': 'Recorridos',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Usuario',
+            fields=[
+                ('id_usuario', models.AutoField(primary_key=True, serialize=False)),
+                ('nombre', models.CharField(max_length=100)),
+                ('correo', models.CharField(max_length=100, unique=True)),
+                ('telefono', models.CharField(blank=True, max_length=20, null=True)),
+                ('rut', models.CharField(blank=True, max_length=15, null=True, unique=True)),
+                ('pin_hash', models.CharField(max_length=255)),
+                ('rol', models.CharField(blank=True, max_length=50, null=True)),
+                ('fecha_creacion', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'Usuarios',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Vehiculo',
+            fields=[
+                ('id_vehiculo', models.AutoField(primary_key=True, serialize=False)),
+                ('patente', models.CharField(max_length=20, unique=True)),
+                ('modelo', models.CharField(max_length=100)),
+                ('kilometraje', models.IntegerField()),
+                ('fecha_creacion', models.DateTimeField(blank=True, null=True)),
+                ('latitud', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('longitud', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+            ],
+            options={
+                'db_table': 'Vehiculos',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TramoPosiciones',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('ts_inicio', models.DateTimeField()),
+                ('ts_fin', models.DateTimeField()),
+                ('cantidad', models.PositiveIntegerField()),
+                ('puntos', models.BinaryField()),
+                ('vehiculo', models.ForeignKey(db_column='id_vehiculo', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='PanelAdmin.vehiculo')),
+            ],
+            options={
+                'db_table': 'PosicionesTramos',
+                'indexes': [models.Index(fields=['vehiculo', 'dia', 'ts_inicio'], name='pos_vehiculo_dia_idx')],
+            },
+        ),
+    ]
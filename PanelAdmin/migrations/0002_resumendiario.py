@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PanelAdmin', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('km', models.BigIntegerField(default=0)),
+                ('litros', models.FloatField(default=0)),
+                ('costo', models.BigIntegerField(default=0)),
+                ('viajes', models.PositiveIntegerField(default=0)),
+                ('cargas', models.PositiveIntegerField(default=0)),
+                ('vehiculo', models.ForeignKey(db_column='id_vehiculo', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='PanelAdmin.vehiculo')),
+            ],
+            options={
+                'db_table': 'ResumenDiario',
+                'indexes': [models.Index(fields=['dia'], name='resumen_dia_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='resumendiario',
+            constraint=models.UniqueConstraint(fields=('vehiculo', 'dia'), name='resumen_vehiculo_dia_uniq'),
+        ),
+    ]
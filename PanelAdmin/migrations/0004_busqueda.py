@@ -0,0 +1,87 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:50
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Copia de la normalización de PanelAdmin/busqueda.py al momento de esta migración:
+# una migración no importa código vivo, que puede cambiar después
+def _normalizar(texto):
+    texto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def _terminos(*campos):
+    terminos = set()
+    for campo in campos:
+        if not campo:
+            continue
+        terminos.update(p[:64] for p in re.split(r'[^a-z0-9]+', _normalizar(campo)) if p)
+        terminos.add(re.sub(r'[^a-z0-9]', '', _normalizar(campo))[:64])
+    terminos.discard('')
+    return terminos
+
+
+def _rol(rol):
+    rol = _normalizar(rol)
+    for normalizado in ('admin', 'deshabilitado', 'conductor'):
+        if normalizado in rol:
+            return normalizado.upper()
+    return 'OTRO'
+
+
+def poblar_indice(apps, schema_editor):
+    # Usuarios y Vehiculos no los crea Django: en una base vacía de pruebas no existen aún
+    tablas = schema_editor.connection.introspection.table_names()
+    if 'Usuarios' not in tablas or 'Vehiculos' not in tablas:
+        return
+    Usuario = apps.get_model('PanelAdmin', 'Usuario')
+    Vehiculo = apps.get_model('PanelAdmin', 'Vehiculo')
+    RolUsuario = apps.get_model('PanelAdmin', 'RolUsuario')
+    TerminoBusqueda = apps.get_model('PanelAdmin', 'TerminoBusqueda')
+
+    terminos, roles = [], []
+    for u in Usuario.objects.order_by('pk').iterator(chunk_size=2000):
+        terminos += [TerminoBusqueda(tipo='U', objeto_id=u.pk, termino=t) for t in _terminos(u.nombre, u.rut, u.correo)]
+        roles.append(RolUsuario(usuario_id=u.pk, rol=_rol(u.rol)))
+    for v in Vehiculo.objects.order_by('pk').iterator(chunk_size=2000):
+        terminos += [TerminoBusqueda(tipo='V', objeto_id=v.pk, termino=t) for t in _terminos(v.patente, v.modelo)]
+    TerminoBusqueda.objects.bulk_create(terminos, batch_size=1000)
+    RolUsuario.objects.bulk_create(roles, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PanelAdmin', '0003_trabajoreporte'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RolUsuario',
+            fields=[
+                ('usuario', models.OneToOneField(db_column='id_usuario', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='rol_normalizado', serialize=False, to='PanelAdmin.usuario')),
+                ('rol', models.CharField(choices=[('ADMIN', 'Admin'), ('CONDUCTOR', 'Conductor'), ('DESHABILITADO', 'Deshabilitado'), ('OTRO', 'Otro')], db_index=True, max_length=20)),
+            ],
+            options={
+                'db_table': 'RolesUsuario',
+            },
+        ),
+        migrations.CreateModel(
+            name='TerminoBusqueda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('U', 'Usuario'), ('V', 'Vehículo')], max_length=1)),
+                ('objeto_id', models.IntegerField()),
+                ('termino', models.CharField(max_length=64)),
+            ],
+            options={
+                'db_table': 'TerminosBusqueda',
+                'indexes': [models.Index(fields=['tipo', 'termino'], name='busqueda_termino_idx'), models.Index(fields=['tipo', 'objeto_id'], name='busqueda_objeto_idx')],
+            },
+        ),
+        migrations.RunPython(poblar_indice, migrations.RunPython.noop),
+    ]
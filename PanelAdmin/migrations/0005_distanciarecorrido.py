@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PanelAdmin', '0004_busqueda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DistanciaRecorrido',
+            fields=[
+                ('recorrido', models.OneToOneField(db_column='id_recorrido', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='distancia_gps', serialize=False, to='PanelAdmin.recorrido')),
+                ('km', models.FloatField(default=0)),
+                ('puntos', models.PositiveIntegerField(default=0)),
+                ('descartados', models.PositiveIntegerField(default=0)),
+                ('paradas', models.PositiveIntegerField(default=0)),
+                ('segundos_detenido', models.PositiveIntegerField(default=0)),
+                ('ultimo_ts', models.DateTimeField(blank=True, null=True)),
+                ('completo', models.BooleanField(default=False)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'DistanciasRecorrido',
+                'indexes': [models.Index(fields=['completo'], name='distancia_completo_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PanelAdmin', '0005_distanciarecorrido'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Zona',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('tipo', models.CharField(choices=[('POLIGONO', 'Polígono'), ('CIRCULO', 'Círculo')], max_length=10)),
+                ('vertices', models.JSONField(blank=True, default=list)),
+                ('latitud', models.FloatField(blank=True, null=True)),
+                ('longitud', models.FloatField(blank=True, null=True)),
+                ('radio_m', models.FloatField(blank=True, null=True)),
+                ('es_base', models.BooleanField(default=False)),
+                ('activa', models.BooleanField(default=True)),
+                ('creada', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'Zonas',
+            },
+        ),
+        migrations.CreateModel(
+            name='VehiculoEnZona',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('desde', models.DateTimeField()),
+                ('vehiculo', models.ForeignKey(db_column='id_vehiculo', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='PanelAdmin.vehiculo')),
+                ('zona', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='PanelAdmin.zona')),
+            ],
+            options={
+                'db_table': 'VehiculosEnZona',
+            },
+        ),
+        migrations.CreateModel(
+            name='EventoZona',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('tipo', models.CharField(choices=[('ENTRADA', 'Entrada'), ('SALIDA', 'Salida')], max_length=7)),
+                ('ts', models.DateTimeField()),
+                ('latitud', models.FloatField()),
+                ('longitud', models.FloatField()),
+                ('registrado', models.DateTimeField(auto_now_add=True)),
+                ('recorrido', models.ForeignKey(blank=True, db_column='id_recorrido', db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='PanelAdmin.recorrido')),
+                ('vehiculo', models.ForeignKey(db_column='id_vehiculo', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='PanelAdmin.vehiculo')),
+                ('zona', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='PanelAdmin.zona')),
+            ],
+            options={
+                'db_table': 'EventosZona',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='vehiculoenzona',
+            constraint=models.UniqueConstraint(fields=('vehiculo', 'zona'), name='vehiculo_zona_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='eventozona',
+            index=models.Index(fields=['vehiculo', 'ts'], name='evento_vehiculo_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventozona',
+            index=models.Index(fields=['zona', 'ts'], name='evento_zona_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PanelAdmin', '0006_geocercas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RendimientoVehiculo',
+            fields=[
+                ('vehiculo', models.OneToOneField(db_column='id_vehiculo', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='rendimiento', serialize=False, to='PanelAdmin.vehiculo')),
+                ('km_por_litro', models.FloatField(blank=True, null=True)),
+                ('base_km_por_litro', models.FloatField(blank=True, null=True)),
+                ('tendencia', models.JSONField(blank=True, default=list)),
+                ('sospechosas', models.PositiveIntegerField(default=0)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'RendimientoVehiculos',
+                'indexes': [models.Index(fields=['sospechosas'], name='rend_vehiculo_sospechosas_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RendimientoCarga',
+            fields=[
+                ('carga', models.OneToOneField(db_column='id_carga', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='rendimiento', serialize=False, to='PanelAdmin.cargacombustible')),
+                ('fecha', models.DateField()),
+                ('litros', models.FloatField()),
+                ('km', models.FloatField(blank=True, null=True)),
+                ('km_por_litro', models.FloatField(blank=True, null=True)),
+                ('base_km_por_litro', models.FloatField(blank=True, null=True)),
+                ('z_rendimiento', models.FloatField(blank=True, null=True)),
+                ('z_litros', models.FloatField(blank=True, null=True)),
+                ('alertas', models.JSONField(blank=True, default=list)),
+                ('sospechosa', models.BooleanField(default=False)),
+                ('calculado', models.DateTimeField(auto_now=True)),
+                ('conductor', models.ForeignKey(blank=True, db_column='id_conductor', db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='PanelAdmin.usuario')),
+                ('vehiculo', models.ForeignKey(db_column='id_vehiculo', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='PanelAdmin.vehiculo')),
+            ],
+            options={
+                'db_table': 'RendimientoCargas',
+                'indexes': [models.Index(fields=['vehiculo', 'fecha'], name='rendimiento_vehiculo_idx'), models.Index(fields=['conductor', 'fecha'], name='rendimiento_conductor_idx'), models.Index(fields=['sospechosa', 'fecha'], name='rendimiento_sospechosa_idx')],
+            },
+        ),
+    ]
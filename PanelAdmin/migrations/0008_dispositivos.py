@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PanelAdmin', '0007_rendimiento'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Dispositivo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('token_hash', models.CharField(max_length=64, unique=True)),
+                ('prefijo', models.CharField(max_length=8)),
+                ('fixes_por_segundo', models.FloatField(blank=True, null=True)),
+                ('rafaga', models.PositiveIntegerField(blank=True, null=True)),
+                ('activo', models.BooleanField(default=True)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('vehiculo', models.ForeignKey(blank=True, db_column='id_vehiculo', db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='PanelAdmin.vehiculo')),
+            ],
+            options={
+                'db_table': 'Dispositivos',
+            },
+        ),
+    ]
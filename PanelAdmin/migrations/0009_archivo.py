@@ -0,0 +1,62 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def particionar(apps, schema_editor):
+    # Solo MySQL: particiones mensuales por `fecha` (archivar_historial las va creando).
+    # MySQL exige la columna de partición en la clave primaria; los ids siguen siendo únicos.
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    for tabla, id_ in (('RecorridosArchivo', 'id_recorrido'), ('CargaCombustibleArchivo', 'id_carga')):
+        schema_editor.execute(f"ALTER TABLE `{tabla}` DROP PRIMARY KEY, ADD PRIMARY KEY (`{id_}`, `fecha`)")
+        schema_editor.execute(
+            f"ALTER TABLE `{tabla}` PARTITION BY RANGE COLUMNS(`fecha`) "
+            "(PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PanelAdmin', '0008_dispositivos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecorridoArchivado',
+            fields=[
+                ('id_recorrido', models.IntegerField(primary_key=True, serialize=False)),
+                ('fecha', models.DateField()),
+                ('hora_inicio', models.TimeField()),
+                ('hora_fin', models.TimeField(blank=True, null=True)),
+                ('kilometraje_inicio', models.IntegerField(blank=True, null=True)),
+                ('kilometraje_fin', models.IntegerField(blank=True, null=True)),
+                ('ubicacion_inicio_txt', models.CharField(blank=True, max_length=255, null=True)),
+                ('ubicacion_fin_txt', models.CharField(blank=True, max_length=255, null=True)),
+                ('conductor', models.ForeignKey(db_column='id_conductor', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='PanelAdmin.usuario')),
+                ('vehiculo', models.ForeignKey(db_column='id_vehiculo', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='PanelAdmin.vehiculo')),
+            ],
+            options={
+                'db_table': 'RecorridosArchivo',
+                'indexes': [models.Index(fields=['fecha', 'id_recorrido'], name='rec_archivo_fecha_idx'), models.Index(fields=['conductor', 'fecha'], name='rec_archivo_conductor_idx'), models.Index(fields=['vehiculo', 'fecha'], name='rec_archivo_vehiculo_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CargaArchivada',
+            fields=[
+                ('id_carga', models.IntegerField(primary_key=True, serialize=False)),
+                ('litros', models.FloatField()),
+                ('costo_total', models.IntegerField()),
+                ('fecha', models.DateField()),
+                ('hora', models.TimeField()),
+                ('vehiculo', models.ForeignKey(db_column='id_vehiculo', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='PanelAdmin.vehiculo')),
+            ],
+            options={
+                'db_table': 'CargaCombustibleArchivo',
+                'indexes': [models.Index(fields=['fecha', 'hora'], name='carga_archivo_fecha_idx'), models.Index(fields=['vehiculo', 'fecha'], name='carga_archivo_vehiculo_idx')],
+            },
+        ),
+        migrations.RunPython(particionar, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PanelAdmin', '0009_archivo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoRecorrido',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('clave', models.UUIDField(unique=True)),
+                ('viaje', models.UUIDField()),
+                ('tipo', models.CharField(choices=[('INICIO', 'Inicio'), ('PUNTO', 'Punto de control'), ('FIN', 'Término')], max_length=6)),
+                ('ts', models.DateTimeField()),
+                ('kilometraje', models.IntegerField(blank=True, null=True)),
+                ('latitud', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('longitud', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('ubicacion', models.CharField(blank=True, max_length=255, null=True)),
+                ('aplicado', models.BooleanField(default=True)),
+                ('recibido', models.DateTimeField(auto_now_add=True)),
+                ('dispositivo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='PanelAdmin.dispositivo')),
+                ('recorrido', models.ForeignKey(blank=True, db_column='id_recorrido', db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='eventos_app', to='PanelAdmin.recorrido')),
+            ],
+            options={
+                'db_table': 'EventosRecorrido',
+                'indexes': [models.Index(fields=['viaje', 'ts'], name='evento_viaje_ts_idx')],
+            },
+        ),
+    ]
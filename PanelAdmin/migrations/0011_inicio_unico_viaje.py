@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:08
+
+from django.db import migrations, models
+
+
+def marcar_inicios(apps, schema_editor):
+    # Si ya quedaron dos INICIO del mismo viaje, solo el primero recibido queda marcado
+    EventoRecorrido = apps.get_model('PanelAdmin', 'EventoRecorrido')
+    vistos = set()
+    for id_, viaje in EventoRecorrido.objects.filter(tipo='INICIO').order_by('recibido', 'id').values_list('id', 'viaje'):
+        if viaje not in vistos:
+            vistos.add(viaje)
+            EventoRecorrido.objects.filter(id=id_).update(viaje_iniciado=viaje)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PanelAdmin', '0010_eventos_recorrido'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventorecorrido',
+            name='viaje_iniciado',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(marcar_inicios, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='eventorecorrido',
+            name='viaje_iniciado',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
@@ -1,5 +1,10 @@
+import uuid
+
 from django.db import models
 
+# Clave inutilizable mientras credenciales.py calcula el hash del PIN
+PIN_PENDIENTE = '!pendiente'
+
 class Usuario(models.Model):
     id_usuario = models.AutoField(primary_key=True)
     nombre = models.CharField(max_length=100)
@@ -19,6 +24,10 @@ class Usuario(models.Model):
             self.rol = self.rol.upper()
         super(Usuario, self).save(*args, **kwargs)
 
+    @property
+    def pin_pendiente(self):
+        return self.pin_hash == PIN_PENDIENTE
+
     def __str__(self):
         return self.nombre
 
@@ -77,4 +86,326 @@ class CargaCombustible(models.Model):
     
     class Meta:
         managed = False 
-        db_table = 'CargaCombustible'
\ No newline at end of file
+        db_table = 'CargaCombustible'
+
+class TramoPosiciones(models.Model):
+    # Bloque de fixes GPS empaquetados (ver PanelAdmin/posiciones.py). Solo se anexa.
+    vehiculo = models.ForeignKey(Vehiculo, models.DO_NOTHING, db_column='id_vehiculo', db_constraint=False)
+    dia = models.DateField()
+    ts_inicio = models.DateTimeField()
+    ts_fin = models.DateTimeField()
+    cantidad = models.PositiveIntegerField()
+    puntos = models.BinaryField()
+
+    class Meta:
+        db_table = 'PosicionesTramos'
+        indexes = [
+            models.Index(fields=['vehiculo', 'dia', 'ts_inicio'], name='pos_vehiculo_dia_idx'),
+        ]
+
+
+class ResumenDiario(models.Model):
+    # KPIs pre-agregados por vehículo y día (ver PanelAdmin/resumenes.py)
+    vehiculo = models.ForeignKey(Vehiculo, models.DO_NOTHING, db_column='id_vehiculo', db_constraint=False)
+    dia = models.DateField()
+    km = models.BigIntegerField(default=0)
+    litros = models.FloatField(default=0)
+    costo = models.BigIntegerField(default=0)
+    viajes = models.PositiveIntegerField(default=0)
+    cargas = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'ResumenDiario'
+        constraints = [
+            models.UniqueConstraint(fields=['vehiculo', 'dia'], name='resumen_vehiculo_dia_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['dia'], name='resumen_dia_idx'),
+        ]
+
+
+class TrabajoReporte(models.Model):
+    PENDIENTE, PROCESANDO, LISTO, ERROR = 'PENDIENTE', 'PROCESANDO', 'LISTO', 'ERROR'
+    ESTADOS = [(e, e.capitalize()) for e in (PENDIENTE, PROCESANDO, LISTO, ERROR)]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    clave = models.CharField(max_length=64, db_index=True)
+    filtros = models.JSONField(default=dict)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=PENDIENTE)
+    archivo = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    usuario_generador = models.CharField(max_length=150, blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    terminado = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'TrabajosReporte'
+
+
+class RolUsuario(models.Model):
+    # Usuarios.rol es texto libre ('admin', 'CONDUCTOR', ...): aquí queda normalizado e indexado
+    ADMIN, CONDUCTOR, DESHABILITADO, OTRO = 'ADMIN', 'CONDUCTOR', 'DESHABILITADO', 'OTRO'
+    ROLES = [(r, r.capitalize()) for r in (ADMIN, CONDUCTOR, DESHABILITADO, OTRO)]
+
+    usuario = models.OneToOneField(
+        Usuario, models.DO_NOTHING, primary_key=True, db_column='id_usuario',
+        db_constraint=False, related_name='rol_normalizado',
+    )
+    rol = models.CharField(max_length=20, choices=ROLES, db_index=True)
+
+    class Meta:
+        db_table = 'RolesUsuario'
+
+
+class TerminoBusqueda(models.Model):
+    # Términos normalizados (sin tildes, minúsculas) para buscar por prefijo (ver PanelAdmin/busqueda.py)
+    USUARIO, VEHICULO = 'U', 'V'
+    TIPOS = [(USUARIO, 'Usuario'), (VEHICULO, 'Vehículo')]
+
+    tipo = models.CharField(max_length=1, choices=TIPOS)
+    objeto_id = models.IntegerField()
+    termino = models.CharField(max_length=64)
+
+    class Meta:
+        db_table = 'TerminosBusqueda'
+        indexes = [
+            models.Index(fields=['tipo', 'termino'], name='busqueda_termino_idx'),
+            models.Index(fields=['tipo', 'objeto_id'], name='busqueda_objeto_idx'),
+        ]
+
+
+class DistanciaRecorrido(models.Model):
+    # Distancia y paradas calculadas desde el historial GPS (ver PanelAdmin/trayectos.py)
+    recorrido = models.OneToOneField(
+        Recorrido, models.DO_NOTHING, primary_key=True, db_column='id_recorrido',
+        db_constraint=False, related_name='distancia_gps',
+    )
+    km = models.FloatField(default=0)
+    puntos = models.PositiveIntegerField(default=0)
+    descartados = models.PositiveIntegerField(default=0)
+    paradas = models.PositiveIntegerField(default=0)
+    segundos_detenido = models.PositiveIntegerField(default=0)
+    ultimo_ts = models.DateTimeField(blank=True, null=True)
+    completo = models.BooleanField(default=False)  # recalculado entero con el viaje ya cerrado
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'DistanciasRecorrido'
+        indexes = [
+            models.Index(fields=['completo'], name='distancia_completo_idx'),
+        ]
+
+
+class Zona(models.Model):
+    # Geocercas (ver PanelAdmin/geocercas.py). Una zona base inicia el viaje al salir y lo cierra al entrar.
+    POLIGONO, CIRCULO = 'POLIGONO', 'CIRCULO'
+    TIPOS = [(POLIGONO, 'Polígono'), (CIRCULO, 'Círculo')]
+
+    nombre = models.CharField(max_length=100)
+    tipo = models.CharField(max_length=10, choices=TIPOS)
+    vertices = models.JSONField(default=list, blank=True)  # [[lat, lon], ...]
+    latitud = models.FloatField(blank=True, null=True)     # centro del círculo
+    longitud = models.FloatField(blank=True, null=True)
+    radio_m = models.FloatField(blank=True, null=True)
+    es_base = models.BooleanField(default=False)
+    activa = models.BooleanField(default=True)
+    creada = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'Zonas'
+
+    def __str__(self):
+        return self.nombre
+
+
+class VehiculoEnZona(models.Model):
+    # Estado actual dentro/fuera: una fila mientras el vehículo está dentro de la zona
+    vehiculo = models.ForeignKey(Vehiculo, models.DO_NOTHING, db_column='id_vehiculo', db_constraint=False)
+    zona = models.ForeignKey(Zona, models.CASCADE)
+    desde = models.DateTimeField()
+
+    class Meta:
+        db_table = 'VehiculosEnZona'
+        constraints = [
+            models.UniqueConstraint(fields=['vehiculo', 'zona'], name='vehiculo_zona_uniq'),
+        ]
+
+
+class EventoZona(models.Model):
+    ENTRADA, SALIDA = 'ENTRADA', 'SALIDA'
+    TIPOS = [(ENTRADA, 'Entrada'), (SALIDA, 'Salida')]
+
+    id = models.BigAutoField(primary_key=True)
+    vehiculo = models.ForeignKey(Vehiculo, models.DO_NOTHING, db_column='id_vehiculo', db_constraint=False)
+    zona = models.ForeignKey(Zona, models.CASCADE)
+    tipo = models.CharField(max_length=7, choices=TIPOS)
+    ts = models.DateTimeField()
+    latitud = models.FloatField()
+    longitud = models.FloatField()
+    # Recorrido que este evento inició o cerró automáticamente (zonas base)
+    recorrido = models.ForeignKey(
+        Recorrido, models.DO_NOTHING, db_column='id_recorrido', db_constraint=False, blank=True, null=True,
+    )
+    registrado = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'EventosZona'
+        indexes = [
+            models.Index(fields=['vehiculo', 'ts'], name='evento_vehiculo_ts_idx'),
+            models.Index(fields=['zona', 'ts'], name='evento_zona_ts_idx'),
+        ]
+
+
+class RendimientoCarga(models.Model):
+    # km/L del tramo entre la carga anterior y esta, con su línea base móvil (ver PanelAdmin/rendimiento.py)
+    BAJO_RENDIMIENTO, LITROS_ALTOS, SIN_RECORRIDOS = 'BAJO_RENDIMIENTO', 'LITROS_ALTOS', 'SIN_RECORRIDOS'
+
+    carga = models.OneToOneField(
+        CargaCombustible, models.DO_NOTHING, primary_key=True, db_column='id_carga',
+        db_constraint=False, related_name='rendimiento',
+    )
+    vehiculo = models.ForeignKey(Vehiculo, models.DO_NOTHING, db_column='id_vehiculo', db_constraint=False)
+    # Conductor con más km en el tramo
+    conductor = models.ForeignKey(
+        Usuario, models.DO_NOTHING, db_column='id_conductor', db_constraint=False, blank=True, null=True,
+    )
+    fecha = models.DateField()
+    litros = models.FloatField()
+    km = models.FloatField(blank=True, null=True)  # nulo en la primera carga conocida del vehículo
+    km_por_litro = models.FloatField(blank=True, null=True)
+    base_km_por_litro = models.FloatField(blank=True, null=True)
+    z_rendimiento = models.FloatField(blank=True, null=True)
+    z_litros = models.FloatField(blank=True, null=True)
+    alertas = models.JSONField(default=list, blank=True)
+    sospechosa = models.BooleanField(default=False)
+    calculado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'RendimientoCargas'
+        indexes = [
+            models.Index(fields=['vehiculo', 'fecha'], name='rendimiento_vehiculo_idx'),
+            models.Index(fields=['conductor', 'fecha'], name='rendimiento_conductor_idx'),
+            models.Index(fields=['sospechosa', 'fecha'], name='rendimiento_sospechosa_idx'),
+        ]
+
+
+class RendimientoVehiculo(models.Model):
+    # Resumen por vehículo para la pantalla de combustible: se actualiza junto con RendimientoCargas
+    vehiculo = models.OneToOneField(
+        Vehiculo, models.DO_NOTHING, primary_key=True, db_column='id_vehiculo',
+        db_constraint=False, related_name='rendimiento',
+    )
+    km_por_litro = models.FloatField(blank=True, null=True)       # última carga con tramo medible
+    base_km_por_litro = models.FloatField(blank=True, null=True)
+    tendencia = models.JSONField(default=list, blank=True)         # [[fecha, km/L], ...] más recientes
+    sospechosas = models.PositiveIntegerField(default=0)           # últimos RENDIMIENTO_DIAS_ALERTAS días
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'RendimientoVehiculos'
+        indexes = [
+            models.Index(fields=['sospechosas'], name='rend_vehiculo_sospechosas_idx'),
+        ]
+
+
+class Dispositivo(models.Model):
+    # Rastreador GPS con token propio (ver PanelAdmin/dispositivos.py). Solo se guarda el SHA-256 del token.
+    nombre = models.CharField(max_length=100)
+    vehiculo = models.ForeignKey(
+        Vehiculo, models.DO_NOTHING, db_column='id_vehiculo', db_constraint=False, blank=True, null=True,
+    )  # nulo = pasarela que reporta varias patentes
+    token_hash = models.CharField(max_length=64, unique=True)
+    prefijo = models.CharField(max_length=8)  # para reconocer el token sin guardarlo
+    fixes_por_segundo = models.FloatField(blank=True, null=True)  # nulo = DISPOSITIVOS_FIXES_POR_SEGUNDO
+    rafaga = models.PositiveIntegerField(blank=True, null=True)   # nulo = DISPOSITIVOS_RAFAGA
+    activo = models.BooleanField(default=True)
+    creado = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'Dispositivos'
+
+    def __str__(self):
+        return f"{self.nombre} ({self.prefijo}…)"
+
+
+# --- CICLO DE VIAJES DESDE LA APP (ver PanelAdmin/ciclo_recorridos.py) ---
+class EventoRecorrido(models.Model):
+    # Inicio, punto de control o término de un viaje, con la clave que genera la app:
+    # reenviar el mismo evento (reintento, sincronización offline) no lo aplica dos veces.
+    INICIO, PUNTO, FIN = 'INICIO', 'PUNTO', 'FIN'
+    TIPOS = [(INICIO, 'Inicio'), (PUNTO, 'Punto de control'), (FIN, 'Término')]
+
+    id = models.BigAutoField(primary_key=True)
+    clave = models.UUIDField(unique=True)
+    viaje = models.UUIDField()  # identificador del viaje en la app, antes de tener id_recorrido
+    tipo = models.CharField(max_length=6, choices=TIPOS)
+    ts = models.DateTimeField()
+    recorrido = models.ForeignKey(
+        Recorrido, models.DO_NOTHING, db_column='id_recorrido', db_constraint=False, blank=True, null=True,
+        related_name='eventos_app',
+    )
+    dispositivo = models.ForeignKey(Dispositivo, models.SET_NULL, blank=True, null=True)
+    kilometraje = models.IntegerField(blank=True, null=True)
+    latitud = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    longitud = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    ubicacion = models.CharField(max_length=255, blank=True, null=True)
+    aplicado = models.BooleanField(default=True)  # False = llegó antes que el INICIO de su viaje
+    recibido = models.DateTimeField(auto_now_add=True)
+    # = viaje solo en el INICIO: el índice único impide dos inicios del mismo viaje enviados
+    # en paralelo. Columna y no UniqueConstraint(condition=...): MySQL no tiene índices parciales
+    viaje_iniciado = models.UUIDField(unique=True, blank=True, null=True, editable=False)
+
+    class Meta:
+        db_table = 'EventosRecorrido'
+        indexes = [
+            models.Index(fields=['viaje', 'ts'], name='evento_viaje_ts_idx'),
+        ]
+
+
+# --- ARCHIVO HISTORICO (ver PanelAdmin/archivo.py) ---
+# Mismas columnas y mismos ids que las tablas de la app: archivar_historial mueve
+# aquí los viajes cerrados y las cargas más antiguos que ARCHIVO_RETENCION_DIAS.
+# En MySQL se particionan por mes de `fecha` (migración 0009).
+class RecorridoArchivado(models.Model):
+    id_recorrido = models.IntegerField(primary_key=True)
+    conductor = models.ForeignKey(
+        Usuario, models.DO_NOTHING, db_column='id_conductor', db_constraint=False, related_name='+',
+    )
+    vehiculo = models.ForeignKey(
+        Vehiculo, models.DO_NOTHING, db_column='id_vehiculo', db_constraint=False, related_name='+',
+    )
+    fecha = models.DateField()
+    hora_inicio = models.TimeField()
+    hora_fin = models.TimeField(blank=True, null=True)
+    kilometraje_inicio = models.IntegerField(blank=True, null=True)
+    kilometraje_fin = models.IntegerField(blank=True, null=True)
+    ubicacion_inicio_txt = models.CharField(max_length=255, blank=True, null=True)
+    ubicacion_fin_txt = models.CharField(max_length=255, blank=True, null=True)
+
+    class Meta:
+        db_table = 'RecorridosArchivo'
+        indexes = [
+            models.Index(fields=['fecha', 'id_recorrido'], name='rec_archivo_fecha_idx'),
+            models.Index(fields=['conductor', 'fecha'], name='rec_archivo_conductor_idx'),
+            models.Index(fields=['vehiculo', 'fecha'], name='rec_archivo_vehiculo_idx'),
+        ]
+
+    distancia = Recorrido.distancia
+
+
+class CargaArchivada(models.Model):
+    id_carga = models.IntegerField(primary_key=True)
+    vehiculo = models.ForeignKey(
+        Vehiculo, models.DO_NOTHING, db_column='id_vehiculo', db_constraint=False, related_name='+',
+    )
+    litros = models.FloatField()
+    costo_total = models.IntegerField()
+    fecha = models.DateField()
+    hora = models.TimeField()
+
+    class Meta:
+        db_table = 'CargaCombustibleArchivo'
+        indexes = [
+            models.Index(fields=['fecha', 'hora'], name='carga_archivo_fecha_idx'),
+            models.Index(fields=['vehiculo', 'fecha'], name='carga_archivo_vehiculo_idx'),
+        ]
@@ -0,0 +1,56 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+class Saturado(Exception):
+    pass
+
+
+class PoolBD:
+    """
+    Hilos fijos para el trabajo de BD de las vistas async. Cada hilo conserva
+    su conexión entre usos (CONN_MAX_AGE) y la revisa antes de cada trabajo
+    (CONN_HEALTH_CHECKS): el proceso nunca abre más de `conexiones`
+    conexiones para estas vistas. Con más de `cola_max` trabajos esperando
+    rechaza (Saturado) en vez de acumular memoria y latencia.
+    """
+
+    def __init__(self, conexiones=None, cola_max=None):
+        self.conexiones = conexiones or settings.BD_POOL_CONEXIONES
+        self.cola_max = cola_max if cola_max is not None else settings.BD_POOL_COLA_MAX
+        self._executor = ThreadPoolExecutor(max_workers=self.conexiones, thread_name_prefix='pool-bd')
+        self._en_curso = 0
+        self._lock = threading.Lock()  # con WSGI cada request async tiene su propio event loop
+
+    def __len__(self):
+        return self._en_curso
+
+    async def ejecutar(self, funcion, *args):
+        with self._lock:
+            if self._en_curso >= self.conexiones + self.cola_max:
+                raise Saturado("Pool de BD saturado")
+            self._en_curso += 1
+        try:
+            # El contexto del request viaja al hilo (medición de consultas del middleware)
+            contexto = contextvars.copy_context()
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, contexto.run, _con_conexion, funcion, args,
+            )
+        finally:
+            with self._lock:
+                self._en_curso -= 1
+
+
+def _con_conexion(funcion, args):
+    # Como al inicio de un request: descarta la conexión vencida o rota y marca
+    # la que sigue para que se verifique antes de la primera consulta
+    close_old_connections()
+    return funcion(*args)
+
+
+pool_bd = PoolBD()
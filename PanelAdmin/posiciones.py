@@ -0,0 +1,160 @@
+import datetime
+import struct
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Vehiculo, TramoPosiciones
+from . import cache_panel
+
+# Cada punto ocupa 12 bytes: milisegundos desde el inicio del día (UTC),
+# latitud y longitud como enteros en micro-grados.
+PUNTO = struct.Struct('<Iii')
+MICROGRADOS = 1_000_000
+
+# patente -> id_vehiculo. Se descarta cuando cambia la versión 'vehiculos' del cache
+# del panel (altas, bajas y cambios de patente desde el panel) y cada
+# POSICIONES_IDS_SEGUNDOS, para lo que cambie la app externa sin señales.
+_ids_por_patente = {}
+_ids_vigencia = (None, 0.0)
+
+_lock = threading.Lock()
+_ultima_compactacion = 0.0
+
+
+def _inicio_dia(dia):
+    return datetime.datetime.combine(dia, datetime.time.min, tzinfo=datetime.timezone.utc)
+
+
+def empaquetar(dia, puntos):
+    base = _inicio_dia(dia)
+    buffer = bytearray()
+    for ts, lat, lon in sorted(puntos):
+        ms = int((ts - base).total_seconds() * 1000)
+        buffer += PUNTO.pack(ms, round(lat * MICROGRADOS), round(lon * MICROGRADOS))
+    return bytes(buffer)
+
+
+def desempaquetar(dia, datos):
+    base = _inicio_dia(dia)
+    for ms, lat, lon in PUNTO.iter_unpack(bytes(datos)):
+        yield base + datetime.timedelta(milliseconds=ms), lat / MICROGRADOS, lon / MICROGRADOS
+
+
+def _resolver_ids(patentes):
+    global _ids_por_patente, _ids_vigencia
+    version = cache_panel.versiones(['vehiculos'])[0]
+    version_ids, cargado = _ids_vigencia
+    if version != version_ids or time.monotonic() - cargado >= settings.POSICIONES_IDS_SEGUNDOS:
+        _ids_por_patente = {}
+        _ids_vigencia = (version, time.monotonic())
+    faltantes = [p for p in patentes if p not in _ids_por_patente]
+    if faltantes:
+        _ids_por_patente.update(
+            Vehiculo.objects.filter(patente__in=faltantes).values_list('patente', 'id_vehiculo')
+        )
+    return {p: _ids_por_patente[p] for p in patentes if p in _ids_por_patente}
+
+
+# --- ESCRITURA (solo anexar) ---
+def registrar_historial(fixes):
+    fixes = list(fixes)
+    if not fixes:
+        return 0
+    ids = _resolver_ids({f.patente for f in fixes})
+
+    grupos = defaultdict(list)
+    for f in fixes:
+        if f.patente in ids:
+            ts = f.ts.astimezone(datetime.timezone.utc)
+            grupos[(ids[f.patente], ts.date())].append((ts, float(f.latitud), float(f.longitud)))
+
+    tramos = [
+        TramoPosiciones(
+            vehiculo_id=id_vehiculo, dia=dia,
+            ts_inicio=min(p[0] for p in puntos), ts_fin=max(p[0] for p in puntos),
+            cantidad=len(puntos), puntos=empaquetar(dia, puntos),
+        )
+        for (id_vehiculo, dia), puntos in grupos.items()
+    ]
+    TramoPosiciones.objects.bulk_create(tramos, batch_size=500)
+    return sum(t.cantidad for t in tramos)
+
+
+# --- CONSULTAS ---
+def trayecto(id_vehiculo, desde, hasta):
+    desde_utc = desde.astimezone(datetime.timezone.utc)
+    hasta_utc = hasta.astimezone(datetime.timezone.utc)
+    tramos = TramoPosiciones.objects.filter(
+        vehiculo_id=id_vehiculo,
+        dia__range=(desde_utc.date(), hasta_utc.date()),
+        ts_fin__gte=desde, ts_inicio__lte=hasta,
+    ).values_list('dia', 'puntos')
+
+    puntos = []
+    for dia, datos in tramos.iterator(chunk_size=200):
+        puntos.extend(p for p in desempaquetar(dia, datos) if desde <= p[0] <= hasta)
+    puntos.sort()
+    return puntos
+
+
+def rango_recorrido(recorrido):
+    tz = timezone.get_current_timezone()
+    desde = timezone.make_aware(datetime.datetime.combine(recorrido.fecha, recorrido.hora_inicio), tz)
+    if recorrido.hora_fin:
+        hasta = timezone.make_aware(datetime.datetime.combine(recorrido.fecha, recorrido.hora_fin), tz)
+        if hasta < desde:  # viaje que cruzó la medianoche
+            hasta += datetime.timedelta(days=1)
+    else:
+        hasta = timezone.now()
+    return desde, hasta
+
+
+def trayecto_recorrido(recorrido):
+    desde, hasta = rango_recorrido(recorrido)
+    return trayecto(recorrido.vehiculo_id, desde, hasta)
+
+
+# --- MANTENCION ---
+def compactar_dia(id_vehiculo, dia):
+    with transaction.atomic():
+        tramos = list(
+            TramoPosiciones.objects.select_for_update()
+            .filter(vehiculo_id=id_vehiculo, dia=dia).order_by('ts_inicio')
+        )
+        if len(tramos) < 2:
+            return 0
+        puntos = [p for t in tramos for p in desempaquetar(dia, t.puntos)]
+        TramoPosiciones.objects.filter(id__in=[t.id for t in tramos]).delete()
+        TramoPosiciones.objects.create(
+            vehiculo_id=id_vehiculo, dia=dia,
+            ts_inicio=min(p[0] for p in puntos), ts_fin=max(p[0] for p in puntos),
+            cantidad=len(puntos), puntos=empaquetar(dia, puntos),
+        )
+    return len(tramos)
+
+
+def compactar(desde, hasta=None):
+    """Une los tramos de cada vehículo y día desde `desde` (hasta `hasta`, excluido)."""
+    candidatos = TramoPosiciones.objects.filter(dia__gte=desde)
+    if hasta is not None:
+        candidatos = candidatos.filter(dia__lt=hasta)
+    candidatos = candidatos.values('vehiculo_id', 'dia').annotate(n=Count('id')).filter(n__gt=1)
+    return sum(compactar_dia(fila['vehiculo_id'], fila['dia']) for fila in candidatos.iterator())
+
+
+def compactar_pendientes(forzar=False):
+    # Lo llama el hilo del buffer GPS: cada vaciado anexa un tramo por vehículo, así
+    # que hoy y ayer (UTC) se unen cada POSICIONES_COMPACTAR_INTERVALO segundos
+    global _ultima_compactacion
+    with _lock:
+        if not forzar and time.monotonic() - _ultima_compactacion < settings.POSICIONES_COMPACTAR_INTERVALO:
+            return 0
+        _ultima_compactacion = time.monotonic()
+    hoy = timezone.now().astimezone(datetime.timezone.utc).date()
+    return compactar(hoy - datetime.timedelta(days=1))
@@ -0,0 +1,262 @@
+import datetime
+from typing import NamedTuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Sum, Q, F, FloatField, ExpressionWrapper
+from django.utils import timezone
+
+from .models import CargaCombustible, Recorrido, RendimientoCarga, RendimientoVehiculo
+from .cache_panel import invalidar
+from . import archivo
+
+BITS_TS = 37  # segundos locales desde el año 1: caben hasta el año ~4300
+
+
+class Rendimiento(NamedTuple):
+    km: np.ndarray
+    km_por_litro: np.ndarray
+    base: np.ndarray
+    z_rendimiento: np.ndarray
+    z_litros: np.ndarray
+    conductor: np.ndarray
+    bajo: np.ndarray
+    litros_altos: np.ndarray
+    sin_recorridos: np.ndarray
+
+
+def _segundos(fecha, hora):
+    # Fecha y hora locales sin zona, igual que se guardan en las tablas de la app
+    return fecha.toordinal() * 86400 + hora.hour * 3600 + hora.minute * 60 + hora.second
+
+
+# --- MOTOR VECTORIZADO ---
+def _ventana_previa(x, g, ventana, minimo):
+    """Media y desviación de los `ventana` valores válidos anteriores de cada
+    grupo, sin contar el propio. NaN si hay menos de `minimo`."""
+    media, desv = np.full(len(x), np.nan), np.full(len(x), np.nan)
+    idx = np.flatnonzero(~np.isnan(x))
+    if not len(idx):
+        return media, desv
+    xv, gv = x[idx], g[idx]
+    centro = xv.mean()  # centrar antes de acumular cuadrados evita perder precisión
+    xv = xv - centro
+    pos = np.arange(len(xv))
+    lo = np.maximum(pos - ventana, np.searchsorted(gv, gv, side='left'))
+    cantidad = pos - lo
+    acumulado = np.concatenate(([0.0], np.cumsum(xv)))
+    cuadrados = np.concatenate(([0.0], np.cumsum(xv * xv)))
+    ok = cantidad >= minimo
+    m = (acumulado[pos[ok]] - acumulado[lo[ok]]) / cantidad[ok]
+    var = (cuadrados[pos[ok]] - cuadrados[lo[ok]]) / cantidad[ok] - m * m
+    media[idx[ok]] = m + centro
+    desv[idx[ok]] = np.sqrt(np.maximum(var, 0))
+    return media, desv
+
+
+def _z(x, media, desv):
+    # Con un historial muy parejo la desviación tiende a 0: se le pone un piso relativo a la media
+    piso = np.maximum(desv, settings.RENDIMIENTO_DESV_MIN * np.abs(media))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (x - media) / piso
+
+
+def procesar(carga_v, carga_ts, litros, viaje_v, viaje_ts, viaje_km, viaje_conductor):
+    """
+    Cargas ordenadas por (vehículo, ts); viajes en cualquier orden. Cada viaje
+    se asigna a la primera carga de su vehículo en o después de su inicio, así
+    que el tramo de una carga son los viajes desde la carga anterior (lleno a
+    lleno). La primera carga de cada vehículo no tiene tramo conocido.
+    """
+    n = len(carga_v)
+    primera = np.ones(n, bool)
+    primera[1:] = carga_v[1:] != carga_v[:-1]
+
+    claves = (carga_v.astype(np.int64) << BITS_TS) | carga_ts
+    j = np.searchsorted(claves, (viaje_v.astype(np.int64) << BITS_TS) | viaje_ts, side='left')
+    ok = j < n
+    ok[ok] = (carga_v[j[ok]] == viaje_v[ok]) & ~primera[j[ok]]
+    jj, kk, cc = j[ok], viaje_km[ok], viaje_conductor[ok]
+
+    km = np.bincount(jj, weights=kk, minlength=n).astype(float)  # sin viajes bincount devuelve enteros
+    km[primera] = np.nan
+    with np.errstate(invalid='ignore', divide='ignore'):
+        km_por_litro = np.where((km > 0) & (litros > 0), km / litros, np.nan)
+
+    # Conductor del tramo: el que más km hizo entre las dos cargas
+    conductor = np.full(n, -1, np.int64)
+    if len(jj):
+        pares, inversa = np.unique((jj.astype(np.int64) << 32) | cc, return_inverse=True)
+        suma = np.bincount(inversa, weights=kk)
+        pj, pc = pares >> 32, pares & 0xFFFFFFFF
+        orden = np.lexsort((-suma, pj))
+        pj, pc = pj[orden], pc[orden]
+        mayor = np.ones(len(pj), bool)
+        mayor[1:] = pj[1:] != pj[:-1]
+        conductor[pj[mayor]] = pc[mayor]
+
+    ventana, minimo = settings.RENDIMIENTO_VENTANA, settings.RENDIMIENTO_MIN_MUESTRAS
+    base, desv = _ventana_previa(km_por_litro, carga_v, ventana, minimo)
+    base_litros, desv_litros = _ventana_previa(litros.astype(float), carga_v, ventana, minimo)
+    z_rendimiento = _z(km_por_litro, base, desv)
+    z_litros = _z(litros, base_litros, desv_litros)
+    umbral = settings.RENDIMIENTO_Z
+    return Rendimiento(
+        km=km, km_por_litro=km_por_litro, base=base, z_rendimiento=z_rendimiento, z_litros=z_litros,
+        conductor=conductor,
+        bajo=np.nan_to_num(z_rendimiento, nan=0) < -umbral,
+        litros_altos=np.nan_to_num(z_litros, nan=0) > umbral,
+        sin_recorridos=(km == 0) & ~primera,
+    )
+
+
+# --- CARGA Y GUARDADO ---
+def _km_viaje(km_inicio, km_fin, km_gps):
+    if km_inicio is not None and km_fin is not None and km_fin >= km_inicio:
+        return km_fin - km_inicio
+    return km_gps or 0
+
+
+def _numero(valor, decimales=3):
+    return None if np.isnan(valor) else round(float(valor), decimales)
+
+
+def _calcular_lote(desde_por_vehiculo, hoy):
+    ids = list(desde_por_vehiculo)
+    inicio = min(desde_por_vehiculo.values()) - datetime.timedelta(days=settings.RENDIMIENTO_CONTEXTO_DIAS)
+    cargas = list(
+        CargaCombustible.objects.filter(vehiculo_id__in=ids, fecha__gte=inicio)
+        .order_by('vehiculo_id', 'fecha', 'hora', 'id_carga')
+        .values_list('id_carga', 'vehiculo_id', 'fecha', 'hora', 'litros')
+    )
+    if not cargas:
+        return 0
+    viajes = list(
+        Recorrido.objects.filter(vehiculo_id__in=ids, fecha__gte=inicio, hora_fin__isnull=False)
+        .values_list('vehiculo_id', 'fecha', 'hora_inicio', 'conductor_id',
+                     'kilometraje_inicio', 'kilometraje_fin', 'distancia_gps__km')
+    )
+    carga_v = np.array([c[1] for c in cargas], np.int64)
+    r = procesar(
+        carga_v, np.array([_segundos(c[2], c[3]) for c in cargas], np.int64),
+        np.array([c[4] for c in cargas], float),
+        np.array([v[0] for v in viajes], np.int64),
+        np.array([_segundos(v[1], v[2]) for v in viajes], np.int64),
+        np.array([_km_viaje(v[4], v[5], v[6]) for v in viajes], float),
+        np.array([v[3] for v in viajes], np.int64),
+    )
+
+    filas = []
+    for i, (id_carga, id_vehiculo, fecha, _, litros) in enumerate(cargas):
+        if fecha < desde_por_vehiculo[id_vehiculo]:
+            continue  # solo contexto para la línea base
+        alertas = [
+            codigo for codigo, activa in (
+                (RendimientoCarga.BAJO_RENDIMIENTO, r.bajo[i]),
+                (RendimientoCarga.LITROS_ALTOS, r.litros_altos[i]),
+                (RendimientoCarga.SIN_RECORRIDOS, r.sin_recorridos[i]),
+            ) if activa
+        ]
+        filas.append(RendimientoCarga(
+            carga_id=id_carga, vehiculo_id=id_vehiculo, fecha=fecha, litros=litros,
+            conductor_id=int(r.conductor[i]) if r.conductor[i] >= 0 else None,
+            km=_numero(r.km[i], 1), km_por_litro=_numero(r.km_por_litro[i]), base_km_por_litro=_numero(r.base[i]),
+            z_rendimiento=_numero(r.z_rendimiento[i], 2), z_litros=_numero(r.z_litros[i], 2),
+            alertas=alertas, sospechosa=bool(alertas),
+        ))
+
+    # Resumen por vehículo con las últimas cargas medibles de la ventana
+    medibles = np.flatnonzero(~np.isnan(r.km_por_litro))
+    fin_grupo = np.searchsorted(carga_v[medibles], carga_v[medibles], side='right')
+    recientes = medibles[fin_grupo - np.arange(len(medibles)) <= settings.RENDIMIENTO_TENDENCIA]
+    tendencias = {}
+    for i in recientes:
+        tendencias.setdefault(cargas[i][1], []).append(i)
+    limite = hoy - datetime.timedelta(days=settings.RENDIMIENTO_DIAS_ALERTAS)
+
+    with transaction.atomic():
+        RendimientoCarga.objects.bulk_create(
+            filas, batch_size=1000, update_conflicts=True, unique_fields=['carga'],
+            update_fields=[
+                'vehiculo', 'conductor', 'fecha', 'litros', 'km', 'km_por_litro', 'base_km_por_litro',
+                'z_rendimiento', 'z_litros', 'alertas', 'sospechosa', 'calculado',
+            ],
+        )
+        sospechosas = dict(
+            RendimientoCarga.objects.filter(vehiculo_id__in=ids, sospechosa=True, fecha__gte=limite)
+            .order_by().values('vehiculo_id').annotate(n=Count('carga')).values_list('vehiculo_id', 'n')
+        )
+        RendimientoVehiculo.objects.bulk_create([
+            RendimientoVehiculo(
+                vehiculo_id=id_vehiculo,
+                km_por_litro=_numero(r.km_por_litro[indices[-1]], 2), base_km_por_litro=_numero(r.base[indices[-1]], 2),
+                tendencia=[[cargas[i][2].isoformat(), _numero(r.km_por_litro[i], 2)] for i in indices],
+                sospechosas=sospechosas.get(id_vehiculo, 0),
+            )
+            for id_vehiculo, indices in tendencias.items()
+        ], batch_size=1000, update_conflicts=True, unique_fields=['vehiculo'],
+            update_fields=['km_por_litro', 'base_km_por_litro', 'tendencia', 'sospechosas', 'actualizado'])
+    return len(filas)
+
+
+def recalcular(desde_por_vehiculo):
+    """{id_vehiculo: fecha}: recalcula y guarda las cargas de cada vehículo desde
+    esa fecha. Las anteriores (RENDIMIENTO_CONTEXTO_DIAS) solo se leen para la línea base."""
+    hoy = timezone.localdate()
+    ids = sorted(desde_por_vehiculo)
+    lote = settings.RENDIMIENTO_LOTE_VEHICULOS
+    total = sum(
+        _calcular_lote({v: desde_por_vehiculo[v] for v in ids[i:i + lote]}, hoy)
+        for i in range(0, len(ids), lote)
+    )
+    transaction.on_commit(lambda: invalidar('rendimiento'))
+    return total
+
+
+def pendientes():
+    # Cargas sin cálculo (creadas por la app o importadas): desde la más antigua de cada vehículo
+    return dict(
+        CargaCombustible.objects.filter(rendimiento__isnull=True).order_by()
+        .values('vehiculo_id').annotate(desde=Min('fecha')).values_list('vehiculo_id', 'desde')
+    )
+
+
+def reconstruir():
+    # Las cargas archivadas ya no se recalculan: su resultado se conserva
+    RendimientoCarga.objects.filter(fecha__gt=archivo.ultima_fecha_archivada()).delete()
+    RendimientoVehiculo.objects.all().delete()
+    return recalcular(dict(
+        CargaCombustible.objects.order_by().values('vehiculo_id').annotate(desde=Min('fecha'))
+        .values_list('vehiculo_id', 'desde')
+    ))
+
+
+# --- LECTURAS ---
+def vehiculos_a_revisar(limite):
+    # Primero los que tienen cargas sospechosas, luego los que más cayeron respecto de su línea base
+    caida = ExpressionWrapper(F('km_por_litro') / F('base_km_por_litro'), output_field=FloatField())
+    return (
+        RendimientoVehiculo.objects.filter(km_por_litro__isnull=False).select_related('vehiculo')
+        .annotate(relacion=caida).order_by('-sospechosas', F('relacion').asc(nulls_last=True))[:limite]
+    )
+
+
+def cargas_sospechosas(limite):
+    return (
+        RendimientoCarga.objects.filter(sospechosa=True).select_related('vehiculo', 'conductor')
+        .order_by('-fecha')[:limite]
+    )
+
+
+def por_conductor(desde, limite):
+    # Alias distintos a los campos del modelo: Django no deja agregar sobre una anotación del mismo nombre
+    rendimiento = ExpressionWrapper(Sum('km') / Sum('litros'), output_field=FloatField())
+    return list(
+        RendimientoCarga.objects.filter(fecha__gte=desde, km_por_litro__isnull=False, conductor__isnull=False)
+        .order_by().values('conductor_id', 'conductor__nombre')
+        .annotate(
+            km_total=Sum('km'), litros_total=Sum('litros'), rendimiento=rendimiento, cargas=Count('carga'),
+            sospechosas=Count('carga', filter=Q(sospechosa=True)),
+        ).order_by('rendimiento')[:limite]
+    )
@@ -0,0 +1,319 @@
+import datetime
+import hashlib
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, F, Q, Sum
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import Recorrido, CargaCombustible, TrabajoReporte, DistanciaRecorrido
+from .resumenes import KM_RECORRIDO
+from . import resumenes, archivo
+
+
+# --- FILTROS COMPARTIDOS (panel_reportes, PDF) ---
+def filtros_desde_request(request):
+    return {
+        'fecha_inicio': request.GET.get('fecha_inicio') or '',
+        'fecha_fin': request.GET.get('fecha_fin') or '',
+        'usuario': request.GET.get('usuario') or '',
+    }
+
+
+def filtrar_recorridos(filtros, modelo=Recorrido):
+    recorridos = modelo.objects.all()
+    if filtros.get('fecha_inicio'):
+        recorridos = recorridos.filter(fecha__gte=filtros['fecha_inicio'])
+    if filtros.get('fecha_fin'):
+        recorridos = recorridos.filter(fecha__lte=filtros['fecha_fin'])
+    if filtros.get('usuario'):
+        recorridos = recorridos.filter(conductor_id=filtros['usuario'])
+    return recorridos
+
+
+def filtrar_cargas(filtros, modelo=CargaCombustible):
+    cargas = modelo.objects.all()
+    if filtros.get('fecha_inicio'):
+        cargas = cargas.filter(fecha__gte=filtros['fecha_inicio'])
+    if filtros.get('fecha_fin'):
+        cargas = cargas.filter(fecha__lte=filtros['fecha_fin'])
+    if filtros.get('usuario'):
+        # Vehículos que manejó el conductor en el rango, también en viajes archivados
+        vehiculos = Q()
+        for recorridos in recorridos_por_tabla(filtros):
+            vehiculos |= Q(vehiculo_id__in=recorridos.values('vehiculo_id'))
+        cargas = cargas.filter(vehiculos)
+    return cargas
+
+
+# --- TABLAS DE LA APP + ARCHIVO (ver PanelAdmin/archivo.py) ---
+def recorridos_por_tabla(filtros):
+    return [filtrar_recorridos(filtros, m) for m in archivo.modelos(Recorrido, filtros.get('fecha_inicio'))]
+
+
+def cargas_por_tabla(filtros):
+    return [filtrar_cargas(filtros, m) for m in archivo.modelos(CargaCombustible, filtros.get('fecha_inicio'))]
+
+
+def agregar(consultas, **agregados):
+    """aggregate() en cada tabla, sumando los resultados."""
+    total = dict.fromkeys(agregados, 0)
+    for consulta in consultas:
+        for nombre, valor in consulta.aggregate(**agregados).items():
+            total[nombre] += valor or 0
+    return total
+
+
+def totales_reporte(filtros):
+    if not filtros.get('usuario'):
+        # Sin filtro de conductor los totales salen de los resúmenes por vehículo/día
+        datos = resumenes.totales_al_dia(filtros.get('fecha_inicio'), filtros.get('fecha_fin'))
+        return {'total_kms': datos['km'], 'total_dinero': datos['costo'], 'total_litros': datos['litros']}
+
+    return {
+        **agregar(recorridos_por_tabla(filtros), total_kms=KM_RECORRIDO),
+        **agregar(cargas_por_tabla(filtros), total_dinero=Sum('costo_total'), total_litros=Sum('litros')),
+    }
+
+
+def subtitulo_reporte(filtros):
+    subtitulo = "Reporte General Histórico"
+    if filtros.get('fecha_inicio'): subtitulo = f"Desde {filtros['fecha_inicio']}"
+    if filtros.get('fecha_fin'): subtitulo += f" hasta {filtros['fecha_fin']}"
+    return subtitulo
+
+
+# --- PAGINACION POR CURSOR (fecha, id_recorrido) descendente ---
+def despues_de(recorridos, cursor):
+    fecha, id_recorrido = cursor
+    return recorridos.filter(Q(fecha__lt=fecha) | Q(fecha=fecha, id_recorrido__lt=id_recorrido))
+
+
+def cursor_a_texto(fecha, id_recorrido):
+    return f"{fecha.isoformat()}_{id_recorrido}"
+
+
+def cursor_desde_texto(texto):
+    try:
+        fecha, id_recorrido = texto.split('_')
+        return datetime.date.fromisoformat(fecha), int(id_recorrido)
+    except (AttributeError, ValueError):
+        return None
+
+
+# Los ids no se repiten entre la tabla de la app y el archivo: combinar las
+# tablas por (fecha, id_recorrido) da el mismo orden que una sola tabla.
+def pagina_recorridos(tablas, cursor, tamano):
+    filas = []
+    for recorridos in tablas:
+        if recorridos.model is Recorrido:
+            recorridos = recorridos.select_related('distancia_gps')
+        recorridos = recorridos.order_by('-fecha', '-id_recorrido')
+        if cursor:
+            recorridos = despues_de(recorridos, cursor)
+        filas.extend(recorridos[:tamano + 1])
+    filas.sort(key=lambda r: (r.fecha, r.id_recorrido), reverse=True)
+    filas = filas[:tamano + 1]
+    siguiente = None
+    if len(filas) > tamano:
+        filas = filas[:tamano]
+        siguiente = cursor_a_texto(filas[-1].fecha, filas[-1].id_recorrido)
+    _distancias_archivadas(filas)
+    return filas, siguiente
+
+
+def _distancias_archivadas(filas):
+    # El archivo no tiene la relación inversa con DistanciasRecorrido: una consulta por página
+    archivadas = [r for r in filas if not isinstance(r, Recorrido)]
+    if archivadas:
+        distancias = DistanciaRecorrido.objects.in_bulk([r.id_recorrido for r in archivadas])
+        for r in archivadas:
+            r.distancia_gps = distancias.get(r.id_recorrido)
+
+
+def _filas_por_paginas(recorridos, tamano):
+    # Cada página es una consulta acotada: la memoria no depende del total de viajes
+    cursor = None
+    while True:
+        pagina = list((despues_de(recorridos, cursor) if cursor else recorridos)[:tamano])
+        yield from pagina
+        if len(pagina) < tamano:
+            return
+        cursor = (pagina[-1]['fecha'], pagina[-1]['id_recorrido'])
+
+
+def paginas_recorridos(tablas, tamano, *campos, **expresiones):
+    filas = heapq.merge(*(
+        _filas_por_paginas(
+            recorridos.order_by('-fecha', '-id_recorrido').values('fecha', 'id_recorrido', *campos, **expresiones),
+            tamano,
+        )
+        for recorridos in tablas
+    ), key=itemgetter('fecha', 'id_recorrido'), reverse=True)
+    while True:
+        pagina = list(itertools.islice(filas, tamano))
+        if not pagina:
+            return
+        yield pagina
+
+
+# --- TRABAJOS DE PDF ---
+CAMPOS_PDF = (
+    'ubicacion_inicio_txt', 'ubicacion_fin_txt', 'kilometraje_inicio', 'kilometraje_fin',
+)
+
+
+def clave_filtros(filtros, usuario_generador):
+    # El PDF lleva impreso quién lo generó: cada usuario reutiliza solo los suyos
+    return hashlib.sha256(json.dumps([filtros, usuario_generador], sort_keys=True).encode()).hexdigest()
+
+
+def _filas_pdf(pagina):
+    for fila in pagina:
+        ki, kf = fila['kilometraje_inicio'], fila['kilometraje_fin']
+        fila['distancia'] = kf - ki if ki and kf else 0
+    return pagina
+
+
+def renderizar_pdf(trabajo, destino):
+    from pypdf import PdfWriter
+    from xhtml2pdf import pisa
+
+    filtros = trabajo.filtros
+    tablas = recorridos_por_tabla(filtros)
+    totales = agregar(tablas, total_kms=KM_RECORRIDO, total_viajes=Count('id_recorrido'))
+
+    template = get_template('PanelAdmin/pdf_template.html')
+    base = {
+        'total_kms': totales['total_kms'], 'total_viajes': totales['total_viajes'],
+        'fecha_generacion': timezone.localtime(), 'subtitulo': subtitulo_reporte(filtros),
+        'usuario_generador': trabajo.usuario_generador,
+    }
+    paginas = paginas_recorridos(
+        tablas, settings.REPORTES_FILAS_POR_BLOQUE,
+        *CAMPOS_PDF, conductor_nombre=F('conductor__nombre'), patente=F('vehiculo__patente'),
+    )
+
+    writer = PdfWriter()
+    with tempfile.TemporaryDirectory() as tmp:
+        primera = True
+        for numero, pagina in enumerate(paginas):
+            ruta = os.path.join(tmp, f'{numero}.pdf')
+            html = template.render({**base, 'recorridos': _filas_pdf(pagina), 'primera': primera})
+            with open(ruta, 'wb') as f:
+                if pisa.CreatePDF(html, dest=f).err:
+                    raise RuntimeError("Error al generar el PDF")
+            writer.append(ruta)
+            primera = False
+        if primera:  # sin viajes: un único bloque con el encabezado y la tabla vacía
+            ruta = os.path.join(tmp, 'vacio.pdf')
+            with open(ruta, 'wb') as f:
+                pisa.CreatePDF(template.render({**base, 'recorridos': [], 'primera': True}), dest=f)
+            writer.append(ruta)
+        with open(destino, 'wb') as f:
+            writer.write(f)
+
+
+def procesar_trabajo(id_trabajo):
+    tomados = TrabajoReporte.objects.filter(id=id_trabajo, estado=TrabajoReporte.PENDIENTE).update(
+        estado=TrabajoReporte.PROCESANDO
+    )
+    if not tomados:
+        return
+    trabajo = TrabajoReporte.objects.get(id=id_trabajo)
+    destino = os.path.join(settings.REPORTES_DIR, f'{trabajo.clave}-{trabajo.id}.pdf')
+    try:
+        os.makedirs(settings.REPORTES_DIR, exist_ok=True)
+        renderizar_pdf(trabajo, destino)
+        trabajo.estado, trabajo.archivo = TrabajoReporte.LISTO, destino
+    except Exception as e:
+        trabajo.estado, trabajo.error = TrabajoReporte.ERROR, str(e)
+    trabajo.terminado = timezone.now()
+    trabajo.save(update_fields=['estado', 'archivo', 'error', 'terminado'])
+
+
+def _iniciar_worker():
+    import django
+    django.setup()
+
+
+_pool = None
+
+
+def pool():
+    global _pool
+    if _pool is None:
+        # spawn: los workers no heredan las conexiones a la BD del proceso web
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.REPORTES_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_iniciar_worker,
+        )
+    return _pool
+
+
+def _encolar(trabajo):
+    global _pool
+    try:
+        pool().submit(procesar_trabajo, trabajo.id)
+    except BrokenProcessPool:
+        # Un worker murió (OOM, kill): el pool ya no acepta trabajos y se arma uno nuevo
+        _pool = None
+        try:
+            pool().submit(procesar_trabajo, trabajo.id)
+        except BrokenProcessPool as e:
+            _pool = None
+            TrabajoReporte.objects.filter(id=trabajo.id).update(
+                estado=TrabajoReporte.ERROR, error=f"No se pudo encolar el trabajo: {e}", terminado=timezone.now(),
+            )
+            trabajo.refresh_from_db()
+
+
+def borrar_vencidos(ahora):
+    """Borra los trabajos de más de REPORTES_RETENCION_DIAS y sus PDFs. Devuelve cuántos."""
+    vencidos = TrabajoReporte.objects.filter(creado__lt=ahora - datetime.timedelta(days=settings.REPORTES_RETENCION_DIAS))
+    for ruta in vencidos.exclude(archivo='').values_list('archivo', flat=True):
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+    return vencidos.delete()[0]
+
+
+def solicitar_pdf(filtros, usuario_generador):
+    clave = clave_filtros(filtros, usuario_generador)
+    ahora = timezone.now()
+
+    # Una limpieza por hora entre todos los workers (add es atómico en el cache compartido)
+    if caches[settings.PANEL_CACHE_ALIAS].add('reportes:limpieza', 1, timeout=3600):
+        borrar_vencidos(ahora)
+    vigencia = ahora - datetime.timedelta(seconds=settings.REPORTES_CACHE_SEGUNDOS)
+
+    # Un trabajo en curso por más de REPORTES_TRABAJO_MAX_SEGUNDOS quedó huérfano
+    # (worker caído, reinicio del servidor): se da por fallido y se vuelve a pedir
+    TrabajoReporte.objects.filter(
+        clave=clave, estado__in=[TrabajoReporte.PENDIENTE, TrabajoReporte.PROCESANDO],
+        creado__lt=ahora - datetime.timedelta(seconds=settings.REPORTES_TRABAJO_MAX_SEGUNDOS),
+    ).update(estado=TrabajoReporte.ERROR, error="Tiempo de generación agotado", terminado=ahora)
+
+    # Mismos filtros: se reutiliza el trabajo en curso o el PDF reciente
+    existente = TrabajoReporte.objects.filter(clave=clave).filter(
+        Q(estado__in=[TrabajoReporte.PENDIENTE, TrabajoReporte.PROCESANDO])
+        | Q(estado=TrabajoReporte.LISTO, terminado__gte=vigencia)
+    ).order_by('-creado').first()
+    if existente and (existente.estado != TrabajoReporte.LISTO or os.path.exists(existente.archivo)):
+        return existente
+
+    trabajo = TrabajoReporte.objects.create(clave=clave, filtros=filtros, usuario_generador=usuario_generador)
+    _encolar(trabajo)
+    return trabajo
@@ -0,0 +1,205 @@
+import datetime
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import Sum, Count, F, Q
+from django.utils import timezone
+
+from .models import Recorrido, CargaCombustible, ResumenDiario
+from . import archivo
+from .cache_panel import invalidar, cacheado
+
+logger = logging.getLogger(__name__)
+
+# Solo cuentan los recorridos con ambos odómetros, igual que Recorrido.distancia
+KM_RECORRIDO = Sum(
+    F('kilometraje_fin') - F('kilometraje_inicio'),
+    filter=Q(kilometraje_fin__isnull=False, kilometraje_inicio__isnull=False),
+)
+CAMPOS_VACIOS = {'km': 0, 'litros': 0, 'costo': 0, 'viajes': 0, 'cargas': 0}
+
+
+# --- ACTUALIZACION INCREMENTAL (una fila vehículo/día) ---
+def recalcular(id_vehiculo, dia):
+    # Un viaje antiguo que seguía abierto se cierra en la tabla de la app, pero su día puede estar archivado
+    rec = _sumar(
+        archivo.modelos(Recorrido, dia), vehiculo_id=id_vehiculo, fecha=dia,
+        km=KM_RECORRIDO, viajes=Count('id_recorrido'),
+    )
+    car = _sumar(
+        archivo.modelos(CargaCombustible, dia), vehiculo_id=id_vehiculo, fecha=dia,
+        litros=Sum('litros'), costo=Sum('costo_total'), cargas=Count('id_carga'),
+    )
+    valores = {
+        'km': rec['km'] or 0, 'viajes': rec['viajes'],
+        'litros': car['litros'] or 0, 'costo': car['costo'] or 0, 'cargas': car['cargas'],
+    }
+    if not valores['viajes'] and not valores['cargas']:
+        ResumenDiario.objects.filter(vehiculo_id=id_vehiculo, dia=dia).delete()
+        return
+    ResumenDiario.objects.update_or_create(vehiculo_id=id_vehiculo, dia=dia, defaults=valores)
+
+
+def recalcular_al_confirmar(claves):
+    """Recalcula los pares (id_vehiculo, dia) después del commit de la transacción en curso."""
+    def ejecutar():
+        for id_vehiculo, dia in claves:
+            recalcular(id_vehiculo, dia)
+        invalidar('resumenes')
+    transaction.on_commit(ejecutar)
+
+
+def _sumar(modelos, vehiculo_id, fecha, **agregados):
+    total = dict.fromkeys(agregados, 0)
+    for modelo in modelos:
+        for nombre, valor in modelo.objects.filter(vehiculo_id=vehiculo_id, fecha=fecha).aggregate(**agregados).items():
+            total[nombre] += valor or 0
+    return total
+
+
+# --- RECONSTRUCCION COMPLETA (tablas de la app y archivo) ---
+def _calcular(desde=None, hasta=None):
+    rango = Q()
+    if desde:
+        rango &= Q(fecha__gte=desde)
+    if hasta:
+        rango &= Q(fecha__lte=hasta)
+
+    filas = defaultdict(lambda: dict(CAMPOS_VACIOS))
+    for modelo in archivo.modelos(Recorrido, desde):
+        recorridos = (
+            modelo.objects.filter(rango).order_by().values('vehiculo_id', 'fecha')
+            .annotate(km=KM_RECORRIDO, viajes=Count('id_recorrido'))
+        )
+        for r in recorridos.iterator(chunk_size=5000):
+            fila = filas[(r['vehiculo_id'], r['fecha'])]
+            fila['km'] += r['km'] or 0
+            fila['viajes'] += r['viajes']
+
+    for modelo in archivo.modelos(CargaCombustible, desde):
+        cargas = (
+            modelo.objects.filter(rango).order_by().values('vehiculo_id', 'fecha')
+            .annotate(litros=Sum('litros'), costo=Sum('costo_total'), cargas=Count('id_carga'))
+        )
+        for c in cargas.iterator(chunk_size=5000):
+            fila = filas[(c['vehiculo_id'], c['fecha'])]
+            fila['litros'] += c['litros'] or 0
+            fila['costo'] += c['costo'] or 0
+            fila['cargas'] += c['cargas']
+    return filas
+
+
+def _reemplazar(filas, desde=None, hasta=None):
+    with transaction.atomic():
+        existentes = ResumenDiario.objects.all()
+        if desde:
+            existentes = existentes.filter(dia__gte=desde)
+        if hasta:
+            existentes = existentes.filter(dia__lte=hasta)
+        existentes.delete()
+        ResumenDiario.objects.bulk_create(
+            (ResumenDiario(vehiculo_id=v, dia=d, **valores) for (v, d), valores in filas.items()),
+            batch_size=1000,
+        )
+    # Puede correr dentro de otra transacción (importación de cargas): se invalida al confirmar
+    transaction.on_commit(lambda: invalidar('resumenes'))
+
+
+def reconstruir(desde=None, hasta=None):
+    filas = _calcular(desde, hasta)
+    _reemplazar(filas, desde, hasta)
+    return len(filas)
+
+
+# --- CONCILIACION CON LA APP EXTERNA ---
+# La app escribe Recorridos y CargaCombustible sin pasar por las señales: los
+# últimos RESUMENES_DIAS_CONCILIAR días se recalculan solos, como mucho una vez
+# cada RESUMENES_CONCILIAR_SEGUNDOS, en un hilo aparte del request que los pidió.
+def conciliar(dias):
+    """Recalcula los últimos `dias` días y reescribe solo si algo cambió. Devuelve si hubo cambios."""
+    hasta = timezone.localdate()
+    desde = hasta - datetime.timedelta(days=dias - 1)
+    filas = _calcular(desde, hasta)
+    guardadas = {
+        (r.pop('vehiculo_id'), r.pop('dia')): r
+        for r in ResumenDiario.objects.filter(dia__range=(desde, hasta)).values('vehiculo_id', 'dia', *CAMPOS_VACIOS)
+    }
+    if filas.keys() == guardadas.keys() and all(
+        abs(filas[k][campo] - guardadas[k][campo]) < 1e-6 for k in filas for campo in CAMPOS_VACIOS
+    ):
+        return False
+    _reemplazar(filas, desde, hasta)
+    return True
+
+
+def _conciliar():
+    try:
+        if conciliar(settings.RESUMENES_DIAS_CONCILIAR):
+            logger.info("Resúmenes diarios corregidos con escrituras de la app externa")
+    except Exception:
+        logger.exception("No se pudieron conciliar los resúmenes diarios")
+    finally:
+        connection.close()
+
+
+def conciliar_en_segundo_plano():
+    if not settings.RESUMENES_CONCILIAR_SEGUNDOS:
+        return
+    # add() es atómico en el cache compartido: un solo worker concilia por intervalo
+    if caches[settings.PANEL_CACHE_ALIAS].add('resumenes:conciliacion', 1, timeout=settings.RESUMENES_CONCILIAR_SEGUNDOS):
+        threading.Thread(target=_conciliar, name='conciliar-resumenes', daemon=True).start()
+
+
+# --- LECTURAS ---
+def totales(**filtros):
+    datos = ResumenDiario.objects.filter(**filtros).aggregate(
+        km=Sum('km'), litros=Sum('litros'), costo=Sum('costo'),
+        viajes=Sum('viajes'), cargas=Sum('cargas'),
+    )
+    return {k: v or 0 for k, v in datos.items()}
+
+
+def hoy_en_vivo():
+    """Totales de hoy leídos de las tablas de la app: incluye lo que la app
+    externa escribió sin actualizar el resumen. Hoy nunca está archivado."""
+    hoy = timezone.localdate()
+    rec = Recorrido.objects.filter(fecha=hoy).aggregate(km=KM_RECORRIDO, viajes=Count('id_recorrido'))
+    car = CargaCombustible.objects.filter(fecha=hoy).aggregate(
+        litros=Sum('litros'), costo=Sum('costo_total'), cargas=Count('id_carga'),
+    )
+    return {k: v or 0 for k, v in {**rec, **car}.items()}
+
+
+def _dia(valor):
+    # Los filtros de reportes llegan como texto AAAA-MM-DD ('' = sin límite)
+    if isinstance(valor, datetime.date) or not valor:
+        return valor or None
+    return datetime.date.fromisoformat(valor)
+
+
+def totales_al_dia(desde=None, hasta=None, en_vivo=None):
+    """Resumen cacheado hasta ayer más hoy en vivo, si el rango lo incluye.
+    `en_vivo`: el resultado de hoy_en_vivo() si la vista ya lo leyó."""
+    hoy = timezone.localdate()
+    desde, hasta = _dia(desde), _dia(hasta)
+    rango = {'dia__lt': hoy}
+    if desde: rango['dia__gte'] = desde
+    if hasta: rango['dia__lte'] = hasta
+    datos = cacheado('totales', ['resumenes'], totales, clave=f'{hoy}:{desde}:{hasta}', **rango)
+    if (desde is None or desde <= hoy) and (hasta is None or hasta >= hoy):
+        en_vivo = hoy_en_vivo() if en_vivo is None else en_vivo
+        datos = {k: datos[k] + en_vivo[k] for k in datos}
+    conciliar_en_segundo_plano()
+    return datos
+
+
+def costo_por_dia(desde, hasta):
+    filas = (
+        ResumenDiario.objects.filter(dia__range=(desde, hasta))
+        .order_by().values('dia').annotate(costo=Sum('costo'))
+    )
+    return {f['dia']: f['costo'] or 0 for f in filas}
@@ -0,0 +1,95 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Usuario, Vehiculo, Recorrido, CargaCombustible, TerminoBusqueda, Zona, RendimientoCarga, Dispositivo
+from . import resumenes, busqueda, espacial, rendimiento
+from .cache_panel import invalidar
+
+
+# --- RESUMEN DIARIO ---
+@receiver(pre_save, sender=Recorrido)
+@receiver(pre_save, sender=CargaCombustible)
+def guardar_clave_anterior(sender, instance, **kwargs):
+    # Un cambio de fecha o vehículo también cambia el resumen del día original
+    instance._clave_resumen = None
+    if instance.pk:
+        instance._clave_resumen = (
+            sender.objects.filter(pk=instance.pk).values_list('vehiculo_id', 'fecha').first()
+        )
+
+
+@receiver(post_save, sender=Recorrido)
+@receiver(post_save, sender=CargaCombustible)
+def actualizar_resumen(sender, instance, **kwargs):
+    claves = {(instance.vehiculo_id, instance.fecha)}
+    anterior = getattr(instance, '_clave_resumen', None)
+    if anterior:
+        claves.add(anterior)
+    resumenes.recalcular_al_confirmar(claves)
+
+
+@receiver(post_delete, sender=Recorrido)
+@receiver(post_delete, sender=CargaCombustible)
+def descontar_resumen(sender, instance, **kwargs):
+    resumenes.recalcular_al_confirmar({(instance.vehiculo_id, instance.fecha)})
+
+
+# --- RENDIMIENTO DE COMBUSTIBLE ---
+@receiver(post_save, sender=CargaCombustible)
+def recalcular_rendimiento(sender, instance, **kwargs):
+    # Cambiar una carga mueve los tramos y líneas base de las siguientes del mismo vehículo
+    desde = instance.fecha
+    anterior = getattr(instance, '_clave_resumen', None)
+    if anterior and anterior[0] == instance.vehiculo_id:
+        desde = min(desde, anterior[1])
+    transaction.on_commit(lambda: rendimiento.recalcular({instance.vehiculo_id: desde}))
+
+
+@receiver(post_delete, sender=CargaCombustible)
+def descontar_rendimiento(sender, instance, **kwargs):
+    RendimientoCarga.objects.filter(carga_id=instance.pk).delete()
+    transaction.on_commit(lambda: rendimiento.recalcular({instance.vehiculo_id: instance.fecha}))
+
+
+# --- INDICE DE BUSQUEDA ---
+TIPO_BUSQUEDA = {Usuario: TerminoBusqueda.USUARIO, Vehiculo: TerminoBusqueda.VEHICULO}
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_save, sender=Vehiculo)
+def indexar_busqueda(sender, instance, **kwargs):
+    busqueda.indexar(TIPO_BUSQUEDA[sender], [instance])
+
+
+@receiver(post_delete, sender=Usuario)
+@receiver(post_delete, sender=Vehiculo)
+def desindexar_busqueda(sender, instance, **kwargs):
+    busqueda.desindexar(TIPO_BUSQUEDA[sender], [instance.pk])
+
+
+# --- INDICE ESPACIAL (solo el de este proceso; los demás lo ven al resincronizar) ---
+@receiver(post_save, sender=Vehiculo)
+def registrar_espacial(sender, instance, **kwargs):
+    espacial.registrar(instance)
+
+
+@receiver(post_delete, sender=Vehiculo)
+def quitar_espacial(sender, instance, **kwargs):
+    espacial.quitar(instance.patente)
+
+
+# --- CACHE DEL PANEL ---
+GRUPO_POR_MODELO = {
+    Usuario: 'usuarios', Vehiculo: 'vehiculos', Recorrido: 'recorridos', CargaCombustible: 'cargas', Zona: 'zonas',
+    Dispositivo: 'dispositivos',
+}
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidar_cache(sender, **kwargs):
+    grupo = GRUPO_POR_MODELO.get(sender)
+    if grupo:
+        # Después del commit, para que nadie vuelva a cachear datos de antes de la escritura
+        transaction.on_commit(lambda: invalidar(grupo))
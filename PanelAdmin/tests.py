@@ -1,3 +1,1381 @@
-from django.test import TestCase
+import asyncio
+import csv
+import datetime
+import io
+import itertools
+import json
+import os
+import tempfile
+import threading
+import uuid
+import zipfile
+from concurrent.futures.process import BrokenProcessPool
+from decimal import Decimal
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+import numpy as np
+from django.apps import apps
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password, make_password
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count, Sum
+from django.http import QueryDict
+from django.test.utils import CaptureQueriesContext
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Usuario, Vehiculo, Recorrido, CargaCombustible, TramoPosiciones, TrabajoReporte, Dispositivo, RolUsuario,
+    Zona, VehiculoEnZona, EventoZona, RecorridoArchivado, CargaArchivada, EventoRecorrido, ResumenDiario,
+)
+from .busqueda import buscar_usuarios, buscar_vehiculos, con_rol, no_admin
+from .despacho import asignar_min_costo
+from .gps import BufferGPS, FixGPS
+from .pool_bd import PoolBD, Saturado, pool_bd
+from .importar import CupoExcedido, ImportacionConductores, ImportacionVehiculos
+from .metricas import PresupuestoExcedido
+from . import archivo, cache_panel, ciclo_recorridos, credenciales, dispositivos, espacial, geocercas, gps, rendimiento, trayectos, posiciones, reportes, resumenes, tiempo_real, views
+
+# Usuarios, Vehiculos, Recorridos y CargaCombustible los crea la app externa: en la
+# base de pruebas se crean aquí, igual que las crearía un dump de producción
+NO_GESTIONADOS = [m for m in apps.get_app_config('PanelAdmin').get_models() if not m._meta.managed]
+
+
+def setUpModule():
+    with connection.schema_editor() as editor:
+        for modelo in NO_GESTIONADOS:
+            editor.create_model(modelo)
+
+
+def tearDownModule():
+    with connection.schema_editor() as editor:
+        for modelo in NO_GESTIONADOS:
+            editor.delete_model(modelo)
+
+
+def _vaciar_no_gestionadas():
+    # El flush de TransactionTestCase no vacía las tablas no gestionadas
+    with connection.constraint_checks_disabled():
+        for modelo in NO_GESTIONADOS:
+            modelo.objects.all().delete()
+
+
+# Cache en memoria por prueba (el del panel es compartido y persiste entre corridas)
+# y sin hilos de fondo que escriban fuera de la transacción de la prueba
+PRUEBAS = override_settings(
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pruebas'},
+        'panel': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pruebas-panel'},
+    },
+    RESUMENES_CONCILIAR_SEGUNDOS=0,
+)
+
+
+def _usuario(n, rol='CONDUCTOR'):
+    return Usuario.objects.create(
+        nombre=f'Conductor {n}', rut=f'{n}-K', correo=f'c{n}@prueba.cl', pin_hash=make_password(None),
+        rol=rol, fecha_creacion=timezone.now(),
+    )
+
+
+def _vehiculo(patente, kilometraje=1000):
+    return Vehiculo.objects.create(patente=patente, modelo='Hilux', kilometraje=kilometraje, fecha_creacion=timezone.now())
+
+
+def _recorrido(conductor, vehiculo, fecha, km_inicio, km_fin):
+    return Recorrido.objects.create(
+        conductor=conductor, vehiculo=vehiculo, fecha=fecha, hora_inicio=datetime.time(8),
+        hora_fin=datetime.time(9), kilometraje_inicio=km_inicio, kilometraje_fin=km_fin,
+    )
+
+
+# --- CACHE VERSIONADO ---
+@PRUEBAS
+class CacheVersionadoTests(TestCase):
+    def setUp(self):
+        cache_panel._cache().clear()
+        self.llamadas = 0
+
+    def _calcular(self):
+        self.llamadas += 1
+        return self.llamadas
+
+    def _leer(self):
+        return cache_panel.cacheado('prueba', ['vehiculos', 'usuarios'], self._calcular)
+
+    def test_invalidar_un_grupo_descarta_la_entrada(self):
+        self.assertEqual(self._leer(), 1)
+        self.assertEqual(self._leer(), 1)
+        cache_panel.invalidar('usuarios')
+        self.assertEqual(self._leer(), 2)
+
+    def test_version_perdida_no_revive_entradas_viejas(self):
+        clave = 'panel:v:vehiculos'
+        self.assertEqual(self._leer(), 1)
+        cache_panel._cache().delete(clave)  # purga del cache
+        self.assertEqual(self._leer(), 2)
+        cache_panel.invalidar('vehiculos')
+        self.assertEqual(self._leer(), 3)
+        # invalidar sin versión guardada tampoco vuelve a un valor ya usado
+        anterior = cache_panel.versiones(['vehiculos'])[0]
+        cache_panel._cache().delete(clave)
+        cache_panel.invalidar('vehiculos')
+        self.assertNotEqual(cache_panel.versiones(['vehiculos'])[0], anterior)
+        self.assertEqual(self._leer(), 4)
+
+    def test_reconstruir_invalida_al_confirmar(self):
+        antes = cache_panel.versiones(['resumenes'])
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                resumenes.reconstruir()
+                self.assertEqual(cache_panel.versiones(['resumenes']), antes)
+        self.assertNotEqual(cache_panel.versiones(['resumenes']), antes)
+
+    def test_posiciones_del_listado_en_vivo(self):
+        _vehiculo('AB-CD12')
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@prueba.cl', 'clave'))
+        self.assertNotContains(self.client.get(reverse('panel_vehiculos')), '-33.4000')
+        # Escritura de la ingesta GPS: SQL directo, sin invalidar el cache
+        gps.escribir_posiciones([FixGPS('AB-CD12', Decimal('-33.400000'), Decimal('-70.600000'), timezone.now())])
+        self.assertContains(self.client.get(reverse('panel_vehiculos')), '-33.4000')
+
+
+
+# --- BUFFER GPS ---
+@PRUEBAS
+class BufferGPSTests(TestCase):
+    def setUp(self):
+        self.vehiculo = _vehiculo('AB-CD12')
+        self.buffer = BufferGPS(max_vehiculos=100, intervalo=3600, max_historial=1000)
+        self.ahora = timezone.now()
+
+    def _fix(self, latitud, segundos=0):
+        ts = self.ahora + datetime.timedelta(seconds=segundos)
+        return FixGPS('AB-CD12', Decimal(latitud), Decimal('-70.600000'), ts)
+
+    def _latitud(self):
+        self.vehiculo.refresh_from_db()
+        return self.vehiculo.latitud
+
+    def test_un_update_con_el_fix_mas_reciente(self):
+        self.buffer.encolar([self._fix('-33.100000', 10), self._fix('-33.200000', 20), self._fix('-33.300000', 5)])
+        self.assertEqual(len(self.buffer), 1)
+        self.assertEqual(self.buffer.vaciar(), 1)
+        self.assertEqual(self._latitud(), Decimal('-33.200000'))
+
+    def test_fixes_vuelven_al_buffer_si_falla_la_escritura(self):
+        self.buffer.encolar([self._fix('-33.100000')])
+        with mock.patch.object(gps, 'escribir_posiciones', side_effect=RuntimeError("BD caída")):
+            with self.assertRaises(RuntimeError):
+                self.buffer.vaciar()
+        self.assertEqual(len(self.buffer), 1)
+        self.assertEqual(self.buffer.vaciar(), 1)
+        self.assertEqual(self._latitud(), Decimal('-33.100000'))
+
+    def test_fix_antiguo_no_pisa_la_posicion(self):
+        self.buffer.encolar([self._fix('-33.100000', 60)])
+        self.buffer.vaciar()
+        self.buffer.encolar([self._fix('-33.900000', 0)])  # reenvío tardío
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(self.buffer.vaciar(), 0)
+        self.assertEqual(self._latitud(), Decimal('-33.100000'))
+        self.buffer.encolar([self._fix('-33.500000', 120)])
+        self.buffer.vaciar()
+        self.assertEqual(self._latitud(), Decimal('-33.500000'))
+
+
+
+# --- HISTORIAL DE POSICIONES ---
+@PRUEBAS
+class HistorialPosicionesTests(TestCase):
+    def setUp(self):
+        cache_panel._cache().clear()
+        self.ahora = timezone.now().replace(microsecond=0)
+
+    def _fix(self, patente, minutos, latitud='-33.400000'):
+        return FixGPS(patente, Decimal(latitud), Decimal('-70.600000'), self.ahora - datetime.timedelta(minutes=minutos))
+
+    def test_trayecto_y_compactacion(self):
+        vehiculo = _vehiculo('AB-CD12')
+        # Un vaciado del buffer por fix: un tramo cada uno
+        for minutos, latitud in ((3, '-33.300000'), (2, '-33.200000'), (1, '-33.100000')):
+            posiciones.registrar_historial([self._fix('AB-CD12', minutos, latitud)])
+        self.assertEqual(TramoPosiciones.objects.count(), 3)
+        posiciones.compactar_pendientes(forzar=True)
+        self.assertEqual(TramoPosiciones.objects.count(), 1)
+        puntos = posiciones.trayecto(vehiculo.pk, self.ahora - datetime.timedelta(minutes=10), self.ahora)
+        self.assertEqual([lat for _, lat, _ in puntos], [-33.3, -33.2, -33.1])
+        self.assertEqual(puntos[0][0], self.ahora - datetime.timedelta(minutes=3))
+
+    def test_patente_reutilizada_va_al_vehiculo_nuevo(self):
+        anterior = _vehiculo('AB-CD12')
+        id_anterior = anterior.pk
+        posiciones.registrar_historial([self._fix('AB-CD12', 2)])
+        with self.captureOnCommitCallbacks(execute=True):
+            anterior.delete()
+            nuevo = _vehiculo('AB-CD12')
+        posiciones.registrar_historial([self._fix('AB-CD12', 1)])
+        self.assertEqual(
+            list(TramoPosiciones.objects.order_by('ts_inicio').values_list('vehiculo_id', flat=True)),
+            [id_anterior, nuevo.pk],
+        )
+
+
+
+# --- RESUMENES DIARIOS ---
+@PRUEBAS
+class ResumenesTests(TestCase):
+    def setUp(self):
+        cache_panel._cache().clear()
+        self.vehiculo = _vehiculo('AB-CD12')
+        self.hoy = timezone.localdate()
+
+    def _carga_externa(self, dia, costo):
+        # bulk_create no dispara señales, igual que la app externa
+        CargaCombustible.objects.bulk_create([CargaCombustible(
+            vehiculo=self.vehiculo, litros=10, costo_total=costo, fecha=dia, hora=datetime.time(12),
+        )])
+
+    def test_hoy_se_lee_en_vivo(self):
+        self.assertEqual(resumenes.totales_al_dia()['costo'], 0)
+        self._carga_externa(self.hoy, 15000)
+        self.assertEqual(resumenes.totales_al_dia()['costo'], 15000)
+
+    def test_conciliar_corrige_dias_anteriores(self):
+        ayer = self.hoy - datetime.timedelta(days=1)
+        self._carga_externa(ayer, 20000)
+        self.assertEqual(resumenes.totales_al_dia(ayer, ayer)['costo'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(resumenes.conciliar(3))
+        self.assertEqual(resumenes.totales_al_dia(ayer, ayer)['costo'], 20000)
+        self.assertFalse(resumenes.conciliar(3))
+
+
+
+# --- REPORTES PDF ---
+@PRUEBAS
+class ReportesPDFTests(TestCase):
+    FILTROS = {'fecha_inicio': '', 'fecha_fin': '', 'usuario': ''}
+
+    def setUp(self):
+        cache_panel._cache().clear()
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = override_settings(REPORTES_DIR=directorio.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.directorio = directorio.name
+
+    def _solicitar(self, usuario='ana'):
+        with mock.patch.object(reportes, '_encolar') as encolar:
+            trabajo = reportes.solicitar_pdf(self.FILTROS, usuario)
+        return trabajo, encolar.called
+
+    def test_cada_usuario_reutiliza_solo_sus_pdfs(self):
+        ana, encolado = self._solicitar('ana')
+        self.assertTrue(encolado)
+        otra_vez, encolado = self._solicitar('ana')
+        self.assertEqual((otra_vez.id, encolado), (ana.id, False))
+        beto, _ = self._solicitar('beto')
+        self.assertNotEqual(beto.id, ana.id)
+
+    def test_trabajo_huerfano_se_vuelve_a_pedir(self):
+        huerfano, _ = self._solicitar()
+        TrabajoReporte.objects.filter(id=huerfano.id).update(creado=timezone.now() - datetime.timedelta(hours=1))
+        nuevo, encolado = self._solicitar()
+        self.assertTrue(encolado)
+        self.assertNotEqual(nuevo.id, huerfano.id)
+        huerfano.refresh_from_db()
+        self.assertEqual(huerfano.estado, TrabajoReporte.ERROR)
+
+    def test_pool_roto_se_rearma_una_vez(self):
+        trabajo = TrabajoReporte.objects.create(clave='x', filtros=self.FILTROS)
+        roto = mock.Mock(**{'submit.side_effect': BrokenProcessPool})
+        with mock.patch.object(reportes, 'pool', return_value=roto):
+            reportes._encolar(trabajo)
+        self.assertEqual(roto.submit.call_count, 2)
+        self.assertEqual(trabajo.estado, TrabajoReporte.ERROR)
+
+    def test_vencidos_se_borran_con_su_pdf(self):
+        viejo = TrabajoReporte.objects.create(clave='v', estado=TrabajoReporte.LISTO, archivo=os.path.join(self.directorio, 'v.pdf'))
+        reciente = TrabajoReporte.objects.create(clave='r', estado=TrabajoReporte.LISTO, archivo=os.path.join(self.directorio, 'r.pdf'))
+        for trabajo in (viejo, reciente):
+            open(trabajo.archivo, 'wb').close()
+        TrabajoReporte.objects.filter(id=viejo.id).update(creado=timezone.now() - datetime.timedelta(days=8))
+        self.assertEqual(reportes.borrar_vencidos(timezone.now()), 1)
+        self.assertEqual(list(TrabajoReporte.objects.values_list('id', flat=True)), [reciente.id])
+        self.assertEqual(os.listdir(self.directorio), ['r.pdf'])
+
+    def test_generar_pdf(self):
+        _recorrido(_usuario(1), _vehiculo('AB-CD12'), timezone.localdate(), 1000, 1042)
+        trabajo = TrabajoReporte.objects.create(clave='x', filtros=self.FILTROS, usuario_generador='ana')
+        reportes.procesar_trabajo(trabajo.id)
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, TrabajoReporte.LISTO, trabajo.error)
+        with open(trabajo.archivo, 'rb') as f:
+            self.assertEqual(f.read(4), b'%PDF')
+
+
+
+# --- PAGINACION DE REPORTES ---
+@PRUEBAS
+@override_settings(REPORTES_FILAS_POR_PAGINA=2)
+class PaginacionReportesTests(TestCase):
+    def setUp(self):
+        cache_panel._cache().clear()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@prueba.cl', 'clave'))
+        self.ana, self.beto = _usuario(1), _usuario(2)
+        vehiculo = _vehiculo('AB-CD12')
+        hoy = timezone.localdate()
+        # Varios viajes el mismo día: el orden se desempata por id
+        with self.captureOnCommitCallbacks(execute=True):  # resúmenes diarios
+            self.recorridos = [
+                _recorrido(conductor, vehiculo, hoy - datetime.timedelta(days=dias), 1000, 1000 + km)
+                for conductor, dias, km in (
+                    (self.ana, 2, 10), (self.beto, 0, 20), (self.ana, 0, 30), (self.ana, 1, 40), (self.beto, 2, 50),
+                )
+            ]
+
+    def _paginas(self, **filtros):
+        ids, parametros = [], filtros
+        while parametros is not None:
+            response = self.client.get(reverse('panel_reportes'), parametros)
+            self.assertEqual(response.status_code, 200)
+            ids.append([r.id_recorrido for r in response.context['recorridos']])
+            siguiente = response.context['pagina_siguiente']
+            parametros = QueryDict(siguiente) if siguiente else None
+        return ids, response.context
+
+    def test_recorre_todas_las_paginas_en_orden(self):
+        ids, _ = self._paginas()
+        esperados = [r.id_recorrido for r in sorted(self.recorridos, key=lambda r: (r.fecha, r.id_recorrido), reverse=True)]
+        self.assertEqual([len(p) for p in ids], [2, 2, 1])
+        self.assertEqual(sum(ids, []), esperados)
+
+    def test_filtro_de_conductor_y_totales(self):
+        ids, contexto = self._paginas(usuario=self.ana.pk)
+        self.assertEqual(len(sum(ids, [])), 3)
+        self.assertEqual(contexto['total_kms'], 80)
+        self.assertEqual(self._paginas()[1]['total_kms'], 150)
+
+    def test_cursor_invalido_vuelve_al_inicio(self):
+        response = self.client.get(reverse('panel_reportes'), {'cursor': 'basura'})
+        self.assertTrue(response.context['es_primera_pagina'])
+
+
+
+# --- EXPORTACION CSV / XLSX ---
+@PRUEBAS
+@override_settings(EXPORTAR_CHUNK=2)
+class ExportacionTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@prueba.cl', 'clave'))
+        conductor, vehiculo = _usuario(1), _vehiculo('AB-CD12')
+        hoy = timezone.localdate()
+        for dias in range(5):
+            _recorrido(conductor, vehiculo, hoy - datetime.timedelta(days=dias), 1000, 1000 + dias)
+
+    def _descargar(self, formato):
+        response = self.client.get(reverse('exportar_reporte', args=['recorridos', formato]))
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv(self):
+        filas = list(csv.reader(io.StringIO(self._descargar('csv').decode('utf-8-sig'))))
+        self.assertEqual(filas[0][0], 'Fecha')
+        self.assertEqual(len(filas), 6)
+        self.assertEqual([f[-1] for f in filas[1:]], ['0', '1', '2', '3', '4'])  # más reciente primero
+
+    def test_xlsx(self):
+        with zipfile.ZipFile(io.BytesIO(self._descargar('xlsx'))) as libro:
+            self.assertIsNone(libro.testzip())
+            hoja = ElementTree.fromstring(libro.read('xl/worksheets/sheet1.xml'))
+        ns = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        filas = hoja.findall('.//s:row', ns)
+        self.assertEqual(len(filas), 6)
+        self.assertEqual(filas[-1].findall('s:c', ns)[-1].find('s:v', ns).text, '4')
+
+    def test_formato_desconocido(self):
+        self.assertEqual(self.client.get(reverse('exportar_reporte', args=['recorridos', 'pdf'])).status_code, 404)
+
+
+
+# --- FLOTA SINTETICA Y BENCHMARK ---
+@PRUEBAS
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        cache_panel._cache().clear()
+
+    def _generar(self):
+        call_command(
+            'generar_flota', '--vehiculos', '5', '--conductores', '5', '--recorridos', '20', '--cargas', '10',
+            '--dias', '5', stdout=io.StringIO(),
+        )
+
+    def test_no_corren_sobre_datos_reales(self):
+        _vehiculo('AB-CD12')
+        with self.assertRaises(CommandError):
+            self._generar()
+        with self.assertRaises(CommandError):
+            call_command('benchmark', '--solo', 'dashboard', stdout=io.StringIO())
+        self.assertEqual(Vehiculo.objects.count(), 1)
+        self.assertFalse(Dispositivo.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+    def test_benchmark_borra_lo_que_crea(self):
+        self._generar()
+        self.assertEqual(Vehiculo.objects.count(), 5)
+        salida = io.StringIO()
+        call_command('benchmark', '--solo', 'dashboard', '--iteraciones', '2', '--calentamiento', '0', stdout=salida)
+        self.assertIn('dashboard', salida.getvalue())
+        self.assertFalse(Dispositivo.objects.exists())
+        self.assertFalse(User.objects.filter(username='benchmark').exists())
+
+
+
+# --- BUSQUEDA Y ROLES ---
+@PRUEBAS
+class BusquedaTests(TestCase):
+    def setUp(self):
+        cache_panel._cache().clear()
+
+    def _externo(self, nombre, rol='CONDUCTOR'):
+        # bulk_create no dispara las señales que indexan, igual que la app externa
+        n = Usuario.objects.count() + 100
+        return Usuario.objects.bulk_create([Usuario(
+            nombre=nombre, rut=f'{n}-K', correo=f'c{n}@prueba.cl', pin_hash=make_password(None), rol=rol,
+        )])[0]
+
+    def _nombres(self, texto):
+        return set(buscar_usuarios(texto).values_list('nombre', flat=True))
+
+    def test_por_prefijo_sin_tildes(self):
+        jose = _usuario(1)
+        jose.nombre = 'José Núñez'
+        jose.save()
+        _usuario(2)
+        self.assertEqual(self._nombres('nun jo'), {'José Núñez'})
+        self.assertEqual(self._nombres('conductor'), {'Conductor 2'})
+        _vehiculo('AB-CD12')
+        self.assertEqual(list(buscar_vehiculos('abcd').values_list('patente', flat=True)), ['AB-CD12'])
+
+    def test_filas_de_la_app_externa(self):
+        self._externo('Ana Pérez')
+        _usuario(1)  # indexado por señal, con un id mayor
+        self.assertEqual(self._nombres('ana'), {'Ana Pérez'})  # hueco: conciliación
+        self._externo('Beto Soto')
+        self.assertEqual(self._nombres('beto'), {'Beto Soto'})  # nuevo: id mayor al último indexado
+        Vehiculo.objects.bulk_create([Vehiculo(patente='ZZ-ZZ99', modelo='Ranger', kilometraje=0)])
+        self.assertEqual(buscar_vehiculos('zz').count(), 1)
+
+    @override_settings(METRICAS_PRESUPUESTO_ESTRICTO=True)
+    def test_vistas_dentro_del_presupuesto(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@prueba.cl', 'clave'))
+        _usuario(1)
+        self._externo('Ana Pérez')
+        response = self.client.get(reverse('api_buscar'), {'q': 'ana'})
+        self.assertEqual([r['texto'] for r in response.json()['resultados']], ['Ana Pérez'])
+        self._externo('Beto Soto')
+        self.assertContains(self.client.get(reverse('panel_conductores'), {'q': 'beto'}), 'Beto Soto')
+        Vehiculo.objects.bulk_create([Vehiculo(patente='ZZ-ZZ99', modelo='Ranger', kilometraje=0)])
+        self.assertContains(self.client.get(reverse('panel_vehiculos'), {'q': 'zz'}), 'ZZ-ZZ99')
+
+    def test_rol_sin_normalizar(self):
+        conductor = self._externo('Conductor', rol='Conductor ')
+        admin = self._externo('Admin', rol='administrador')
+        _usuario(1, rol='ADMIN')
+        self.assertFalse(RolUsuario.objects.filter(usuario__in=[conductor, admin]).exists())
+        self.assertEqual(set(con_rol(RolUsuario.CONDUCTOR).values_list('nombre', flat=True)), {'Conductor'})
+        self.assertEqual(set(no_admin().values_list('nombre', flat=True)), {'Conductor'})
+
+
+
+# --- IMPORTACION CSV ---
+@PRUEBAS
+class ImportacionTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@prueba.cl', 'clave')
+
+    def _csv(self, *lineas):
+        return io.BytesIO('\n'.join(lineas).encode())
+
+    def test_conductores_con_pin_encolado_al_confirmar(self):
+        _usuario(99)
+        archivo = self._csv(
+            'nombre;rut;correo;pin', 'Ana;1-9;ana@prueba.cl;1234', 'Beto;2-7;beto@prueba.cl;5678',
+            'Repetido;1-9;otro@prueba.cl;1111', 'Existente;99-K;x@prueba.cl;2222', 'Sin pin;3-5;c@prueba.cl;',
+        )
+        with mock.patch('PanelAdmin.credenciales._encolar') as encolar:
+            with self.captureOnCommitCallbacks(execute=True):
+                resultado = ImportacionConductores(self.admin).ejecutar(archivo)
+        self.assertEqual(resultado.creados, 2)
+        self.assertEqual(sorted(linea for linea, _ in resultado.errores), [4, 5, 6])
+        ana = Usuario.objects.get(correo='ana@prueba.cl')
+        self.assertTrue(ana.pin_pendiente)  # el hash lo escribe el pool de credenciales
+        self.assertEqual(
+            sorted(c.args[:2] for c in encolar.call_args_list),
+            sorted([(ana.id_usuario, '1234'), (ana.id_usuario + 1, '5678')]),
+        )
+
+    @override_settings(CREDENCIALES_POR_MINUTO=2)
+    def test_conductores_sobre_el_cupo_se_rechazan(self):
+        archivo = self._csv(
+            'nombre,rut,correo,pin', *(f'N{i},{i}-0,n{i}@prueba.cl,{1000 + i}' for i in range(3)),
+        )
+        with mock.patch('PanelAdmin.credenciales._encolar') as encolar:
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(CupoExcedido):
+                    ImportacionConductores(self.admin).ejecutar(archivo)
+        self.assertFalse(Usuario.objects.exists())
+        encolar.assert_not_called()
+
+    def test_vehiculos_y_simulacion(self):
+        lineas = ('patente,modelo,kilometraje', 'ab-cd12,Hilux,1.000', 'EF-GH34,Ranger,abc')
+        resultado = ImportacionVehiculos().ejecutar(self._csv(*lineas), simular=True)
+        self.assertEqual(resultado.creados, 1)
+        self.assertFalse(Vehiculo.objects.exists())
+        ImportacionVehiculos().ejecutar(self._csv(*lineas))
+        self.assertEqual(Vehiculo.objects.get().kilometraje, 1000)
+
+    def test_enteros_con_punto_de_miles(self):
+        archivo = self._csv(
+            'patente,modelo,kilometraje', 'AA-AA11,Hilux,15.000', 'BB-BB22,Hilux,$ 1.234.567', 'CC-CC33,Hilux,12.5',
+            'DD-DD44,Hilux,1.23.456', 'EE-EE55,Hilux,800',
+        )
+        resultado = ImportacionVehiculos().ejecutar(archivo)
+        self.assertEqual(sorted(linea for linea, _ in resultado.errores), [4, 5])
+        self.assertEqual(
+            dict(Vehiculo.objects.values_list('patente', 'kilometraje')),
+            {'AA-AA11': 15000, 'BB-BB22': 1234567, 'EE-EE55': 800},
+        )
+
+
+
+# --- ALTA DE CONDUCTORES ---
+# Un IntegrityError deja la transacción del TestCase inutilizable: se prueba sin envolverla
+@PRUEBAS
+class AltaConductoresTests(TransactionTestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@prueba.cl', 'clave'))
+
+    def tearDown(self):
+        _vaciar_no_gestionadas()
+
+    def _crear(self, n):
+        datos = {'accion': 'crear', 'nombre': f'Nuevo {n}', 'rut': f'{n}-1', 'correo': f'n{n}@prueba.cl', 'password': '1234'}
+        with mock.patch('PanelAdmin.credenciales._encolar'):
+            response = self.client.post(reverse('panel_conductores'), datos)
+        return [str(m) for m in get_messages(response.wsgi_request)]
+
+    def test_la_base_asigna_ids_distintos(self):
+        _usuario(500)
+        self._crear(1)
+        self._crear(2)
+        ids = list(Usuario.objects.filter(correo__startswith='n').values_list('id_usuario', flat=True))
+        self.assertEqual(len(set(ids)), 2)
+        self.assertTrue(all(i > 0 for i in ids))
+
+    def test_insercion_concurrente_se_informa_como_duplicado(self):
+        # Otro admin registró el mismo RUT después de la verificación previa
+        _usuario(7)
+        Usuario.objects.filter(rut='7-K').update(rut='1-1')
+        with mock.patch('PanelAdmin.views.Usuario.objects.filter') as filtro:
+            filtro.return_value.values_list.return_value.first.return_value = None
+            mensajes = self._crear(1)
+        self.assertEqual(mensajes, ["Error: El RUT 1-1 o el correo n1@prueba.cl ya existe."])
+        self.assertEqual(Usuario.objects.filter(rut='1-1').count(), 1)
+
+
+
+# --- CREDENCIALES ---
+# El pool escribe el hash con su propia conexión: los datos tienen que estar confirmados
+@PRUEBAS
+@override_settings(CREDENCIALES_ITERACIONES=1000, CREDENCIALES_COLA_MAX=1)
+class CredencialesTests(TransactionTestCase):
+    def setUp(self):
+        self.conductor = _usuario(1)
+
+    def tearDown(self):
+        credenciales.esperar()
+        _vaciar_no_gestionadas()
+
+    def _pin_hash(self):
+        return Usuario.objects.get(pk=self.conductor.pk).pin_hash
+
+    def test_pin_con_costo_propio_y_claves_del_panel_con_el_de_django(self):
+        credenciales.programar_pin(self.conductor.pk, '4321')
+        credenciales.esperar()
+        pin_hash = self._pin_hash()
+        self.assertTrue(check_password('4321', pin_hash))
+        self.assertEqual(pin_hash.split('$')[1], '1000')
+        self.assertEqual(make_password('clave').split('$')[1], str(PBKDF2PasswordHasher.iterations))
+
+    def test_rollback_no_encola_ni_gasta_cupo(self):
+        original = self._pin_hash()
+        for _ in range(3):
+            with transaction.atomic():
+                credenciales.programar_pin(self.conductor.pk, '4321')
+                transaction.set_rollback(True)
+        self.assertEqual(self._pin_hash(), original)
+
+        hilos = []
+        hashear = credenciales._hashear
+        def registrar(*args):
+            hilos.append(threading.current_thread().name)
+            hashear(*args)
+        with mock.patch.object(credenciales, '_hashear', registrar):
+            credenciales.programar_pin(self.conductor.pk, '4321')
+            credenciales.esperar()
+        self.assertEqual(len(hilos), 1)
+        self.assertTrue(hilos[0].startswith('credenciales'))  # el único cupo sigue libre
+        self.assertTrue(check_password('4321', self._pin_hash()))
+
+    def test_trabajo_perdido_queda_pendiente(self):
+        with mock.patch.object(credenciales, '_encolar'):  # p. ej. el proceso cae antes del hash
+            credenciales.programar_pin(self.conductor.pk, '4321')
+        self.assertTrue(Usuario.objects.get(pk=self.conductor.pk).pin_pendiente)
+
+
+
+# --- TRAYECTOS ---
+@override_settings(TRAYECTOS_VENTANA_SUAVIZADO=0)
+class TrayectosTests(SimpleTestCase):
+    PASO = 1e-4  # ~11 m hacia el norte cada 5 s
+
+    def _viaje(self, avance, detenido, reanuda, base=1_700_000_000):
+        # avance puntos en movimiento, detenido puntos quietos, reanuda puntos más en movimiento
+        lat, actual = [], -33.4
+        for i in range(avance + detenido + reanuda):
+            if i and not avance <= i < avance + detenido:
+                actual += self.PASO
+            lat.append(actual)
+        t = base + 5.0 * np.arange(len(lat))
+        return t, np.array(lat), np.full(len(lat), -70.6)
+
+    def test_paradas_y_saltos(self):
+        t, lat, lon = self._viaje(60, 40, 10)
+        lat[20] += 0.5  # salto aislado de ~55 km en 5 s
+        g = np.zeros(len(t), np.int64)
+        km, puntos, detenido, paradas = trayectos.procesar(t, lat, lon, g, 1)
+
+        paso_m = trayectos.haversine(-33.4, -70.6, -33.4 + self.PASO, -70.6)
+        self.assertAlmostEqual(km[0], 69 * paso_m / 1000, places=4)
+        self.assertEqual(puntos[0], 109)
+        self.assertEqual(detenido[0], 200)
+        parada, = paradas[0]
+        self.assertEqual((parada.inicio.timestamp(), parada.fin.timestamp()), (t[59], t[99]))
+        self.assertAlmostEqual(parada.latitud, lat[59], places=6)
+
+    def test_parada_al_final_de_un_viaje_abierto_no_se_cuenta(self):
+        t, lat, lon = self._viaje(10, 40, 0)
+        g = np.zeros(len(t), np.int64)
+        abierto = trayectos.procesar(t, lat, lon, g, 1, cerrado=np.array([False]))
+        cerrado = trayectos.procesar(t, lat, lon, g, 1)
+        self.assertEqual((abierto[2][0], len(abierto[3][0])), (0, 0))
+        self.assertEqual((cerrado[2][0], len(cerrado[3][0])), (200, 1))
+        self.assertEqual(abierto[0][0], cerrado[0][0])
+
+    def test_corte_solo_suma_lo_nuevo(self):
+        t, lat, lon = self._viaje(30, 0, 0)
+        g = np.zeros(len(t), np.int64)
+        total = trayectos.procesar(t, lat, lon, g, 1)[0][0]
+        parte = trayectos.procesar(t, lat, lon, g, 1, corte=np.array([t[14]]))
+        self.assertAlmostEqual(parte[0][0], total * 15 / 29)
+        self.assertEqual(parte[1][0], 15)
+
+
+
+# --- INDICE ESPACIAL ---
+class IndiceEspacialTests(SimpleTestCase):
+    def setUp(self):
+        rnd = np.random.default_rng(5)
+        self.indice = espacial.IndiceEspacial(celda=0.01)
+        self.posiciones = {}
+        for i, (lat, lon) in enumerate(zip(rnd.uniform(-33.6, -33.3, 300), rnd.uniform(-70.8, -70.5, 300))):
+            self.posiciones[f'P{i}'] = (float(lat), float(lon))
+            self.indice.registrar(Vehiculo(id_vehiculo=i, patente=f'P{i}', latitud=lat, longitud=lon))
+
+    def _fuerza_bruta(self, lat, lon):
+        return sorted(self.posiciones, key=lambda p: espacial.distancia_m(lat, lon, *self.posiciones[p]))
+
+    def test_cercanos_y_radio_coinciden_con_fuerza_bruta(self):
+        for lat, lon in [(-33.45, -70.65), (-33.3, -70.5), (-34.5, -71.5)]:  # el último, lejos de la flota
+            cercanos = [r['patente'] for r in self.indice.cercanos(lat, lon, 7)]
+            self.assertEqual(cercanos, self._fuerza_bruta(lat, lon)[:7])
+        en_radio = {r['patente'] for r in self.indice.en_radio(-33.45, -70.65, 3000)}
+        esperados = {p for p, pos in self.posiciones.items() if espacial.distancia_m(-33.45, -70.65, *pos) <= 3000}
+        self.assertEqual(en_radio, esperados)
+        self.assertTrue(esperados)
+
+    def test_movimiento_cambia_de_celda(self):
+        self.indice.actualizar([FixGPS('P0', -33.0, -70.0, None), FixGPS('NO-EXISTE', -33.0, -70.0, None)])
+        self.assertEqual([r['patente'] for r in self.indice.cercanos(-33.0, -70.0, 1)], ['P0'])
+        self.assertNotIn('P0', {r['patente'] for r in self.indice.en_radio(*self.posiciones['P0'], 1)})
+        self.assertFalse(self.indice.conoce('NO-EXISTE'))
+        cuadrado = [(-33.1, -70.1), (-33.1, -69.9), (-32.9, -69.9), (-32.9, -70.1)]
+        self.assertEqual([r['patente'] for r in self.indice.en_poligono(cuadrado)], ['P0'])
+        self.indice.quitar('P0')
+        self.assertEqual(self.indice.en_poligono(cuadrado), [])
+
+
+@PRUEBAS
+class ApiEspacialTests(TestCase):
+    def setUp(self):
+        espacial._indice = None
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@prueba.cl', 'clave'))
+        for patente, lat in [('AA-AA11', '-33.450000'), ('BB-BB22', '-33.451000'), ('CC-CC33', '-33.600000')]:
+            Vehiculo.objects.create(
+                patente=patente, modelo='Hilux', kilometraje=0, latitud=Decimal(lat), longitud=Decimal('-70.650000'),
+            )
+
+    def tearDown(self):
+        espacial._indice = None
+
+    def test_cercanos_sin_los_que_estan_en_viaje(self):
+        url = reverse('api_vehiculos_cercanos')
+        response = self.client.get(url, {'lat': -33.4501, 'lon': -70.65, 'k': 2})
+        self.assertEqual([r['patente'] for r in response.json()['resultados']], ['AA-AA11', 'BB-BB22'])
+
+        Recorrido.objects.create(
+            conductor=_usuario(1), vehiculo=Vehiculo.objects.get(patente='AA-AA11'),
+            fecha=timezone.localdate(), hora_inicio=datetime.time(8),
+        )
+        response = self.client.get(url, {'lat': -33.4501, 'lon': -70.65, 'radio': 500, 'disponibles': 1})
+        self.assertEqual([r['patente'] for r in response.json()['resultados']], ['BB-BB22'])
+        self.assertEqual(self.client.get(url, {'lat': 95, 'lon': 0}).status_code, 400)
+
+    def test_en_zona(self):
+        poligono = '-33.46,-70.66;-33.46,-70.64;-33.44,-70.64;-33.44,-70.66'
+        response = self.client.get(reverse('api_vehiculos_en_zona'), {'poligono': poligono})
+        self.assertEqual(response.json()['total'], 2)
+        response = self.client.get(reverse('api_vehiculos_en_zona'), {'poligono': '-33.46,-70.66'})
+        self.assertEqual(response.status_code, 400)
+
+
+
+# --- GEOCERCAS ---
+@PRUEBAS
+@override_settings(GEOCERCAS_AUTOMATIZAR_RECORRIDOS=True)
+class GeocercasTests(TestCase):
+    def setUp(self):
+        self.conductor = _usuario(1)
+        self.vehiculo = _vehiculo('AB-CD12')
+        self.vehiculo.conductor = self.conductor
+        self.vehiculo.save()
+        Zona.objects.create(nombre='Base', tipo=Zona.CIRCULO, latitud=-33.45, longitud=-70.65, radio_m=200, es_base=True)
+        self.t0 = timezone.now() - datetime.timedelta(hours=1)
+        geocercas._motor = geocercas.MotorGeocercas()
+        geocercas._motor.cargar()
+
+    def tearDown(self):
+        geocercas._motor = None
+
+    def _ping(self, lat, minuto):
+        return FixGPS('AB-CD12', Decimal(str(lat)), Decimal('-70.65'), self.t0 + datetime.timedelta(minutes=minuto))
+
+    def _eventos(self):
+        return list(EventoZona.objects.order_by('id').values_list('tipo', 'recorrido_id'))
+
+    def test_salir_de_la_base_abre_el_viaje_y_volver_lo_cierra(self):
+        self.assertEqual(geocercas.evaluar([self._ping(-33.45, 0)]), 1)
+        geocercas.procesar_pendientes()
+        self.assertTrue(VehiculoEnZona.objects.filter(vehiculo_id=self.vehiculo.pk).exists())
+
+        geocercas.evaluar([self._ping(-33.46, 5)])
+        self.assertEqual(geocercas.evaluar([self._ping(-33.45, 3)]), 0)  # atrasado: no deshace la salida
+        geocercas.procesar_pendientes()
+        viaje = Recorrido.objects.get(hora_fin__isnull=True)
+        self.assertEqual(viaje.conductor_id, self.conductor.pk)
+        self.assertFalse(VehiculoEnZona.objects.exists())
+
+        geocercas.evaluar([self._ping(-33.45, 30)])
+        geocercas.procesar_pendientes()
+        self.assertEqual(
+            self._eventos(),
+            [(EventoZona.ENTRADA, None), (EventoZona.SALIDA, viaje.pk), (EventoZona.ENTRADA, viaje.pk)],
+        )
+        self.assertIsNotNone(Recorrido.objects.get(pk=viaje.pk).hora_fin)
+
+    def test_transiciones_no_guardadas_se_reintentan(self):
+        geocercas.evaluar([self._ping(-33.45, 0)])
+        with mock.patch.object(geocercas, '_registrar', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                geocercas.procesar_pendientes()
+        self.assertEqual(self._eventos(), [])
+        geocercas.evaluar([self._ping(-33.46, 5)])
+        self.assertEqual(geocercas.procesar_pendientes(), 2)
+        self.assertEqual([tipo for tipo, _ in self._eventos()], [EventoZona.ENTRADA, EventoZona.SALIDA])
+
+
+
+# --- RENDIMIENTO DE COMBUSTIBLE ---
+@override_settings(RENDIMIENTO_VENTANA=10, RENDIMIENTO_MIN_MUESTRAS=3, RENDIMIENTO_Z=2.5, RENDIMIENTO_DESV_MIN=0.05)
+class RendimientoTests(SimpleTestCase):
+    DIA = 86400
+
+    def test_alertas_por_desviacion_de_la_linea_base(self):
+        # Vehículo 1: una carga diaria de 40 l con 400 km entre cargas (10 km/l);
+        # la carga 6 son 80 l para los mismos km y antes de la 7 no hubo viajes.
+        # Vehículo 2: una sola carga, sin tramo conocido.
+        litros = np.array([40, 40, 40, 40, 40, 40, 80, 40, 30], float)
+        carga_v = np.array([1] * 8 + [2], np.int64)
+        carga_ts = np.array([i * self.DIA for i in range(8)] + [0], np.int64)
+        viajes = [(1, (i - 1) * self.DIA + 3600, 400, 7) for i in range(1, 7) if i != 3]
+        viajes += [(1, 2 * self.DIA + 3600, 300, 7), (1, 2 * self.DIA + 7200, 100, 9), (2, 3600, 50, 9)]
+        viaje_v, viaje_ts, viaje_km, viaje_conductor = (np.array(c) for c in zip(*viajes))
+
+        r = rendimiento.procesar(carga_v, carga_ts, litros, viaje_v, viaje_ts, viaje_km.astype(float), viaje_conductor)
+
+        self.assertTrue(np.isnan(r.km[0]) and np.isnan(r.km[8]))
+        self.assertEqual(list(r.km[1:8]), [400] * 6 + [0])
+        self.assertEqual(r.base[6], 10)
+        self.assertAlmostEqual(r.z_rendimiento[6], (5 - 10) / 0.5)
+        self.assertEqual(r.z_rendimiento[4], 0)
+        self.assertEqual(list(np.flatnonzero(r.bajo)), [6])
+        self.assertEqual(list(np.flatnonzero(r.litros_altos)), [6])
+        self.assertEqual(list(np.flatnonzero(r.sin_recorridos)), [7])
+        self.assertEqual((r.conductor[3], r.conductor[0], r.conductor[7]), (7, -1, -1))
+
+
+
+# --- ARCHIVO HISTORICO ---
+@PRUEBAS
+class ArchivoTests(TestCase):
+    def setUp(self):
+        cache_panel._cache().clear()
+        conductor, vehiculo = _usuario(1), _vehiculo('AB-CD12')
+        hoy = timezone.localdate()
+        self.antigua = hoy - datetime.timedelta(days=60)
+        self.viejos = [_recorrido(conductor, vehiculo, self.antigua, 100 * i, 100 * i + 50) for i in range(3)]
+        self.abierto = Recorrido.objects.create(
+            conductor=conductor, vehiculo=vehiculo, fecha=self.antigua, hora_inicio=datetime.time(10),
+        )
+        self.reciente = _recorrido(conductor, vehiculo, hoy, 500, 520)
+        self.carga_vieja = CargaCombustible.objects.create(
+            vehiculo=vehiculo, litros=40.5, costo_total=50000, fecha=self.antigua, hora=datetime.time(7),
+        )
+        CargaCombustible.objects.create(vehiculo=vehiculo, litros=30, costo_total=40000, fecha=hoy, hora=datetime.time(7))
+
+    def _totales(self, filtros):
+        return (
+            reportes.agregar(reportes.recorridos_por_tabla(filtros), n=Count('id_recorrido'), km=Sum('kilometraje_fin')),
+            reportes.agregar(reportes.cargas_por_tabla(filtros), n=Count('id_carga'), litros=Sum('litros')),
+        )
+
+    def test_archivar_mueve_lo_antiguo_y_los_reportes_no_cambian(self):
+        antes = self._totales({})
+        self.assertEqual(archivo.modelos(Recorrido), [Recorrido])
+
+        call_command('archivar_historial', '--dias', '30', '--lote', '2', stdout=io.StringIO())
+
+        self.assertEqual(
+            sorted(RecorridoArchivado.objects.values_list('id_recorrido', flat=True)),
+            [r.pk for r in self.viejos],
+        )
+        self.assertEqual(
+            set(Recorrido.objects.values_list('pk', flat=True)), {self.abierto.pk, self.reciente.pk},
+        )  # el viaje abierto se queda: la app aún lo cierra
+        carga = CargaArchivada.objects.get()
+        self.assertEqual((carga.pk, carga.litros, carga.fecha), (self.carga_vieja.pk, 40.5, self.antigua))
+        self.assertEqual(archivo.ultima_fecha_archivada(), self.antigua)
+        self.assertEqual(self._totales({}), antes)
+        # Un rango que no llega a lo archivado no consulta el archivo
+        self.assertEqual(archivo.modelos(Recorrido, self.antigua + datetime.timedelta(days=1)), [Recorrido])
+
+
+
+# --- ADMIN SOBRE TABLAS GRANDES ---
+@PRUEBAS
+@override_settings(ADMIN_CONTEO_MAX=5)
+class AdminTablasGrandesTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@prueba.cl', 'clave'))
+        self.conductor, self.vehiculo = _usuario(1), _vehiculo('AB-CD12')
+        self.url = reverse('admin:PanelAdmin_recorrido_changelist')
+
+    def _crear(self, cantidad, desde=0):
+        inicio = datetime.date(2024, 1, 15)
+        for i in range(desde, desde + cantidad):
+            _recorrido(self.conductor, self.vehiculo, inicio + datetime.timedelta(days=40 * i), i, 10 + 3 * i)
+
+    def _listar(self, params=None):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(self.url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return response, [c['sql'] for c in consultas]
+
+    def test_consultas_no_crecen_con_las_filas(self):
+        self._crear(3)
+        _, pocas = self._listar()
+        self._crear(6, desde=3)
+        response, muchas = self._listar()
+        self.assertEqual(len(pocas), len(muchas))
+        self.assertFalse([sql for sql in muchas if 'DISTINCT' in sql.upper()])  # jerarquía de fechas sin DISTINCT
+        self.assertEqual(response.context['cl'].result_count, 5)  # conteo con tope ADMIN_CONTEO_MAX
+
+    def test_jerarquia_de_fechas_y_orden_por_distancia(self):
+        self._crear(4)
+        response, _ = self._listar({'fecha__year': 2024})
+        meses = [d.month for d in response.context['cl'].queryset.dates('fecha', 'month')]
+        self.assertEqual(meses, [1, 2, 3, 4, 5])  # marzo no tiene filas: se ofrece igual, sin DISTINCT
+        response, _ = self._listar({'o': '-4'})
+        # Como Recorrido.distancia: un odómetro en 0 cuenta como sin dato
+        self.assertEqual([r.distancia_km for r in response.context['cl'].result_list], [16, 14, 12, 0])
+
+    def test_archivo_es_de_solo_lectura(self):
+        response = self.client.get(reverse('admin:PanelAdmin_recorridoarchivado_add'))
+        self.assertEqual(response.status_code, 403)
+
+
+# --- EVENTOS DE VIAJE (app del conductor) ---
+@PRUEBAS
+class EventosRecorridoTests(TestCase):
+    def setUp(self):
+        self.vehiculo = _vehiculo('AB-CD12', kilometraje=5000)
+        self.conductor = _usuario(1)
+        self.viaje = uuid.uuid4()
+        self.ahora = timezone.now()
+
+    def _evento(self, tipo, minutos, indice=0, **datos):
+        datos = {
+            'clave': uuid.uuid4(), 'viaje': self.viaje, 'tipo': tipo,
+            'ts': (self.ahora - datetime.timedelta(minutes=minutos)).isoformat(), **datos,
+        }
+        if tipo == 'INICIO':
+            datos.setdefault('conductor', self.conductor.pk)
+            datos.setdefault('patente', self.vehiculo.patente)
+        evento = ciclo_recorridos.parsear_evento(datos)
+        evento.indice = indice
+        return evento
+
+    def test_reenvio_no_aplica_dos_veces(self):
+        eventos = [
+            self._evento('INICIO', 60, 0, kilometraje=5000),
+            self._evento('PUNTO', 30, 1, latitud=-33.4, longitud=-70.6),
+            self._evento('FIN', 10, 2, kilometraje=5042),
+        ]
+        primero = ciclo_recorridos.aplicar(eventos)
+        self.assertEqual((primero.aplicados, primero.pendientes, primero.duplicados), (3, 0, 0))
+        self.assertEqual(len(primero.fixes), 1)
+        segundo = ciclo_recorridos.aplicar(eventos)
+        self.assertEqual((segundo.aplicados, segundo.duplicados), (0, 3))
+        recorrido = Recorrido.objects.get()
+        self.assertEqual((recorrido.kilometraje_inicio, recorrido.kilometraje_fin), (5000, 5042))
+        self.assertEqual(EventoRecorrido.objects.count(), 3)
+
+    def test_eventos_antes_del_inicio_esperan(self):
+        fin = self._evento('FIN', 10, kilometraje=5042)
+        resultado = ciclo_recorridos.aplicar([fin])
+        self.assertEqual((resultado.aplicados, resultado.pendientes), (0, 1))
+        self.assertFalse(Recorrido.objects.exists())
+        ciclo_recorridos.aplicar([self._evento('INICIO', 60)])
+        recorrido = Recorrido.objects.get()
+        self.assertIsNotNone(recorrido.hora_fin)
+        self.assertFalse(EventoRecorrido.objects.filter(aplicado=False).exists())
+
+    def test_inicio_repetido_con_otra_clave(self):
+        ciclo_recorridos.aplicar([self._evento('INICIO', 60)])
+        resultado = ciclo_recorridos.aplicar([self._evento('INICIO', 59)])
+        self.assertEqual(resultado.rechazados, [{'indice': 0, 'message': "El viaje ya fue iniciado con otra clave"}])
+        self.assertEqual(Recorrido.objects.count(), 1)
+
+    def test_envios_en_paralelo(self):
+        # El segundo envío no ve lo que el primero aún no confirmaba
+        real = ciclo_recorridos._Lote.cargar_anteriores
+        ciego = [True]
+
+        def cargar_anteriores(lote, viajes):
+            if ciego[0]:
+                ciego[0] = False
+                viajes = set()
+            return real(lote, viajes)
+
+        ciclo_recorridos.aplicar([self._evento('INICIO', 60)])
+        with mock.patch.object(ciclo_recorridos._Lote, 'cargar_anteriores', cargar_anteriores):
+            resultado = ciclo_recorridos.aplicar([self._evento('PUNTO', 30, latitud=-33.4, longitud=-70.6)])
+        self.assertEqual((resultado.aplicados, resultado.pendientes), (1, 0))
+        self.assertFalse(EventoRecorrido.objects.filter(aplicado=False).exists())
+
+        # Un INICIO repetido en paralelo espera el bloqueo del vehículo y ve el viaje ya abierto
+        ciego[0] = True
+        with mock.patch.object(ciclo_recorridos._Lote, 'cargar_anteriores', cargar_anteriores):
+            resultado = ciclo_recorridos.aplicar([self._evento('INICIO', 60)])
+        self.assertEqual(resultado.rechazados, [{'indice': 0, 'message': "El viaje ya fue iniciado con otra clave"}])
+        self.assertEqual(Recorrido.objects.count(), 1)
+
+    def test_resumen_diario_al_terminar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ciclo_recorridos.aplicar([
+                self._evento('INICIO', 60, 0, kilometraje=5000), self._evento('FIN', 10, 1, kilometraje=5042),
+            ])
+        resumen = ResumenDiario.objects.get(vehiculo=self.vehiculo)
+        self.assertEqual((resumen.km, resumen.viajes), (42, 1))
+
+    def test_inicio_toma_el_viaje_abierto_por_la_geocerca(self):
+        Recorrido.objects.create(
+            conductor=self.conductor, vehiculo=self.vehiculo, fecha=timezone.localdate(),
+            hora_inicio=datetime.time(8), kilometraje_inicio=5000,
+        )
+        resultado = ciclo_recorridos.aplicar([
+            self._evento('INICIO', 60, 0), self._evento('FIN', 10, 1, kilometraje=5042),
+        ])
+        self.assertEqual(resultado.rechazados, [])
+        recorrido = Recorrido.objects.get()
+        self.assertEqual(resultado.recorridos, {str(self.viaje): recorrido.pk})
+        self.assertEqual(recorrido.kilometraje_fin, 5042)
+
+    def test_inicio_con_viaje_en_curso_se_rechaza(self):
+        ciclo_recorridos.aplicar([self._evento('INICIO', 60)])
+        otro_conductor = _usuario(2)
+        en_curso = {'indice': 0, 'message': "El vehículo o el conductor ya tiene un viaje en curso"}
+        self.viaje = uuid.uuid4()
+        self.assertEqual(ciclo_recorridos.aplicar([self._evento('INICIO', 50)]).rechazados, [en_curso])
+        self.viaje = uuid.uuid4()
+        resultado = ciclo_recorridos.aplicar([self._evento('INICIO', 50, conductor=otro_conductor.pk)])
+        self.assertEqual(resultado.rechazados, [en_curso])
+        self.assertEqual(Recorrido.objects.count(), 1)
+
+        # Subidos juntos sin señal: terminado el primero, el siguiente puede empezar
+        primero = EventoRecorrido.objects.get().viaje
+        fin = self._evento('FIN', 40, 0, kilometraje=5020)
+        fin.viaje = primero
+        self.viaje = uuid.uuid4()
+        resultado = ciclo_recorridos.aplicar([fin, self._evento('INICIO', 30, 1)])
+        self.assertEqual((resultado.aplicados, resultado.rechazados), (2, []))
+        self.assertEqual(Recorrido.objects.filter(hora_fin__isnull=True).count(), 1)
+
+    @override_settings(RECORRIDOS_PENDIENTES_MAX=2, RECORRIDOS_PENDIENTES_HORAS=24)
+    def test_pendientes_con_tope_y_vencimiento(self):
+        dispositivo = Dispositivo.objects.create(nombre='App', vehiculo=self.vehiculo, token_hash='x', prefijo='x')
+        activo = dispositivos.DispositivoActivo(dispositivo.id, self.vehiculo.patente, 1, 10)
+        eventos = []
+        for indice in range(3):
+            self.viaje = uuid.uuid4()
+            eventos.append(self._evento('PUNTO', 30 - indice, indice))
+        resultado = ciclo_recorridos.aplicar(eventos, activo)
+        self.assertEqual(resultado.pendientes, 2)
+        self.assertEqual(resultado.rechazados, [{'indice': 2, 'message': "Demasiados eventos esperando el inicio de su viaje"}])
+
+        # Un INICIO que nunca llega no los deja para siempre
+        ahora = timezone.now()
+        EventoRecorrido.objects.update(recibido=ahora - datetime.timedelta(hours=25))
+        self.assertEqual(ciclo_recorridos.borrar_pendientes_vencidos(ahora), 2)
+        self.assertFalse(EventoRecorrido.objects.exists())
+        self.assertEqual(ciclo_recorridos.aplicar([self._evento('PUNTO', 5)], activo).pendientes, 1)
+
+
+
+# --- ASIGNACION DE COSTO MINIMO ---
+class AsignacionMinCostoTests(SimpleTestCase):
+    def _fuerza_bruta(self, costo):
+        n, m = costo.shape
+        if n <= m:
+            return min(sum(costo[i, c] for i, c in enumerate(cols)) for cols in itertools.permutations(range(m), n))
+        return self._fuerza_bruta(costo.T)
+
+    def test_igual_a_fuerza_bruta(self):
+        generador = np.random.default_rng(7)
+        for n, m in [(1, 1), (3, 3), (5, 5), (4, 6), (6, 4), (2, 7), (6, 6)]:
+            for _ in range(20):
+                costo = generador.integers(0, 20, size=(n, m)).astype(float)  # con empates
+                with self.subTest(forma=(n, m)):
+                    filas, columnas = asignar_min_costo(costo)
+                    self.assertEqual(len(filas), min(n, m))
+                    self.assertEqual(len(set(filas)), len(filas))
+                    self.assertEqual(len(set(columnas)), len(columnas))
+                    self.assertEqual(list(filas), sorted(filas))
+                    self.assertAlmostEqual(costo[filas, columnas].sum(), self._fuerza_bruta(costo))
+
+    def test_matriz_vacia(self):
+        filas, columnas = asignar_min_costo(np.empty((0, 3)))
+        self.assertEqual((len(filas), len(columnas)), (0, 0))
+
+# Las vistas async leen la BD desde el pool de hilos: los datos tienen que estar confirmados
+@PRUEBAS
+@override_settings(DISPOSITIVOS_REQUIERE_TOKEN=False)
+class IngestaGPSTests(TransactionTestCase):
+    def tearDown(self):
+        _vaciar_no_gestionadas()
+
+    def _enviar(self, fix):
+        return self.client.post(reverse('api_gps_update'), json.dumps(fix), content_type='application/json')
+
+    def test_patente_desconocida_se_puede_reintentar(self):
+        fix = {'patente': 'ZZ-ZZ99', 'latitud': -33.4, 'longitud': -70.6, 'ts': timezone.now().isoformat()}
+        self.assertEqual(self._enviar(fix).status_code, 404)
+        _vehiculo('ZZ-ZZ99')
+        response = self._enviar(fix)
+        self.assertEqual(response.json()['message'], 'Ubicación actualizada')
+        gps.buffer_gps.vaciar()
+        self.assertEqual(Vehiculo.objects.get().latitud, Decimal('-33.400000'))
+
+
+
+@PRUEBAS
+class DispositivosTests(TransactionTestCase):
+    def setUp(self):
+        dispositivos._registro = dispositivos.RegistroDispositivos()
+        dispositivos._limitador = dispositivos.Limitador()
+        self.vehiculo = _vehiculo('AB-CD12')
+        self.dispositivo = Dispositivo(nombre='Rastreador', vehiculo=self.vehiculo, fixes_por_segundo=0.01, rafaga=3)
+        self.token = dispositivos.emitir_token(self.dispositivo)
+        self.dispositivo.save()
+        self.segundo = 0
+
+    def tearDown(self):
+        gps.buffer_gps.vaciar()
+        _vaciar_no_gestionadas()
+
+    def _fix(self, patente='AB-CD12'):
+        self.segundo += 1
+        ts = timezone.now() - datetime.timedelta(minutes=5) + datetime.timedelta(seconds=self.segundo)
+        return {'patente': patente, 'latitud': -33.4, 'longitud': -70.6, 'ts': ts.isoformat()}
+
+    def _enviar(self, datos, token=None, url='api_gps_update'):
+        encabezados = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        return self.client.post(reverse(url), json.dumps(datos), content_type='application/json', **encabezados)
+
+    def test_token_obligatorio_por_defecto(self):
+        self.assertEqual(self._enviar(self._fix()).status_code, 401)
+        self.assertEqual(self._enviar(self._fix(), token='inventado').status_code, 401)
+        self.assertEqual(self._enviar(self._fix(), token=self.token).status_code, 200)
+        self.assertEqual(self._enviar(self._fix('ZZ-ZZ99'), token=self.token).status_code, 403)
+
+        # Revocado desde el admin: la versión del cache se revisa cada REVISION_VERSION_S
+        self.dispositivo.activo = False
+        self.dispositivo.save()
+        with mock.patch.object(dispositivos, 'REVISION_VERSION_S', 0):
+            self.assertEqual(self._enviar(self._fix(), token=self.token).status_code, 401)
+
+    def test_limite_de_tasa_y_rafaga(self):
+        for _ in range(3):
+            self.assertEqual(self._enviar(self._fix(), token=self.token).status_code, 200)
+        response = self._enviar(self._fix(), token=self.token)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+        lote = [self._fix() for _ in range(4)]
+        self.assertEqual(self._enviar(lote, token=self.token, url='api_gps_batch').status_code, 413)
+
+
+
+class PoolBDTests(SimpleTestCase):
+    def test_rechaza_con_la_cola_llena_y_libera_al_terminar(self):
+        pool = PoolBD(conexiones=1, cola_max=1)
+        liberar = threading.Event()
+
+        async def escenario():
+            ocupados = [asyncio.ensure_future(pool.ejecutar(liberar.wait)) for _ in range(2)]
+            await asyncio.sleep(0)  # ambos tomaron su lugar (uno corriendo, otro en cola)
+            with self.assertRaises(Saturado):
+                await pool.ejecutar(lambda: None)
+            liberar.set()
+            await asyncio.gather(*ocupados)
+            self.assertEqual(len(pool), 0)
+            return await pool.ejecutar(lambda: 'ok')
+
+        self.assertEqual(asyncio.run(escenario()), 'ok')
+
+
+@PRUEBAS
+class IngestaAsyncTests(TransactionTestCase):
+    def setUp(self):
+        dispositivos._registro = dispositivos.RegistroDispositivos()
+        espacial._indice = None
+        self.vehiculo = _vehiculo('AB-CD12')
+        pasarela = Dispositivo(nombre='Pasarela')
+        self.encabezados = {'HTTP_AUTHORIZATION': f'Bearer {dispositivos.emitir_token(pasarela)}'}
+        pasarela.save()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@prueba.cl', 'clave'))
+
+    def tearDown(self):
+        gps.buffer_gps.vaciar()
+        _vaciar_no_gestionadas()
+
+    def _lote(self, *fixes):
+        return self.client.post(reverse('api_gps_batch'), json.dumps(fixes), content_type='application/json', **self.encabezados)
+
+    def test_lote_parcial_y_pool_saturado(self):
+        ts = (timezone.now() - datetime.timedelta(minutes=1)).isoformat()
+        fix = {'patente': 'AB-CD12', 'latitud': -33.4, 'longitud': -70.6, 'ts': ts}
+        response = self._lote(fix, fix, {'patente': 'AB-CD12'}, 'no es un fix')
+        self.assertEqual(response.status_code, 202)
+        datos = response.json()
+        self.assertEqual((datos['aceptados'], datos['duplicados']), (1, 1))
+        self.assertEqual([r['indice'] for r in datos['rechazados']], [2, 3])
+        gps.buffer_gps.vaciar()
+        self.assertEqual(Vehiculo.objects.get().latitud, Decimal('-33.400000'))
+
+        # Sin lugar en el pool: la API de lectura responde 503, la ingesta sigue en memoria
+        with mock.patch.object(pool_bd, '_en_curso', pool_bd.conexiones + pool_bd.cola_max):
+            response = self.client.get(reverse('api_v1_listado', args=['vehiculos']))
+            self.assertEqual((response.status_code, response['Retry-After']), (503, '1'))
+            otro = dict(fix, ts=timezone.now().isoformat(), latitud=-33.5)
+            self.assertEqual(self._lote(otro).status_code, 202)
+
+
+@PRUEBAS
+@override_settings(DISPOSITIVOS_REQUIERE_TOKEN=False)
+class ApiEventosRecorridoTests(TransactionTestCase):
+    def setUp(self):
+        dispositivos._registro = dispositivos.RegistroDispositivos()
+        dispositivos._limitador = dispositivos.Limitador()
+        self.vehiculo = _vehiculo('AB-CD12')
+        self.conductor = _usuario(1)
+        dispositivo = Dispositivo(nombre='App', vehiculo=self.vehiculo, fixes_por_segundo=0.01, rafaga=3)
+        self.token = dispositivos.emitir_token(dispositivo)
+        dispositivo.save()
+
+    def tearDown(self):
+        gps.buffer_gps.vaciar()
+        _vaciar_no_gestionadas()
+
+    def _enviar(self, eventos, token=None):
+        encabezados = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        return self.client.post(
+            reverse('api_recorridos_eventos'), json.dumps({'eventos': eventos}), content_type='application/json',
+            **encabezados,
+        )
+
+    def _inicio(self):
+        return {
+            'clave': str(uuid.uuid4()), 'viaje': str(uuid.uuid4()), 'tipo': 'INICIO',
+            'ts': timezone.now().isoformat(), 'conductor': self.conductor.pk,
+        }
+
+    def test_token_obligatorio_aunque_los_gps_no_lo_pidan(self):
+        self.assertEqual(self._enviar([self._inicio()]).status_code, 401)
+        self.assertFalse(Recorrido.objects.exists())
+        response = self._enviar([self._inicio()], token=self.token)
+        self.assertEqual(response.json()['aplicados'], 1)
+        self.assertEqual(Recorrido.objects.get().vehiculo_id, self.vehiculo.pk)
+
+    def test_limite_de_tasa(self):
+        self.assertEqual(self._enviar([self._inicio() for _ in range(4)], token=self.token).status_code, 413)
+        self.assertEqual(self._enviar([self._inicio() for _ in range(3)], token=self.token).status_code, 200)
+        response = self._enviar([self._inicio()], token=self.token)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+    def test_error_interno_no_muestra_detalles(self):
+        with mock.patch.object(ciclo_recorridos, 'aplicar', side_effect=RuntimeError('tabla EventosRecorrido')), \
+                self.assertLogs('PanelAdmin.views', 'ERROR'):
+            response = self._enviar([self._inicio()], token=self.token)
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json()['message'], 'Error interno, reintente más tarde')
+
+
+# --- TIEMPO REAL ---
+@PRUEBAS
+class TiempoRealTests(TestCase):
+    def _fix(self, patente='AB-CD12'):
+        return FixGPS(patente, Decimal('-33.400000'), Decimal('-70.600000'), timezone.now())
+
+    def test_broker_local_entrega_a_los_suscriptores(self):
+        broker = tiempo_real.BrokerLocal(max_cola=2)
+
+        async def escuchar():
+            _, cola = broker.suscribir()
+            # Desde otro hilo, como el del buffer GPS; la cola llena descarta lo más antiguo
+            await asyncio.to_thread(broker.publicar, [{'patente': 'A'}])
+            await asyncio.to_thread(broker.publicar, [{'patente': 'B'}])
+            await asyncio.to_thread(broker.publicar, [{'patente': 'C'}])
+            await asyncio.sleep(0)
+            return [(await cola.get())[0]['patente'] for _ in range(cola.qsize())]
+
+        self.assertEqual(asyncio.run(escuchar()), ['B', 'C'])
+        self.assertEqual({m['patente'] for m in broker.foto()}, {'A', 'B', 'C'})
+
+    def test_broker_caido_no_falla_la_escritura(self):
+        vehiculo = _vehiculo('AB-CD12')
+        with mock.patch.object(tiempo_real, '_broker', mock.Mock(**{'publicar.side_effect': ConnectionError})):
+            with self.assertLogs('PanelAdmin.tiempo_real', 'ERROR'):
+                self.assertEqual(gps.escribir_posiciones([self._fix()]), 1)
+        vehiculo.refresh_from_db()
+        self.assertEqual(vehiculo.latitud, Decimal('-33.400000'))
+
+    def test_sin_stream_bajo_wsgi(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@prueba.cl', 'clave'))
+        self.assertEqual(self.client.get(reverse('api_posiciones_stream')).status_code, 204)
+        self.assertNotContains(self.client.get(reverse('panel_rutas')), 'EventSource')
+
+
+# --- PRESUPUESTO DE CONSULTAS ---
+# Vistas async (api/v1) leen la BD desde el pool de hilos: los datos tienen que
+# estar confirmados, así que aquí no sirve la transacción de TestCase
+@PRUEBAS
+@override_settings(METRICAS_PRESUPUESTO_ESTRICTO=True)
+class PresupuestoConsultasTests(TransactionTestCase):
+    VISTAS_PANEL = (
+        'home', 'panel_dashboard', 'panel_rutas', 'panel_vehiculos', 'panel_combustible',
+        'panel_reportes', 'panel_conductores', 'panel_zonas',
+    )
+
+    def setUp(self):
+        cache_panel._cache().clear()
+        call_command(
+            'generar_flota', '--vehiculos', '30', '--conductores', '20', '--recorridos', '400',
+            '--cargas', '150', '--dias', '10', stdout=io.StringIO(),
+        )
+        admin = User.objects.create_superuser('admin', 'admin@prueba.cl', 'clave')
+        self.client.force_login(admin)
+
+    def tearDown(self):
+        _vaciar_no_gestionadas()
+
+    def test_vistas_del_panel(self):
+        # Dos veces: con el cache vacío y con el cache lleno
+        for nombre in self.VISTAS_PANEL:
+            for _ in range(2):
+                with self.subTest(vista=nombre):
+                    self.assertEqual(self.client.get(reverse(nombre)).status_code, 200)
+
+    def test_reportes_con_filtros(self):
+        conductor = Recorrido.objects.values_list('conductor_id', flat=True).first()
+        hoy = timezone.localdate()
+        for filtros in ({'usuario': conductor}, {'fecha_inicio': hoy - datetime.timedelta(days=3), 'fecha_fin': hoy}):
+            with self.subTest(filtros=filtros):
+                self.assertEqual(self.client.get(reverse('panel_reportes'), filtros).status_code, 200)
+
+    def test_api_v1(self):
+        for recurso in ('vehiculos', 'rutas-activas', 'recorridos', 'cargas'):
+            with self.subTest(recurso=recurso):
+                url = reverse('api_v1_listado', args=[recurso])
+                response = self.client.get(url, {'limite': 50})
+                self.assertEqual(response.status_code, 200)
+                siguiente = response.json()['siguiente']
+                if siguiente:
+                    self.assertEqual(self.client.get(url, {'limite': 50, 'cursor': siguiente}).status_code, 200)
+                self.assertEqual(
+                    self.client.get(url, {'limite': 50}, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304,
+                )
+
+    def test_api_v1_etag_cambia_con_escrituras_externas(self):
+        url = reverse('api_v1_listado', args=['vehiculos'])
+        etag = self.client.get(url)['ETag']
+        # Como la app externa: sin señales ni invalidación del cache
+        Vehiculo.objects.filter(pk=Vehiculo.objects.order_by('pk').values('pk')[:1]).update(kilometraje=1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_api_v1_cursor_recorre_todo_sin_repetir(self):
+        # Orden (-fecha, -id_recorrido): muchas filas comparten fecha, el cursor tiene que desempatar por id
+        url = reverse('api_v1_listado', args=['recorridos'])
+        esperados = list(Recorrido.objects.order_by('-fecha', '-id_recorrido').values_list('id_recorrido', flat=True))
+        vistos, params = [], {'limite': 37}
+        while True:
+            datos = self.client.get(url, params).json()
+            vistos += [r['id_recorrido'] for r in datos['resultados']]
+            if not datos['siguiente']:
+                break
+            params['cursor'] = datos['siguiente']
+        self.assertEqual(vistos, esperados)
+        self.assertEqual(self.client.get(url, {'cursor': 'no-es-fecha_1'}).status_code, 400)
+
+    def test_presupuesto_excedido_falla(self):
+        with mock.patch.object(views.panel_dashboard, 'presupuesto_consultas', 1):
+            with self.assertRaises(PresupuestoExcedido):
+                self.client.get(reverse('panel_dashboard'))
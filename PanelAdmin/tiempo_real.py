@@ -0,0 +1,154 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+# --- BROKER EN PROCESO ---
+class BrokerLocal:
+    """
+    Pub/sub en memoria. Cada suscriptor es una cola asyncio con su event loop;
+    publicar es seguro desde cualquier hilo (p. ej. el hilo del buffer GPS).
+    Guarda la última posición por patente para mandar una foto inicial sin ir a la BD.
+
+    Solo ve los fixes que escribe su propio proceso: con la ingesta repartida en
+    varios workers usar BrokerRedis (TIEMPO_REAL_BROKER).
+    """
+
+    def __init__(self, max_cola=None):
+        self.max_cola = max_cola or settings.TIEMPO_REAL_MAX_COLA
+        self._suscriptores = set()
+        self._ultimas = {}
+        self._lock = threading.Lock()
+
+    def suscribir(self):
+        suscripcion = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.max_cola))
+        with self._lock:
+            self._suscriptores.add(suscripcion)
+        return suscripcion
+
+    def desuscribir(self, suscripcion):
+        with self._lock:
+            self._suscriptores.discard(suscripcion)
+
+    def foto(self):
+        with self._lock:
+            return list(self._ultimas.values())
+
+    def publicar(self, mensajes):
+        if not mensajes:
+            return
+        with self._lock:
+            for m in mensajes:
+                self._ultimas[m['patente']] = m
+            suscriptores = list(self._suscriptores)
+        for loop, cola in suscriptores:
+            try:
+                loop.call_soon_threadsafe(_entregar, cola, mensajes)
+            except RuntimeError:  # loop cerrado: el cliente ya se fue
+                self.desuscribir((loop, cola))
+
+
+def _entregar(cola, mensajes):
+    # Un panel lento pierde los deltas más antiguos, nunca bloquea al resto
+    if cola.full():
+        cola.get_nowait()
+    cola.put_nowait(mensajes)
+
+
+class BrokerRedis(BrokerLocal):
+    """
+    Reparte los fixes de todos los procesos por un canal de Redis. Cada proceso
+    publica en el canal; los que atienden streams se suscriben con un hilo que
+    entrega lo recibido a sus colas locales. La foto inicial tiene lo recibido
+    desde que el proceso abrió su primer stream.
+    """
+    CANAL = 'panel:posiciones'
+
+    def __init__(self, max_cola=None):
+        import redis
+        super().__init__(max_cola)
+        self._redis = redis.Redis.from_url(settings.TIEMPO_REAL_REDIS_URL)
+        self._hilo = None
+        self._lock_hilo = threading.Lock()
+
+    def publicar(self, mensajes):
+        if mensajes:
+            self._redis.publish(self.CANAL, json.dumps(mensajes))
+
+    def suscribir(self):
+        with self._lock_hilo:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._escuchar, name='tiempo-real-redis', daemon=True)
+                self._hilo.start()
+        return super().suscribir()
+
+    def _escuchar(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CANAL)
+                for mensaje in pubsub.listen():
+                    BrokerLocal.publicar(self, json.loads(mensaje['data']))
+            except Exception:
+                logger.exception("Se perdió la suscripción a %s; reintentando", self.CANAL)
+                time.sleep(1)
+
+
+_broker = None
+
+
+def broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(settings.TIEMPO_REAL_BROKER)()
+    return _broker
+
+
+def publicar_fixes(fixes):
+    # Lo llama escribir_posiciones con el UPDATE ya hecho: un broker caído no puede
+    # convertir una posición guardada en un error (ni en un reintento del buffer)
+    try:
+        broker().publicar([
+            {'patente': f.patente, 'latitud': float(f.latitud), 'longitud': float(f.longitud), 'ts': f.ts.isoformat()}
+            for f in fixes
+        ])
+    except Exception:
+        logger.exception("No se publicaron %s posiciones en tiempo real", len(fixes))
+
+
+# --- SSE ---
+def stream_disponible(request):
+    # Bajo WSGI Django 4.2 junta el iterador async completo antes de responder:
+    # un stream sin fin tomaría el worker para siempre
+    return isinstance(request, ASGIRequest)
+
+
+def _evento(mensajes):
+    return f"event: posiciones\ndata: {json.dumps(mensajes)}\n\n"
+
+
+async def eventos_posiciones():
+    b = broker()
+    suscripcion = b.suscribir()
+    _, cola = suscripcion
+    try:
+        foto = b.foto()
+        if foto:
+            yield _evento(foto)
+        while True:
+            try:
+                mensajes = await asyncio.wait_for(cola.get(), timeout=settings.TIEMPO_REAL_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield _evento(mensajes)
+    finally:
+        b.desuscribir(suscripcion)
@@ -0,0 +1,344 @@
+import datetime
+import threading
+import time
+from collections import defaultdict
+from typing import NamedTuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Recorrido, TramoPosiciones, DistanciaRecorrido
+from .posiciones import rango_recorrido
+from .cache_panel import invalidar
+from . import resumenes
+
+# Mismo formato que posiciones.PUNTO, leído directo a arreglos
+PUNTO_NP = np.dtype([('ms', '<u4'), ('lat', '<i4'), ('lon', '<i4')])
+RADIO_TIERRA_M = 6_371_008.8
+EPOCA = datetime.date(1970, 1, 1)
+
+
+class Parada(NamedTuple):
+    inicio: datetime.datetime
+    fin: datetime.datetime
+    latitud: float
+    longitud: float
+
+
+class ResultadoTrayecto(NamedTuple):
+    km: float
+    puntos: int
+    descartados: int
+    paradas: list
+    segundos_detenido: float
+    ultimo_ts: datetime.datetime
+
+
+# --- MOTOR VECTORIZADO ---
+# Los arreglos vienen ordenados por (grupo, t) y cada grupo es un recorrido:
+# ningún paso recorre los puntos uno a uno en Python.
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(x) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RADIO_TIERRA_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _segmentos(t, lat, lon, g):
+    return haversine(lat[:-1], lon[:-1], lat[1:], lon[1:]), np.diff(t), g[1:] == g[:-1]
+
+
+def _filtrar(t, lat, lon, g, vel_max):
+    """Quita fixes repetidos y saltos aislados: puntos a los que se llega y de
+    los que se sale a una velocidad imposible."""
+    if len(t) > 1:
+        quedan = np.ones(len(t), bool)
+        quedan[1:] = ~((g[1:] == g[:-1]) & (np.diff(t) <= 0))
+        t, lat, lon, g = t[quedan], lat[quedan], lon[quedan], g[quedan]
+    for _ in range(3):  # un salto de dos puntos queda como salto simple para la siguiente pasada
+        if len(t) < 3:
+            break
+        d, dt, mismo = _segmentos(t, lat, lon, g)
+        rapido = mismo & (d > vel_max * dt)
+        salto = np.zeros(len(t), bool)
+        salto[1:-1] = rapido[:-1] & rapido[1:]
+        if not salto.any():
+            break
+        t, lat, lon, g = t[~salto], lat[~salto], lon[~salto], g[~salto]
+    return t, lat, lon, g
+
+
+def _limites(g, grupos):
+    # Primer índice y fin (exclusivo) del grupo de cada punto
+    fin = np.cumsum(np.bincount(g, minlength=grupos))
+    return (fin - np.bincount(g, minlength=grupos))[g], fin[g]
+
+
+def _suavizar(x, limites, k):
+    # Media móvil centrada de 2k+1 puntos que no mezcla grupos
+    if k <= 0 or len(x) == 0:
+        return x
+    idx = np.arange(len(x))
+    lo = np.maximum(idx - k, limites[0])
+    hi = np.minimum(idx + k + 1, limites[1])
+    base = x.mean()
+    acumulado = np.concatenate(([0.0], np.cumsum(x - base)))
+    return (acumulado[hi] - acumulado[lo]) / (hi - lo) + base
+
+
+def procesar(t, lat, lon, g, grupos, corte=None, cerrado=None):
+    """
+    Distancia (km), puntos válidos, segundos detenido y paradas por grupo.
+
+    Con `corte[i]` (segundos epoch) solo cuenta lo que termina después de ese
+    instante, para sumarlo a un cálculo anterior. En un grupo abierto
+    (`cerrado[i]` falso) la parada que llega al último punto aún no se cuenta.
+    """
+    corte = np.full(grupos, -np.inf) if corte is None else corte
+    cerrado = np.ones(grupos, bool) if cerrado is None else cerrado
+    km, detenido, paradas = np.zeros(grupos), np.zeros(grupos), defaultdict(list)
+
+    t, lat, lon, g = _filtrar(t, lat, lon, g, settings.TRAYECTOS_VEL_MAX_KMH / 3.6)
+    nuevos = t > corte[g]
+    puntos = np.bincount(g[nuevos], minlength=grupos)
+    if len(t) < 2:
+        return km, puntos, detenido, paradas
+
+    k = settings.TRAYECTOS_VENTANA_SUAVIZADO
+    limites = _limites(g, grupos)
+    lat, lon = _suavizar(lat, limites, k), _suavizar(lon, limites, k)
+    d, dt, mismo = _segmentos(t, lat, lon, g)
+    lento = mismo & (d < settings.TRAYECTOS_VEL_PARADA_KMH / 3.6 * dt)
+
+    # Rachas de segmentos lentos que duran lo suficiente son paradas; lo que "avanza" ahí es ruido del GPS
+    bordes = np.diff(np.concatenate(([0], lento.astype(np.int8), [0])))
+    ini, fin = np.flatnonzero(bordes == 1), np.flatnonzero(bordes == -1)
+    duracion = t[fin] - t[ini]
+    es_parada = duracion >= settings.TRAYECTOS_PARADA_MIN_S
+    ini, fin, duracion = ini[es_parada], fin[es_parada], duracion[es_parada]
+    marcas = np.zeros(len(d) + 1, np.int32)
+    np.add.at(marcas, ini, 1)
+    np.add.at(marcas, fin, -1)
+    d = np.where(np.cumsum(marcas)[:-1] > 0, 0.0, d)
+
+    gs = g[1:]
+    valido = mismo & nuevos[1:]
+    km = np.bincount(gs[valido], weights=d[valido], minlength=grupos) / 1000
+
+    ultimo = np.searchsorted(g, np.arange(grupos), side='right') - 1
+    for i, f, dur in zip(ini, fin, duracion):
+        grupo = g[i]
+        if t[f] < corte[grupo] or (f == ultimo[grupo] and not cerrado[grupo]):
+            continue
+        detenido[grupo] += dur
+        paradas[grupo].append(Parada(
+            _a_fecha(t[i]), _a_fecha(t[f]),
+            round(float(lat[i:f + 1].mean()), 6), round(float(lon[i:f + 1].mean()), 6),
+        ))
+    return km, puntos, detenido, paradas
+
+
+def _a_fecha(segundos):
+    return datetime.datetime.fromtimestamp(float(segundos), tz=datetime.timezone.utc)
+
+
+# --- CARGA DE PUNTOS ---
+def _cargar(rangos):
+    """rangos: lista de (id_vehiculo, desde, hasta), uno por grupo. Devuelve
+    t, lat, lon, g concatenados y ordenados, leídos con una sola consulta."""
+    vacio = (np.empty(0), np.empty(0), np.empty(0), np.empty(0, np.int64))
+    if not rangos:
+        return vacio
+    desde = min(r[1] for r in rangos)
+    hasta = max(r[2] for r in rangos)
+    tramos = TramoPosiciones.objects.filter(
+        vehiculo_id__in={r[0] for r in rangos},
+        dia__range=(desde.astimezone(datetime.timezone.utc).date(), hasta.astimezone(datetime.timezone.utc).date()),
+        ts_fin__gte=desde, ts_inicio__lte=hasta,
+    ).values_list('vehiculo_id', 'dia', 'puntos')
+
+    bloques = defaultdict(list)
+    for id_vehiculo, dia, datos in tramos.iterator(chunk_size=500):
+        crudo = np.frombuffer(bytes(datos), dtype=PUNTO_NP)
+        base = (dia - EPOCA).days * 86400.0
+        bloques[id_vehiculo].append(np.stack([base + crudo['ms'] / 1000.0, crudo['lat'] / 1e6, crudo['lon'] / 1e6]))
+    por_vehiculo = {}
+    for id_vehiculo, partes in bloques.items():
+        puntos = np.concatenate(partes, axis=1)
+        por_vehiculo[id_vehiculo] = puntos[:, np.argsort(puntos[0], kind='stable')]
+
+    partes, grupos = [], []
+    for i, (id_vehiculo, r_desde, r_hasta) in enumerate(rangos):
+        puntos = por_vehiculo.get(id_vehiculo)
+        if puntos is None:
+            continue
+        a = np.searchsorted(puntos[0], r_desde.timestamp(), side='left')
+        b = np.searchsorted(puntos[0], r_hasta.timestamp(), side='right')
+        if b > a:
+            partes.append(puntos[:, a:b])
+            grupos.append(np.full(b - a, i))
+    if not partes:
+        return vacio
+    todo = np.concatenate(partes, axis=1)
+    return todo[0], todo[1], todo[2], np.concatenate(grupos)
+
+
+def _ultimos(t, g, grupos):
+    ultimo = [None] * grupos
+    if len(t):
+        fin = np.searchsorted(g, np.arange(grupos), side='right') - 1
+        for i in np.flatnonzero(np.bincount(g, minlength=grupos)):
+            ultimo[i] = _a_fecha(t[fin[i]])
+    return ultimo
+
+
+# --- CALCULO COMPLETO ---
+def calcular(recorridos, hasta=None):
+    """{id_recorrido: ResultadoTrayecto} para una lista de recorridos, en una pasada."""
+    recorridos = list(recorridos)
+    rangos = []
+    for r in recorridos:
+        desde, fin = rango_recorrido(r)
+        rangos.append((r.vehiculo_id, desde, hasta or fin))
+    t, lat, lon, g = _cargar(rangos)
+    n = len(recorridos)
+    cerrado = np.array([r.hora_fin is not None or hasta is not None for r in recorridos], bool)
+    km, puntos, detenido, paradas = procesar(t, lat, lon, g, n, cerrado=cerrado)
+    originales = np.bincount(g, minlength=n)
+    ultimos = _ultimos(t, g, n)
+    return {
+        r.id_recorrido: ResultadoTrayecto(
+            km=round(float(km[i]), 3), puntos=int(puntos[i]), descartados=int(originales[i] - puntos[i]),
+            paradas=paradas.get(i, []), segundos_detenido=float(detenido[i]), ultimo_ts=ultimos[i],
+        )
+        for i, r in enumerate(recorridos)
+    }
+
+
+def _guardar(filas):
+    DistanciaRecorrido.objects.bulk_create(
+        filas, update_conflicts=True, unique_fields=['recorrido'],
+        update_fields=['km', 'puntos', 'descartados', 'paradas', 'segundos_detenido', 'ultimo_ts', 'completo', 'actualizado'],
+        batch_size=1000,
+    )
+
+
+def guardar(resultados, completo=True):
+    _guardar([
+        DistanciaRecorrido(
+            recorrido_id=id_recorrido, km=r.km, puntos=r.puntos, descartados=r.descartados,
+            paradas=len(r.paradas), segundos_detenido=round(r.segundos_detenido),
+            ultimo_ts=r.ultimo_ts, completo=completo,
+        )
+        for id_recorrido, r in resultados.items()
+    ])
+
+
+def recalcular(recorridos):
+    resultados = calcular(recorridos)
+    guardar({k: r for k, r in resultados.items() if r.puntos}, completo=True)
+    return resultados
+
+
+def cerrar(recorrido, momento, ubicacion, kilometraje_fin=None):
+    """Cierra un recorrido abierto en `momento` con un UPDATE condicional de las
+    columnas de término: False si ya estaba cerrado (por la app, una geocerca o
+    el panel). La fecha sigue siendo la del inicio, como la guarda la app."""
+    local = timezone.localtime(momento)
+    cambios = {'hora_fin': local.time(), 'ubicacion_fin_txt': ubicacion}
+    if kilometraje_fin is not None:
+        cambios['kilometraje_fin'] = kilometraje_fin
+    if not Recorrido.objects.filter(pk=recorrido.pk, hora_fin__isnull=True).update(**cambios):
+        return False
+    for campo, valor in cambios.items():
+        setattr(recorrido, campo, valor)
+    # El UPDATE no dispara las señales de post_save
+    resumenes.recalcular_al_confirmar({(recorrido.vehiculo_id, recorrido.fecha)})
+    transaction.on_commit(lambda: invalidar('recorridos'))
+    return True
+
+
+def finalizar(recorrido, momento, ubicacion):
+    """Cierra un recorrido abierto sin odómetro final (panel, geocercas) y guarda
+    la distancia del GPS. None si ya estaba cerrado."""
+    if not cerrar(recorrido, momento, ubicacion):
+        return None
+    gps = calcular([recorrido], hasta=momento)[recorrido.id_recorrido]
+    if gps.puntos:
+        guardar({recorrido.id_recorrido: gps})
+    return gps
+
+
+# --- CALCULO INCREMENTAL (viajes en curso) ---
+def actualizar_en_curso(patentes):
+    """Suma a cada viaje abierto de estos vehículos solo los puntos llegados
+    desde el último cálculo (más un margen de contexto para el suavizado)."""
+    abiertos = list(Recorrido.objects.filter(hora_fin__isnull=True, vehiculo__patente__in=patentes))
+    if not abiertos:
+        return 0
+    estados = DistanciaRecorrido.objects.in_bulk([r.id_recorrido for r in abiertos])
+    contexto = datetime.timedelta(seconds=settings.TRAYECTOS_CONTEXTO_S)
+    rangos, cortes = [], []
+    for r in abiertos:
+        desde, hasta = rango_recorrido(r)
+        estado = estados.get(r.id_recorrido)
+        if estado and estado.ultimo_ts:
+            cortes.append(estado.ultimo_ts.timestamp())
+            desde = max(desde, estado.ultimo_ts - contexto)
+        else:
+            cortes.append(-np.inf)
+        rangos.append((r.vehiculo_id, desde, hasta))
+
+    n = len(abiertos)
+    cortes = np.array(cortes)
+    t, lat, lon, g = _cargar(rangos)
+    km, puntos, detenido, paradas = procesar(t, lat, lon, g, n, corte=cortes, cerrado=np.zeros(n, bool))
+    originales = np.bincount(g[t > cortes[g]], minlength=n) if len(t) else np.zeros(n, np.int64)
+    ultimos = _ultimos(t, g, n)
+
+    filas = []
+    for i, r in enumerate(abiertos):
+        if r.id_recorrido not in estados and not puntos[i]:
+            continue
+        previo = estados.get(r.id_recorrido) or DistanciaRecorrido()
+        filas.append(DistanciaRecorrido(
+            recorrido_id=r.id_recorrido, km=round(previo.km + float(km[i]), 3),
+            puntos=previo.puntos + int(puntos[i]), descartados=previo.descartados + int(originales[i] - puntos[i]),
+            paradas=previo.paradas + len(paradas.get(i, [])),
+            segundos_detenido=previo.segundos_detenido + round(detenido[i]),
+            ultimo_ts=ultimos[i] or previo.ultimo_ts, completo=False,
+        ))
+    _guardar(filas)
+    return len(filas)
+
+
+def cerrar_terminados():
+    # Viajes que la app cerró desde el último ciclo: cálculo completo y definitivo
+    terminados = list(Recorrido.objects.filter(hora_fin__isnull=False, distancia_gps__completo=False))
+    if terminados:
+        recalcular(terminados)
+    return len(terminados)
+
+
+_patentes = set()
+_lock = threading.Lock()
+_ultima_vez = 0.0
+
+
+def anotar(fixes):
+    # Lo llama el buffer GPS al vaciar; el cálculo corre después, en su hilo de fondo
+    with _lock:
+        _patentes.update(f.patente for f in fixes)
+
+
+def procesar_pendientes(forzar=False):
+    global _ultima_vez
+    with _lock:
+        if not forzar and time.monotonic() - _ultima_vez < settings.TRAYECTOS_INTERVALO:
+            return 0
+        patentes = set(_patentes)
+        _patentes.clear()
+        _ultima_vez = time.monotonic()
+    actualizados = actualizar_en_curso(patentes) if patentes else 0
+    return actualizados + cerrar_terminados()
@@ -1,20 +1,43 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.contrib.auth.hashers import make_password
 from django.contrib.auth.decorators import login_required 
 from django.views.decorators.csrf import csrf_exempt 
-from django.db.models import Sum, Q, F, Max, ProtectedError 
+from django.db import IntegrityError
+from django.db.models import Sum, Q, F, Max, Count, ProtectedError 
 from django.utils import timezone
-from django.http import HttpResponse, JsonResponse 
-from django.template.loader import get_template 
-from xhtml2pdf import pisa 
+from django.utils.dateparse import parse_datetime
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse, FileResponse
+from django.urls import reverse
+from django.conf import settings
+from asgiref.sync import sync_to_async
 import datetime
 import json
-
-from .models import Usuario, Vehiculo, Recorrido, CargaCombustible
+import logging
+import math
+from urllib.parse import urlencode
+
+from .models import PIN_PENDIENTE, Usuario, Vehiculo, Recorrido, CargaCombustible, TrabajoReporte, RolUsuario, Zona, VehiculoEnZona, EventoZona
+from .gps import parsear_fix, parsear_posicion, escribir_posiciones, buffer_gps, duplicados_gps
+from .pool_bd import pool_bd, Saturado
+from .posiciones import trayecto, trayecto_recorrido
+from .tiempo_real import eventos_posiciones, stream_disponible
+from . import resumenes, trayectos, espacial, geocercas, rendimiento, api_lectura, dispositivos, ciclo_recorridos, despacho
+from .metricas import presupuesto_consultas, registro as registro_metricas
+from .exportar import EXPORTACIONES, csv_en_stream, xlsx_en_stream
+from .importar import IMPORTACIONES, CupoExcedido
+from .credenciales import programar_pin, programar_pines, permitir_cambio
+from .reportes import (
+    filtros_desde_request, recorridos_por_tabla, totales_reporte,
+    cursor_desde_texto, pagina_recorridos, solicitar_pdf,
+)
+from .cache_panel import cacheado
+from .busqueda import buscar_usuarios, buscar_vehiculos, no_admin, con_rol
+
+logger = logging.getLogger(__name__)
 
 # --- DASHBOARD ---
 @login_required
+@presupuesto_consultas(8)
 def panel_dashboard(request):
     hoy = timezone.now().date()
 
@@ -22,18 +45,12 @@ def panel_dashboard(request):
     entregas_activas_query = Recorrido.objects.filter(hora_fin__isnull=True).select_related('vehiculo', 'conductor')
     count_entregas = entregas_activas_query.count()
 
-    # KPIs Históricos
-    datos_recorridos = Recorrido.objects.filter(kilometraje_fin__isnull=False).aggregate(
-        distancia_total=Sum(F('kilometraje_fin') - F('kilometraje_inicio'))
-    )
-    distancia_total = datos_recorridos['distancia_total'] or 0
-
-    datos_combustible = CargaCombustible.objects.aggregate(
-        gasto_total=Sum('costo_total'),
-        litros_totales=Sum('litros')
-    )
-    gasto_total = datos_combustible['gasto_total'] or 0
-    litros_totales = datos_combustible['litros_totales'] or 0
+    # KPIs Históricos: resúmenes diarios hasta ayer y el día de hoy en vivo
+    en_vivo = resumenes.hoy_en_vivo()
+    datos = resumenes.totales_al_dia(en_vivo=en_vivo)
+    distancia_total = datos['km']
+    gasto_total = datos['costo']
+    litros_totales = datos['litros']
 
     eficiencia = 0
     if litros_totales > 0:
@@ -42,11 +59,15 @@ def panel_dashboard(request):
     # Gráficos
     fechas_grafico = []
     montos_grafico = []
+    gasto_por_dia = cacheado(
+        'costo_por_dia', ['resumenes'], resumenes.costo_por_dia,
+        hoy - datetime.timedelta(days=6), hoy - datetime.timedelta(days=1), clave=hoy.isoformat(),
+    )
+    gasto_por_dia[hoy] = en_vivo['costo']
     for i in range(6, -1, -1):
         fecha = hoy - datetime.timedelta(days=i)
-        gasto_dia = CargaCombustible.objects.filter(fecha=fecha).aggregate(Sum('costo_total'))['costo_total__sum'] or 0
         fechas_grafico.append(fecha.strftime("%d/%m"))
-        montos_grafico.append(gasto_dia)
+        montos_grafico.append(gasto_por_dia.get(fecha, 0))
 
     contexto = {
         'entregas_count': count_entregas,
@@ -61,12 +82,16 @@ def panel_dashboard(request):
 
 # --- CONDUCTORES ---
 @login_required
+# Incluye la actualización del índice de búsqueda al crear o modificar un usuario
+@presupuesto_consultas(12)
 def panel_conductores(request):
     busqueda = request.GET.get('q')
-    conductores = Usuario.objects.filter(~Q(rol__icontains='admin')).exclude(id_usuario=1).order_by('id_usuario')
+    conductores = no_admin().exclude(id_usuario=1).order_by('id_usuario')
 
     if busqueda:
-        conductores = conductores.filter(nombre__icontains=busqueda)
+        conductores = buscar_usuarios(busqueda, conductores)
+    elif request.method != "POST":
+        conductores = cacheado('conductores', ['usuarios'], lambda: conductores)
 
     if request.method == "POST":
         accion = request.POST.get('accion')
@@ -79,25 +104,32 @@ def panel_conductores(request):
                 telefono = request.POST.get('telefono')
                 clave = request.POST.get('password')
                 
-                if Usuario.objects.filter(rut=rut).exists():
-                    messages.error(request, f"Error: El RUT {rut} ya existe.")
-                elif Usuario.objects.filter(correo=correo).exists():
-                    messages.error(request, f"Error: El correo {correo} ya existe.")
+                espera = permitir_cambio(request.user)
+                # Una sola consulta para ambos campos; la restricción UNIQUE cubre la carrera entre admins
+                existente = None if espera else (
+                    Usuario.objects.filter(Q(rut=rut) | Q(correo=correo)).values_list('rut', flat=True).first()
+                )
+                if espera:
+                    messages.error(request, f"Demasiados cambios de clave seguidos. Intente en {espera} segundos.")
+                elif existente is not None:
+                    campo = f"El RUT {rut}" if existente == rut else f"El correo {correo}"
+                    messages.error(request, f"Error: {campo} ya existe.")
                 else:
-                    max_id = Usuario.objects.aggregate(Max('id_usuario'))['id_usuario__max'] or 0
-                    nuevo_id = max_id + 1
-
-                    Usuario.objects.create(
-                        id_usuario=nuevo_id,
+                    # id_usuario es AUTO_INCREMENT: lo asigna la base, sin carreras ni MAX() por inserción
+                    # El PIN real se hashea en segundo plano (ver credenciales.py)
+                    nuevo = Usuario.objects.create(
                         nombre=nombre,
                         rut=rut,
                         correo=correo,
                         telefono=telefono,
-                        pin_hash=make_password(clave),
+                        pin_hash=PIN_PENDIENTE,
                         rol='CONDUCTOR',
                         fecha_creacion=timezone.now()
                     )
+                    programar_pines([(nuevo.id_usuario, clave)])
                     messages.success(request, f"Conductor {nombre} creado correctamente.")
+            except IntegrityError:
+                messages.error(request, f"Error: El RUT {rut} o el correo {correo} ya existe.")
             except Exception as e:
                 messages.error(request, f"Error inesperado: {e}")
 
@@ -118,9 +150,11 @@ def panel_conductores(request):
             
             elif accion == 'actualizar_pass':
                 nueva_pass = request.POST.get('new_password')
-                if nueva_pass:
-                    usuario.pin_hash = make_password(nueva_pass)
-                    usuario.save()
+                espera = permitir_cambio(request.user) if nueva_pass else 0
+                if espera:
+                    messages.error(request, f"Demasiados cambios de clave seguidos. Intente en {espera} segundos.")
+                elif nueva_pass:
+                    programar_pin(usuario.id_usuario, nueva_pass)
                     messages.success(request, "Contraseña actualizada.")
             
             elif accion == 'eliminar':
@@ -133,10 +167,28 @@ def panel_conductores(request):
     return render(request, 'PanelAdmin/conductores.html', {'conductores': conductores})
 
 # --- VEHÍCULOS ---
+def _posiciones_en_vivo(vehiculos):
+    # La ingesta GPS escribe las posiciones con SQL directo, sin invalidar el cache del panel
+    posiciones = {i: (lat, lon) for i, lat, lon in Vehiculo.objects.values_list('id_vehiculo', 'latitud', 'longitud')}
+    for vehiculo in vehiculos:
+        vehiculo.latitud, vehiculo.longitud = posiciones.get(vehiculo.id_vehiculo, (None, None))
+    return vehiculos
+
 @login_required
+@presupuesto_consultas(10)
 def panel_vehiculos(request):
-    vehiculos = Vehiculo.objects.select_related('conductor').all().order_by('id_vehiculo') 
-    conductores_disponibles = Usuario.objects.filter(rol__icontains='CONDUCTOR').order_by('nombre')
+    busqueda = request.GET.get('q')
+    vehiculos = Vehiculo.objects.select_related('conductor').all().order_by('id_vehiculo')
+    if busqueda:
+        vehiculos = buscar_vehiculos(busqueda, vehiculos)
+    else:
+        vehiculos = _posiciones_en_vivo(cacheado(
+            'vehiculos', ['vehiculos', 'usuarios'], lambda: vehiculos.defer('latitud', 'longitud'),
+        ))
+    conductores_disponibles = cacheado(
+        'conductores_disponibles', ['usuarios'],
+        lambda: con_rol(RolUsuario.CONDUCTOR).order_by('nombre'),
+    )
 
     if request.method == "POST":
         accion = request.POST.get('accion')
@@ -165,41 +217,96 @@ def panel_vehiculos(request):
         
         elif accion == 'asignar': 
             id_conductor = request.POST.get('conductor_asignado')
-            vehiculo = get_object_or_404(Vehiculo, id_vehiculo=id_vehiculo)
-            
-            if id_conductor:
-                conductor = get_object_or_404(Usuario, id_usuario=id_conductor)
-                autos_anteriores = Vehiculo.objects.filter(conductor=conductor).exclude(id_vehiculo=vehiculo.id_vehiculo)
-                if autos_anteriores.exists():
-                    autos_anteriores.update(conductor=None)
-                    messages.warning(request, f"El conductor {conductor.nombre} fue desvinculado de otros vehículos.")
-
-                vehiculo.conductor = conductor
-            else:
-                vehiculo.conductor = None
-                
-            vehiculo.save()
-            messages.success(request, f"Asignación actualizada.")
+            try:
+                # Mismo camino que el despacho en bloque: dos UPDATE, sin releer el vehículo
+                if despacho.aplicar([(int(id_vehiculo), int(id_conductor) if id_conductor else None)]):
+                    messages.warning(request, "El conductor fue desvinculado de otros vehículos.")
+                messages.success(request, f"Asignación actualizada.")
+            except (TypeError, ValueError) as e:
+                messages.error(request, f"Error: {e}")
             
         return redirect('panel_vehiculos')
 
     return render(request, 'PanelAdmin/vehiculos.html', {
-        'vehiculos': vehiculos, 'conductores': conductores_disponibles
+        'vehiculos': vehiculos, 'conductores': conductores_disponibles,
+        'tiempo_real': stream_disponible(request),
     })
 
 # --- RUTAS ---
 @login_required
+@presupuesto_consultas(4)
 def panel_rutas(request):
     recorridos = Recorrido.objects.filter(
         hora_fin__isnull=True 
     ).select_related('vehiculo', 'conductor')
-    return render(request, 'PanelAdmin/rutas.html', {'recorridos': recorridos})
+    return render(request, 'PanelAdmin/rutas.html', {'recorridos': recorridos, 'tiempo_real': stream_disponible(request)})
+
+# --- ZONAS (GEOCERCAS) ---
+def _numero_o_none(valor):
+    return float(valor) if (valor or '').strip() else None
+
+@login_required
+@presupuesto_consultas(8)
+def panel_zonas(request):
+    if request.method == "POST":
+        accion = request.POST.get('accion')
+        id_zona = request.POST.get('id_zona')
+
+        if accion == 'crear':
+            try:
+                zona = geocercas.validar_zona(Zona(
+                    nombre=request.POST.get('nombre', '').strip(), tipo=request.POST.get('tipo'),
+                    vertices=request.POST.get('vertices', ''),
+                    latitud=_numero_o_none(request.POST.get('latitud')),
+                    longitud=_numero_o_none(request.POST.get('longitud')),
+                    radio_m=_numero_o_none(request.POST.get('radio_m')),
+                    es_base=request.POST.get('es_base') == 'on',
+                ))
+                zona.save()
+                messages.success(request, f"Zona {zona.nombre} creada.")
+            except ValueError as e:
+                messages.error(request, f"Error: {e}")
+
+        elif accion == 'activar':
+            zona = get_object_or_404(Zona, id=id_zona)
+            zona.activa = not zona.activa
+            zona.save(update_fields=['activa'])
+            if not zona.activa:
+                # Al reactivarla se vuelve a detectar quién está dentro, sin salidas fantasma
+                VehiculoEnZona.objects.filter(zona=zona).delete()
+            messages.success(request, f"Zona {'activada' if zona.activa else 'desactivada'}.")
+
+        elif accion == 'eliminar':
+            get_object_or_404(Zona, id=id_zona).delete()
+            messages.error(request, "Zona eliminada junto con sus eventos.")
+
+        return redirect('panel_zonas')
+
+    # Sin cache: el conteo de vehículos dentro cambia con cada ping que cruza un borde
+    zonas = Zona.objects.annotate(dentro=Count('vehiculoenzona')).order_by('nombre')
+    eventos = EventoZona.objects.select_related('zona', 'vehiculo').order_by('-id')[:20]
+    return render(request, 'PanelAdmin/zonas.html', {'zonas': zonas, 'eventos': eventos})
 
 # --- COMBUSTIBLE ---
+def _sparkline(tendencia, ancho=100, alto=24):
+    # Puntos de un <polyline> SVG para la tendencia de km/L
+    valores = [v for _, v in tendencia if v is not None]
+    if len(valores) < 2:
+        return ''
+    minimo, maximo = min(valores), max(valores)
+    rango = (maximo - minimo) or 1
+    paso = ancho / (len(valores) - 1)
+    return ' '.join(f"{i * paso:.1f},{alto - (v - minimo) / rango * alto:.1f}" for i, v in enumerate(valores))
+
 @login_required
+# Incluye el recálculo del resumen diario y del rendimiento del vehículo al registrar una carga
+@presupuesto_consultas(16)
 def panel_combustible(request):
-    vehiculos = Vehiculo.objects.all()
-    ultimas_cargas = CargaCombustible.objects.select_related('vehiculo').order_by('-fecha', '-hora')[:5]
+    vehiculos = cacheado('vehiculos_lista', ['vehiculos'], lambda: Vehiculo.objects.all())
+    ultimas_cargas = cacheado(
+        'ultimas_cargas', ['cargas', 'vehiculos'],
+        lambda: CargaCombustible.objects.select_related('vehiculo').order_by('-fecha', '-hora')[:5],
+    )
 
     if request.method == "POST":
         try:
@@ -220,95 +327,127 @@ def panel_combustible(request):
         except Exception as e:
             messages.error(request, f"Error al guardar: {e}")
 
-    total_gasto = CargaCombustible.objects.aggregate(Sum('costo_total'))['costo_total__sum'] or 0
-    total_litros = CargaCombustible.objects.aggregate(Sum('litros'))['litros__sum'] or 0
-    total_registros = CargaCombustible.objects.count()
+    datos = resumenes.totales_al_dia()
+    total_gasto = datos['costo']
+    total_litros = datos['litros']
+    total_registros = datos['cargas']
     promedio = round(total_gasto / total_litros, 1) if total_litros > 0 else 0
 
+    # Rendimiento ya calculado por carga (PanelAdmin/rendimiento.py): no se recorre el historial
+    hoy = timezone.localdate()
+    rendimiento_vehiculos = cacheado(
+        'rendimiento_vehiculos', ['rendimiento', 'vehiculos'], rendimiento.vehiculos_a_revisar, 15,
+    )
+    for r in rendimiento_vehiculos:
+        r.sparkline = _sparkline(r.tendencia)
+    cargas_sospechosas = cacheado(
+        'cargas_sospechosas', ['rendimiento', 'vehiculos', 'usuarios'], rendimiento.cargas_sospechosas, 10,
+    )
+    rendimiento_conductores = cacheado(
+        'rendimiento_conductores', ['rendimiento', 'usuarios'], rendimiento.por_conductor,
+        hoy - datetime.timedelta(days=settings.RENDIMIENTO_DIAS_ALERTAS), 10, clave=hoy.isoformat(),
+    )
+
     contexto = {
         'vehiculos': vehiculos,
         'ultimas_cargas': ultimas_cargas,
-        'kpis': {'gasto': total_gasto, 'litros': total_litros, 'promedio': promedio, 'registros': total_registros}
+        'kpis': {'gasto': total_gasto, 'litros': total_litros, 'promedio': promedio, 'registros': total_registros},
+        'rendimiento_vehiculos': rendimiento_vehiculos,
+        'cargas_sospechosas': cargas_sospechosas,
+        'rendimiento_conductores': rendimiento_conductores,
+        'dias_alertas': settings.RENDIMIENTO_DIAS_ALERTAS,
     }
     return render(request, 'PanelAdmin/combustible.html', contexto)
 
 # --- REPORTES ---
 @login_required
+# +4 si el rango llega al archivo: su página, sus distancias GPS y los totales del conductor
+@presupuesto_consultas(12)
 def panel_reportes(request):
-    fecha_inicio = request.GET.get('fecha_inicio')
-    fecha_fin = request.GET.get('fecha_fin')
-    usuario_id = request.GET.get('usuario')
-    
-    recorridos = Recorrido.objects.all().select_related('conductor', 'vehiculo').order_by('-fecha')
-    cargas = CargaCombustible.objects.all().select_related('vehiculo')
-
-    if fecha_inicio:
-        recorridos = recorridos.filter(fecha__gte=fecha_inicio)
-        cargas = cargas.filter(fecha__gte=fecha_inicio)
-    if fecha_fin:
-        recorridos = recorridos.filter(fecha__lte=fecha_fin)
-        cargas = cargas.filter(fecha__lte=fecha_fin)
-    if usuario_id:
-        recorridos = recorridos.filter(conductor_id=usuario_id)
-        vehiculos_ids = recorridos.values_list('vehiculo_id', flat=True)
-        cargas = cargas.filter(vehiculo_id__in=vehiculos_ids)
-
-    total_kms = sum(r.distancia for r in recorridos if r.distancia)
-    total_dinero = cargas.aggregate(Sum('costo_total'))['costo_total__sum'] or 0
-    total_litros = cargas.aggregate(Sum('litros'))['litros__sum'] or 0
-    usuarios = Usuario.objects.filter(~Q(rol__icontains='admin'))
+    filtros = filtros_desde_request(request)
+    cursor = cursor_desde_texto(request.GET.get('cursor'))
+
+    tablas = [r.select_related('conductor', 'vehiculo') for r in recorridos_por_tabla(filtros)]
+    pagina, siguiente = pagina_recorridos(tablas, cursor, settings.REPORTES_FILAS_POR_PAGINA)
+
+    # Los enlaces de página conservan los filtros actuales
+    parametros = request.GET.copy()
+    parametros.pop('cursor', None)
+    if siguiente:
+        parametros['cursor'] = siguiente
+    usuarios = cacheado('usuarios_no_admin', ['usuarios'], no_admin)
+    # Sin conductor el resumen hasta ayer sale del cache y hoy se lee en vivo (ver resumenes.totales_al_dia)
+    totales = totales_reporte(filtros)
 
     contexto = {
-        'recorridos': recorridos, 'total_kms': total_kms, 'total_dinero': total_dinero,
-        'total_litros': total_litros, 'usuarios': usuarios,
-        'filtros': {'inicio': fecha_inicio, 'fin': fecha_fin, 'user': usuario_id}
+        'recorridos': pagina, **totales, 'usuarios': usuarios,
+        'filtros': {'inicio': filtros['fecha_inicio'], 'fin': filtros['fecha_fin'], 'user': filtros['usuario']},
+        'pagina_siguiente': parametros.urlencode() if siguiente else None,
+        'es_primera_pagina': cursor is None,
     }
     return render(request, 'PanelAdmin/reportes.html', contexto)
 
 @login_required
-def generar_pdf_reporte(request):
-    fecha_inicio = request.GET.get('fecha_inicio')
-    fecha_fin = request.GET.get('fecha_fin')
-    usuario_id = request.GET.get('usuario')
-    
-    recorridos = Recorrido.objects.all().select_related('conductor', 'vehiculo').order_by('-fecha')
-    subtitulo = "Reporte General Histórico"
+@presupuesto_consultas(4)
+def exportar_reporte(request, tipo, formato):
+    if tipo not in EXPORTACIONES or formato not in ('csv', 'xlsx'):
+        return HttpResponse(status=404)
+    columnas, generador = EXPORTACIONES[tipo]
+    filas = generador(filtros_desde_request(request))
+
+    if formato == 'csv':
+        response = StreamingHttpResponse(csv_en_stream(columnas, filas), content_type='text/csv; charset=utf-8')
+    else:
+        response = StreamingHttpResponse(
+            xlsx_en_stream(columnas, filas),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+    response['Content-Disposition'] = f'attachment; filename="{tipo}.{formato}"'
+    return response
 
-    if fecha_inicio: recorridos = recorridos.filter(fecha__gte=fecha_inicio); subtitulo = f"Desde {fecha_inicio}"
-    if fecha_fin: recorridos = recorridos.filter(fecha__lte=fecha_fin); subtitulo += f" hasta {fecha_fin}"
-    if usuario_id: recorridos = recorridos.filter(conductor_id=usuario_id)
+@login_required
+@presupuesto_consultas(9)  # +3 de la limpieza horaria de trabajos vencidos
+def generar_pdf_reporte(request):
+    # El PDF se genera en un worker aparte; aquí solo se encola (o se reutiliza) el trabajo
+    trabajo = solicitar_pdf(filtros_desde_request(request), request.user.username)
+    return redirect('descargar_pdf', id=trabajo.id)
 
-    total_kms = sum(r.distancia for r in recorridos if r.distancia)
+@login_required
+@presupuesto_consultas(4)
+def descargar_pdf_reporte(request, id):
+    trabajo = get_object_or_404(TrabajoReporte, id=id)
+    if trabajo.estado == TrabajoReporte.LISTO:
+        response = FileResponse(open(trabajo.archivo, 'rb'), content_type='application/pdf')
+        response['Content-Disposition'] = 'inline; filename="reporte.pdf"'
+        return response
+    if trabajo.estado == TrabajoReporte.ERROR:
+        # Los trabajos con error no se reutilizan: reintentar encola uno nuevo con los mismos filtros
+        reintentar = f"{reverse('generar_pdf')}?{urlencode(trabajo.filtros)}"
+        return render(request, 'PanelAdmin/reporte_pendiente.html', {'trabajo': trabajo, 'reintentar': reintentar}, status=500)
+    return render(request, 'PanelAdmin/reporte_pendiente.html', {'trabajo': trabajo})
 
-    contexto = {
-        'recorridos': recorridos, 'total_kms': total_kms,
-        'fecha_generacion': datetime.datetime.now(), 'subtitulo': subtitulo,
-        'usuario_generador': request.user.username,
-    }
-    template = get_template('PanelAdmin/pdf_template.html')
-    html = template.render(contexto)
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'inline; filename="reporte.pdf"'
-    
-    pisa_status = pisa.CreatePDF(html, dest=response)
-    if pisa_status.err: return HttpResponse('Error PDF')
-    return response
+@login_required
+@presupuesto_consultas(4)
+def estado_pdf_reporte(request, id):
+    trabajo = get_object_or_404(TrabajoReporte, id=id)
+    return JsonResponse({
+        'id': str(trabajo.id), 'estado': trabajo.estado, 'error': trabajo.error,
+        'descarga': reverse('descargar_pdf', args=[trabajo.id]) if trabajo.estado == TrabajoReporte.LISTO else None,
+    })
 
 # --- ELIMINAR / FINALIZAR (CORREGIDO) ---
 @login_required
+@presupuesto_consultas(14)  # +1 lectura de tramos GPS y +1 upsert de la distancia
 def eliminar_ruta(request, id):
     if request.user.is_authenticated:
         try:
             # EN LUGAR DE BORRAR, FINALIZAMOS EL VIAJE
             ruta = Recorrido.objects.get(id_recorrido=id)
-            ruta.fecha = timezone.now().date()
-            ruta.hora_fin = datetime.datetime.now().time()
-            ruta.ubicacion_fin_txt = "Finalizado Manualmente (Admin)"
-            if ruta.kilometraje_inicio:
-                ruta.kilometraje_fin = ruta.kilometraje_inicio # Cerrar con 0 km de diferencia
-            ruta.save()
-            
-            messages.success(request, "Ruta finalizada y archivada.")
+            # UPDATE condicional: si la app lo cerró mientras tanto, se respeta su cierre
+            if trayectos.finalizar(ruta, timezone.now(), "Finalizado Manualmente (Admin)") is None:
+                messages.info(request, "La ruta ya estaba finalizada.")
+            else:
+                messages.success(request, "Ruta finalizada y archivada.")
         except Recorrido.DoesNotExist:
             messages.error(request, "La ruta no existe.")
         except Exception as e:
@@ -317,6 +456,7 @@ def eliminar_ruta(request, id):
     return redirect('panel_rutas')
 
 @login_required
+@presupuesto_consultas(18)  # +6 del recálculo del rendimiento del vehículo
 def eliminar_combustible(request, id):
     if request.user.is_authenticated:
         try:
@@ -325,32 +465,451 @@ def eliminar_combustible(request, id):
         except: messages.error(request, "Error al eliminar.")
     return redirect('panel_combustible')
 
-# --- API GPS ---
-@csrf_exempt 
-def update_gps_location(request):
-    if request.method == 'POST':
+# --- API GPS (async: bajo ASGI un worker atiende miles de rastreadores) ---
+# Token, límite de tasa, formato y duplicados se revisan en memoria: lo rechazado no llega a la BD.
+# Lo que sí va a la BD corre en pool_bd, nunca en el event loop.
+def _sin_csrf(vista):
+    # csrf_exempt de Django 4.2 envuelve la vista en una función síncrona: a una async solo se la marca
+    vista.csrf_exempt = True
+    return vista
+
+async def _dispositivo_gps(request):
+    dispositivo = await dispositivos.autenticar_async(request)
+    if dispositivo is None and (settings.DISPOSITIVOS_REQUIERE_TOKEN or 'Authorization' in request.headers):
+        return None, JsonResponse({'status': 'error', 'message': 'Token de dispositivo inválido'}, status=401)
+    return dispositivo, None
+
+def _limite_gps(request, dispositivo, cantidad):
+    espera = dispositivos.esperar_para(request, dispositivo, cantidad)
+    if espera == math.inf:
+        return JsonResponse({'status': 'error', 'message': 'El lote supera la ráfaga permitida al dispositivo'}, status=413)
+    if espera:
+        response = JsonResponse({'status': 'error', 'message': 'Demasiados fixes, reintente más tarde'}, status=429)
+        response['Retry-After'] = str(math.ceil(espera))
+        return response
+    return None
+
+def _saturado():
+    response = JsonResponse({'status': 'error', 'message': 'Servidor ocupado, reintente'}, status=503)
+    response['Retry-After'] = '1'
+    return response
+
+def _error_interno(mensaje):
+    # El detalle queda en el log: al cliente (rastreador, app) no se le muestran datos internos
+    logger.exception(mensaje)
+    return JsonResponse({'status': 'error', 'message': 'Error interno, reintente más tarde'}, status=500)
+
+def _patente_ajena(dispositivo, fix):
+    # Un rastreador asociado a un vehículo solo puede reportar su patente
+    return dispositivo is not None and dispositivo.patente is not None and fix.patente != dispositivo.patente
+
+async def _encolar_gps(fixes):
+    # Al buffer: un solo UPDATE por intervalo para todos los pings; si toca vaciar, en el pool
+    if buffer_gps.encolar(fixes):
+        await pool_bd.ejecutar(buffer_gps.vaciar)
+    geocercas.evaluar(fixes)
+
+async def _patente_conocida(patente):
+    if not espacial.vigente():
+        await pool_bd.ejecutar(espacial.indice)
+    return espacial.indice_cargado().conoce(patente)
+
+@_sin_csrf
+@presupuesto_consultas(2)
+async def update_gps_location(request):
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+    dispositivo, rechazo = await _dispositivo_gps(request)
+    rechazo = rechazo or _limite_gps(request, dispositivo, 1)
+    if rechazo:
+        return rechazo
+    nuevos = []
+    try:
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            data = request.POST
+
+        fix = parsear_fix(data, patente=dispositivo and dispositivo.patente)
+        if _patente_ajena(dispositivo, fix):
+            return JsonResponse({'status': 'error', 'message': 'Patente no asociada al dispositivo'}, status=403)
+        nuevos, _ = duplicados_gps.separar([fix])
+        if not nuevos:
+            return JsonResponse({'status': 'success', 'message': 'Duplicado ignorado'}, status=200)
+
+        if await _patente_conocida(fix.patente):
+            await _encolar_gps([fix])
+        else:
+            # Patente que este proceso aún no vio (recién creada en otro worker): UPDATE directo
+            if not await pool_bd.ejecutar(escribir_posiciones, [fix]):
+                # Si la patente se crea después, el reintento no es un duplicado
+                duplicados_gps.olvidar(nuevos)
+                return JsonResponse({'status': 'error', 'message': 'Patente no encontrada'}, status=404)
+            buffer_gps.marcar_escritos([fix])
+            buffer_gps.agregar_historial([fix])
+            geocercas.evaluar([fix])
+
+        return JsonResponse({'status': 'success', 'message': 'Ubicación actualizada'}, status=200)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    except Saturado:
+        duplicados_gps.olvidar(nuevos)
+        return _saturado()
+    except Exception:
+        duplicados_gps.olvidar(nuevos)
+        return _error_interno("Error al recibir un fix GPS")
+
+@_sin_csrf
+# Al vaciar el buffer: ids de patentes, historial y UPDATE masivo; +1 si coincide con la recarga de tokens
+@presupuesto_consultas(7)
+async def update_gps_batch(request):
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+    dispositivo, rechazo = await _dispositivo_gps(request)
+    if rechazo:
+        return rechazo
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'status': 'error', 'message': 'JSON inválido'}, status=400)
+
+    lote = data.get('fixes') if isinstance(data, dict) else data
+    if not isinstance(lote, list):
+        return JsonResponse({'status': 'error', 'message': 'Se esperaba una lista de fixes'}, status=400)
+    if len(lote) > settings.GPS_LOTE_MAX_FIXES:
+        return JsonResponse({'status': 'error', 'message': f'Máximo {settings.GPS_LOTE_MAX_FIXES} fixes por lote'}, status=413)
+    # Cuenta el lote completo: los fixes inválidos también gastan la cuota del dispositivo
+    rechazo = _limite_gps(request, dispositivo, len(lote))
+    if rechazo:
+        return rechazo
+
+    fixes, rechazados = [], []
+    for indice, dato in enumerate(lote):
         try:
+            if not isinstance(dato, dict):
+                raise ValueError("Formato inválido")
+            fix = parsear_fix(dato, patente=dispositivo and dispositivo.patente)
+            if _patente_ajena(dispositivo, fix):
+                raise ValueError("Patente no asociada al dispositivo")
+            fixes.append(fix)
+        except ValueError as e:
+            rechazados.append({'indice': indice, 'message': str(e)})
+    fixes, duplicados = duplicados_gps.separar(fixes)
+
+    try:
+        await _encolar_gps(fixes)
+    except Saturado:
+        duplicados_gps.olvidar(fixes)
+        return _saturado()
+    except Exception:
+        duplicados_gps.olvidar(fixes)
+        return _error_interno("Error al recibir un lote GPS")
+
+    return JsonResponse({
+        'status': 'success', 'aceptados': len(fixes), 'duplicados': duplicados, 'rechazados': rechazados,
+    }, status=202)
+
+
+# --- API CICLO DE VIAJES (app del conductor, ver PanelAdmin/ciclo_recorridos.py) ---
+# Inicio, puntos de control y término con claves de la app: los reintentos y los
+# envíos offline en desorden se aplican una sola vez, cada envío en una transacción.
+@_sin_csrf
+async def api_eventos_recorrido(request):
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+    # Abre y cierra viajes: siempre con token, aunque DISPOSITIVOS_REQUIERE_TOKEN esté desactivado para los GPS
+    dispositivo = await dispositivos.autenticar_async(request)
+    if dispositivo is None:
+        return JsonResponse({'status': 'error', 'message': 'Token de dispositivo inválido'}, status=401)
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'status': 'error', 'message': 'JSON inválido'}, status=400)
+
+    lote = data.get('eventos') if isinstance(data, dict) else data
+    if not isinstance(lote, list):
+        return JsonResponse({'status': 'error', 'message': 'Se esperaba una lista de eventos'}, status=400)
+    if len(lote) > settings.RECORRIDOS_LOTE_MAX_EVENTOS:
+        return JsonResponse({
+            'status': 'error', 'message': f'Máximo {settings.RECORRIDOS_LOTE_MAX_EVENTOS} eventos por envío',
+        }, status=413)
+    # Misma cuota que los fixes: cada evento cuenta, también los que se rechacen después
+    rechazo = _limite_gps(request, dispositivo, len(lote))
+    if rechazo:
+        return rechazo
+
+    eventos, rechazados = [], []
+    for indice, dato in enumerate(lote):
+        try:
+            if not isinstance(dato, dict):
+                raise ValueError("Formato inválido")
+            evento = ciclo_recorridos.parsear_evento(dato, patente=dispositivo.patente)
+            evento.indice = indice
+            eventos.append(evento)
+        except ValueError as e:
+            rechazados.append({'indice': indice, 'message': str(e)})
+
+    try:
+        resultado = await pool_bd.ejecutar(ciclo_recorridos.aplicar, eventos, dispositivo)
+    except Saturado:
+        return _saturado()
+    except ciclo_recorridos.Conflicto:
+        response = JsonResponse({'status': 'error', 'message': 'Los eventos se están guardando en otro envío, reintente'}, status=409)
+        response['Retry-After'] = '1'
+        return response
+    except Exception:
+        return _error_interno("Error al aplicar eventos de recorrido")
+    buffer_gps.agregar_historial(resultado.fixes)
+
+    # Aplicados, pendientes y duplicados ya quedaron guardados: la app puede borrarlos de su cola
+    return JsonResponse({
+        'status': 'success', 'aplicados': resultado.aplicados, 'pendientes': resultado.pendientes,
+        'duplicados': resultado.duplicados, 'recorridos': resultado.recorridos,
+        'rechazados': sorted(rechazados + resultado.rechazados, key=lambda r: r['indice']),
+    }, status=200)
+
+
+# --- DESPACHO (asignación de conductores y entregas, ver PanelAdmin/despacho.py) ---
+def _lista_json(request, clave):
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        raise ValueError("JSON inválido")
+    lista = data.get(clave) if isinstance(data, dict) else data
+    if not isinstance(lista, list):
+        raise ValueError(f"Se esperaba una lista de {clave}")
+    return lista
+
+@login_required
+@presupuesto_consultas(6)
+def api_despacho(request):
+    # Propuesta conductor -> vehículo para los libres; el panel la revisa y la envía a api_despacho_aplicar
+    return JsonResponse({'status': 'success', **despacho.proponer_conductores()})
+
+@login_required
+@presupuesto_consultas(10)  # bulk_update en lotes: uno en MySQL hasta 1000 vehículos, ~350 filas por lote en SQLite
+def api_despacho_aplicar(request):
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+    try:
+        asignaciones = []
+        for dato in _lista_json(request, 'asignaciones'):
+            if not isinstance(dato, dict):
+                raise ValueError("Formato inválido")
+            conductor = dato.get('conductor')
+            asignaciones.append((int(dato['vehiculo']), None if conductor is None else int(conductor)))
+        desvinculados = despacho.aplicar(asignaciones)
+    except (KeyError, TypeError, ValueError) as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    return JsonResponse({'status': 'success', 'asignados': len(asignaciones), 'desvinculados': desvinculados})
+
+@login_required
+@presupuesto_consultas(6)
+def api_despacho_entregas(request):
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+    try:
+        entregas = []
+        for indice, dato in enumerate(_lista_json(request, 'entregas')):
+            if not isinstance(dato, dict):
+                raise ValueError(f"Entrega {indice}: formato inválido")
             try:
-                data = json.loads(request.body)
-            except json.JSONDecodeError:
-                data = request.POST
-            
-            patente_app = data.get('patente')
-            latitud_app = data.get('latitud')
-            longitud_app = data.get('longitud')
-            
-            if not patente_app:
-                return JsonResponse({'status': 'error', 'message': 'Falta patente'}, status=400)
-            
-            vehiculo = Vehiculo.objects.get(patente=patente_app)
-            vehiculo.latitud = latitud_app
-            vehiculo.longitud = longitud_app
-            vehiculo.save()
-            
-            return JsonResponse({'status': 'success', 'message': 'Ubicación actualizada'}, status=200)
-        except Vehiculo.DoesNotExist:
-            return JsonResponse({'status': 'error', 'message': 'Patente no encontrada'}, status=404)
-        except Exception as e:
-            return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+                latitud, longitud = parsear_posicion(dato)
+            except ValueError as e:
+                raise ValueError(f"Entrega {indice}: {e}")
+            entregas.append({'id': dato.get('id', indice), 'latitud': latitud, 'longitud': longitud})
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    if len(entregas) > settings.DESPACHO_MAX_ENTREGAS:
+        return JsonResponse({'status': 'error', 'message': f'Máximo {settings.DESPACHO_MAX_ENTREGAS} entregas'}, status=413)
+    return JsonResponse({'status': 'success', 'entregas': despacho.proponer_entregas(entregas)})
+
+# --- IMPORTACION CSV ---
+PANTALLA_IMPORTACION = {'vehiculos': 'panel_vehiculos', 'conductores': 'panel_conductores', 'cargas': 'panel_combustible'}
 
-    return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
\ No newline at end of file
+@login_required
+def importar_csv(request, tipo):
+    # Sin presupuesto de consultas: son pocas por lote, pero crecen con el tamaño del archivo
+    if tipo not in IMPORTACIONES:
+        return HttpResponse(status=404)
+    archivo = request.FILES.get('archivo')
+    if request.method != "POST" or not archivo:
+        messages.error(request, "Seleccione un archivo CSV.")
+        return redirect(PANTALLA_IMPORTACION[tipo])
+
+    resultado = IMPORTACIONES[tipo](request.user)
+    try:
+        resultado.ejecutar(archivo.file)
+    except (ValueError, UnicodeDecodeError) as e:
+        messages.error(request, f"No se pudo leer el archivo: {e}")
+        return redirect(PANTALLA_IMPORTACION[tipo])
+    except CupoExcedido as e:
+        messages.error(request, f"No se importó ninguna fila. {e}")
+        return redirect(PANTALLA_IMPORTACION[tipo])
+    except IntegrityError:
+        # Otro admin (o la app) creó los mismos datos entre la validación y el insert: no se importó nada
+        desde, hasta = resultado.lineas_lote
+        messages.error(
+            request, f"No se importó ninguna fila: entre las líneas {desde} y {hasta} hay datos que se "
+                     "registraron mientras se importaba el archivo. Vuelva a subirlo para ver el detalle.",
+        )
+        return redirect(PANTALLA_IMPORTACION[tipo])
+
+    messages.success(request, f"{resultado.creados} filas importadas.")
+    for linea, mensaje in resultado.errores[:10]:
+        messages.error(request, f"Línea {linea}: {mensaje}")
+    if len(resultado.errores) > 10:
+        messages.warning(request, f"... y {len(resultado.errores) - 10} filas más con errores.")
+    return redirect(PANTALLA_IMPORTACION[tipo])
+
+# --- API HISTORIAL DE POSICIONES ---
+def _puntos_json(puntos):
+    return [{'ts': ts.isoformat(), 'latitud': lat, 'longitud': lon} for ts, lat, lon in puntos]
+
+@login_required
+@presupuesto_consultas(5)
+def api_trayecto_vehiculo(request, id):
+    vehiculo = get_object_or_404(Vehiculo, id_vehiculo=id)
+    desde = parse_datetime(request.GET.get('desde') or '')
+    hasta = parse_datetime(request.GET.get('hasta') or '') or timezone.now()
+    if desde is None:
+        return JsonResponse({'status': 'error', 'message': 'Parámetro desde inválido'}, status=400)
+    if timezone.is_naive(desde): desde = timezone.make_aware(desde)
+    if timezone.is_naive(hasta): hasta = timezone.make_aware(hasta)
+
+    puntos = trayecto(vehiculo.id_vehiculo, desde, hasta)
+    return JsonResponse({'patente': vehiculo.patente, 'puntos': _puntos_json(puntos)})
+
+@login_required
+@presupuesto_consultas(5)
+def api_trayecto_recorrido(request, id):
+    recorrido = get_object_or_404(Recorrido, id_recorrido=id)
+    puntos = trayecto_recorrido(recorrido)
+    gps = trayectos.calcular([recorrido])[recorrido.id_recorrido]
+    return JsonResponse({
+        'id_recorrido': recorrido.id_recorrido, 'puntos': _puntos_json(puntos),
+        'km_gps': gps.km, 'descartados': gps.descartados,
+        'paradas': [
+            {'inicio': p.inicio.isoformat(), 'fin': p.fin.isoformat(), 'latitud': p.latitud, 'longitud': p.longitud}
+            for p in gps.paradas
+        ],
+    })
+
+# --- API BUSQUEDA (sugerencias mientras se escribe) ---
+@login_required
+@presupuesto_consultas(8)  # +1 por filas de la app externa sin indexar; +4 si las hay (dos INSERT y la transacción)
+def api_buscar(request):
+    texto = request.GET.get('q', '').strip()
+    if not texto:
+        return JsonResponse({'resultados': []})
+    if request.GET.get('tipo') == 'vehiculos':
+        filas = buscar_vehiculos(texto).order_by('patente')[:10]
+        resultados = [{'id': v.id_vehiculo, 'texto': v.patente, 'detalle': v.modelo} for v in filas]
+    else:
+        filas = buscar_usuarios(texto, no_admin().exclude(id_usuario=1)).order_by('nombre')[:10]
+        resultados = [{'id': u.id_usuario, 'texto': u.nombre, 'detalle': u.rut or u.correo} for u in filas]
+    return JsonResponse({'resultados': resultados})
+
+# --- API ESPACIAL (índice en memoria: no recorre la tabla de vehículos) ---
+def _punto_consulta(request):
+    try:
+        lat, lon = float(request.GET['lat']), float(request.GET['lon'])
+    except (KeyError, ValueError):
+        raise ValueError("Parámetros lat y lon requeridos")
+    if abs(lat) > 90 or abs(lon) > 180:
+        raise ValueError("Coordenadas fuera de rango")
+    return lat, lon
+
+def _poligono_consulta(request):
+    # poligono=lat,lon;lat,lon;lat,lon
+    return espacial.parsear_vertices(request.GET.get('poligono', ''))
+
+def _patentes_en_viaje():
+    # Un vehículo con un recorrido abierto no está disponible para despacho
+    return set(Recorrido.objects.filter(hora_fin__isnull=True).values_list('vehiculo__patente', flat=True))
+
+@login_required
+@presupuesto_consultas(4)  # sesión, usuario, resincronización periódica del índice y viajes abiertos
+def api_vehiculos_cercanos(request):
+    try:
+        lat, lon = _punto_consulta(request)
+        radio = float(request.GET['radio']) if request.GET.get('radio') else None
+        k = min(int(request.GET.get('k') or 10), settings.ESPACIAL_MAX_RESULTADOS)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    excluir = _patentes_en_viaje() if request.GET.get('disponibles') == '1' else set()
+
+    indice = espacial.indice()
+    if radio is not None:
+        resultados = [r for r in indice.en_radio(lat, lon, radio) if r['patente'] not in excluir]
+        resultados = resultados[:settings.ESPACIAL_MAX_RESULTADOS]
+    else:
+        resultados = indice.cercanos(lat, lon, k, excluir=excluir)
+    return JsonResponse({'resultados': resultados})
+
+@login_required
+@presupuesto_consultas(4)
+def api_vehiculos_en_zona(request):
+    try:
+        vertices = _poligono_consulta(request)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    excluir = _patentes_en_viaje() if request.GET.get('disponibles') == '1' else set()
+    resultados = [r for r in espacial.indice().en_poligono(vertices) if r['patente'] not in excluir]
+    return JsonResponse({'total': len(resultados), 'resultados': resultados[:settings.ESPACIAL_MAX_RESULTADOS]})
+
+@login_required
+@presupuesto_consultas(3)
+def api_eventos_zona(request):
+    # Para alertas: el cliente pide los eventos posteriores al último id que vio
+    try:
+        desde = int(request.GET.get('desde') or 0)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Parámetro desde inválido'}, status=400)
+    eventos = list(
+        EventoZona.objects.filter(id__gt=desde).select_related('zona', 'vehiculo')
+        .order_by('id')[:settings.ESPACIAL_MAX_RESULTADOS]
+    )
+    return JsonResponse({
+        'eventos': [{
+            'id': e.id, 'tipo': e.tipo, 'ts': e.ts.isoformat(), 'zona': e.zona.nombre, 'id_zona': e.zona_id,
+            'patente': e.vehiculo.patente, 'latitud': e.latitud, 'longitud': e.longitud, 'id_recorrido': e.recorrido_id,
+        } for e in eventos],
+        'siguiente': eventos[-1].id if eventos else desde,
+    })
+
+# --- API DE LECTURA v1 (JSON con ETag y paginación por cursor; async, la BD en pool_bd) ---
+@presupuesto_consultas(3)
+async def api_v1_listado(request, recurso):
+    if recurso not in api_lectura.RECURSOS:
+        return JsonResponse({'status': 'error', 'message': 'Recurso no encontrado'}, status=404)
+    try:
+        # login_required de Django 4.2 no sirve para vistas async: sesión y usuario se leen en el pool
+        if not await pool_bd.ejecutar(lambda: request.user.is_authenticated):
+            return JsonResponse({'status': 'error', 'message': 'No autenticado'}, status=401)
+        return await pool_bd.ejecutar(api_lectura.responder, request, api_lectura.RECURSOS[recurso])
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    except Saturado:
+        return _saturado()
+
+# --- STREAM DE POSICIONES (SSE, requiere ASGI) ---
+async def stream_posiciones(request):
+    if not stream_disponible(request):
+        # 204: EventSource deja de reconectar en vez de ocupar un worker WSGI por pestaña
+        return HttpResponse(status=204)
+    autenticado = await sync_to_async(lambda: request.user.is_authenticated)()
+    if not autenticado:
+        return JsonResponse({'status': 'error', 'message': 'No autenticado'}, status=401)
+
+    response = StreamingHttpResponse(eventos_posiciones(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+# --- METRICAS ---
+@login_required
+def api_metricas(request):
+    if not request.user.is_staff:
+        return JsonResponse({'status': 'error', 'message': 'No autorizado'}, status=403)
+    return JsonResponse({'vistas': registro_metricas.resumen()})